@@ -0,0 +1,44 @@
+"""
+Сравнение двух json результатов bench.load:
+    python -m bench.compare before.json after.json
+"""
+import argparse
+import json
+from pathlib import Path
+
+METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'cache_hit_ratio')
+
+
+def diff(before: dict, after: dict) -> dict:
+    rows = {}
+    names = [*before['endpoints'], *(name for name in after['endpoints'] if name not in before['endpoints'])]
+    for name in [*names, 'total']:
+        old = before['total'] if name == 'total' else before['endpoints'].get(name, {})
+        new = after['total'] if name == 'total' else after['endpoints'].get(name, {})
+        rows[name] = {}
+        for metric in METRICS:
+            a, b = old.get(metric), new.get(metric)
+            if a is None and b is None:
+                continue
+            change = round((b - a) / a * 100, 2) if a and b is not None else None
+            rows[name][metric] = {'before': a, 'after': b, 'change_pct': change}
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение двух прогонов bench.load')
+    parser.add_argument('before', type=Path)
+    parser.add_argument('after', type=Path)
+    args = parser.parse_args()
+
+    rows = diff(json.loads(args.before.read_text()), json.loads(args.after.read_text()))
+
+    print(f"{'endpoint':<12}{'metric':<18}{'before':>12}{'after':>12}{'change':>10}")
+    for name, metrics in rows.items():
+        for metric, values in metrics.items():
+            change = '' if values['change_pct'] is None else f"{values['change_pct']:+.1f}%"
+            print(f"{name:<12}{metric:<18}{values['before'] or 0:>12}{values['after'] or 0:>12}{change:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Генератор больших синтетических наборов subjects через asyncpg COPY.
+
+    python -m bench.datagen --rows 1000000 --days 180 --deleted-fraction 0.3 --truncate
+    python -m bench.datagen --rows 50000 --weight normal:40,15 --length uniform:10,300
+
+Из кода (тесты, бенчмарки):
+    await fill_subjects(asyncpg_connection, DatasetSpec(rows=10_000))
+    await fill_subjects_with_session(session, DatasetSpec(rows=10_000))
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Iterator
+
+import asyncpg
+
+COLUMNS = ('length', 'weight', 'is_active', 'create_at', 'update_at', 'delete_at')
+
+# Доля созданий по часам суток и дням недели, основная работа днём в будни
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 12, 12, 11, 10, 8, 10, 11, 11, 10, 8, 5, 3, 2, 2, 1, 1]
+WEEKDAY_WEIGHTS = [10, 10, 10, 10, 9, 4, 2]
+
+
+class Distribution:
+    """
+    Распределение из строки вида name:arg1,arg2
+    uniform:low,high | normal:mu,sigma | lognormal:mu,sigma | exponential:mean | constant:value
+    """
+
+    def __init__(self, spec: str, minimum: float = 0.01):
+        self.spec = spec
+        self.minimum = minimum
+        name, _, raw_args = spec.partition(':')
+        args = [float(arg) for arg in raw_args.split(',') if arg]
+        self.sampler = self._make_sampler(name, args)
+
+    @staticmethod
+    def _make_sampler(name: str, args: list[float]) -> Callable[[random.Random], float]:
+        if name == 'uniform' and len(args) == 2:
+            return lambda rng: rng.uniform(args[0], args[1])
+        if name == 'normal' and len(args) == 2:
+            return lambda rng: rng.gauss(args[0], args[1])
+        if name == 'lognormal' and len(args) == 2:
+            return lambda rng: rng.lognormvariate(args[0], args[1])
+        if name == 'exponential' and len(args) == 1:
+            return lambda rng: rng.expovariate(1 / args[0])
+        if name == 'constant' and len(args) == 1:
+            return lambda rng: args[0]
+        raise ValueError(f'Неизвестное распределение {name}:{",".join(map(str, args))}')
+
+    def sample(self, rng: random.Random) -> float:
+        return max(self.minimum, round(self.sampler(rng), 2))
+
+    def __repr__(self):
+        return self.spec
+
+
+@dataclass
+class DatasetSpec:
+    rows: int = 100_000
+    days: int = 180
+    end: datetime | None = None
+    deleted_fraction: float = 0.3
+    weight: Distribution = field(default_factory=lambda: Distribution('lognormal:3.5,0.8'))
+    length: Distribution = field(default_factory=lambda: Distribution('uniform:5,500'))
+    storage_days: Distribution = field(default_factory=lambda: Distribution('exponential:14', minimum=0.001))
+    seed: int = 42
+    batch_size: int = 50_000
+
+
+def generate_records(spec: DatasetSpec) -> Iterator[list[tuple]]:
+    """Строки в порядке COLUMNS, пачками по batch_size"""
+    rng = random.Random(spec.seed)
+    end = spec.end or datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=spec.days)
+
+    day_weights = [WEEKDAY_WEIGHTS[(start + timedelta(days=day)).weekday()] for day in range(spec.days)]
+    day_cum = list(_cumulative(day_weights))
+    hour_cum = list(_cumulative(HOUR_WEIGHTS))
+
+    batch = []
+    for _ in range(spec.rows):
+        day = rng.choices(range(spec.days), cum_weights=day_cum)[0]
+        hour = rng.choices(range(24), cum_weights=hour_cum)[0]
+        create_at = start + timedelta(days=day, hours=hour, seconds=rng.randrange(3600))
+
+        delete_at = None
+        if rng.random() < spec.deleted_fraction:
+            stored = timedelta(days=spec.storage_days.sample(rng))
+            if create_at + stored >= end:
+                # Не уходим в будущее, но и не копим всё в последнюю секунду периода
+                stored = timedelta(seconds=rng.uniform(0, (end - create_at).total_seconds()))
+            delete_at = create_at + stored
+
+        batch.append((
+            spec.length.sample(rng),
+            spec.weight.sample(rng),
+            delete_at is None,
+            create_at,
+            delete_at or create_at,
+            delete_at,
+        ))
+        if len(batch) >= spec.batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def _cumulative(weights: list[float]) -> Iterator[float]:
+    total = 0.0
+    for weight in weights:
+        total += weight
+        yield total
+
+
+async def fill_subjects(conn: asyncpg.Connection, spec: DatasetSpec, truncate: bool = False,
+                        analyze: bool = True) -> int:
+    """Заливает subjects через COPY, работает в текущей транзакции соединения, если она есть"""
+    if truncate:
+        await conn.execute('TRUNCATE subjects RESTART IDENTITY')
+
+    inserted = 0
+    for batch in generate_records(spec):
+        await conn.copy_records_to_table('subjects', records=batch, columns=COLUMNS)
+        inserted += len(batch)
+
+    if analyze:
+        await conn.execute('ANALYZE subjects')
+    return inserted
+
+
+async def fill_subjects_with_session(session, spec: DatasetSpec, truncate: bool = False) -> int:
+    """То же самое через AsyncSession/AsyncConnection sqlalchemy, в её транзакции"""
+    connection = await session.connection() if hasattr(session, 'sync_session') else session
+    raw = await connection.get_raw_connection()
+    # ANALYZE нельзя откатить вместе с тестовой транзакцией, поэтому здесь без него
+    return await fill_subjects(raw.driver_connection, spec, truncate=truncate, analyze=False)
+
+
+def dsn_from_settings() -> str:
+    from src.config import settings
+
+    return settings.DATABASE_URL.replace('postgresql+asyncpg://', 'postgresql://')
+
+
+async def run(args):
+    spec = DatasetSpec(
+        rows=args.rows,
+        days=args.days,
+        deleted_fraction=args.deleted_fraction,
+        weight=Distribution(args.weight),
+        length=Distribution(args.length),
+        storage_days=Distribution(args.storage_days, minimum=0.001),
+        seed=args.seed,
+        batch_size=args.batch_size,
+    )
+    conn = await asyncpg.connect(args.dsn or dsn_from_settings())
+    try:
+        started = time.perf_counter()
+        inserted = await fill_subjects(conn, spec, truncate=args.truncate)
+        elapsed = time.perf_counter() - started
+    finally:
+        await conn.close()
+
+    print(f'Вставлено {inserted} строк за {elapsed:.1f} с ({inserted / elapsed:,.0f} строк/с)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заполнение subjects синтетическими данными')
+    parser.add_argument('--dsn', help='postgresql://..., по умолчанию бд из .env')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=180, help='Длина истории до текущего момента')
+    parser.add_argument('--deleted-fraction', type=float, default=0.3)
+    parser.add_argument('--weight', default='lognormal:3.5,0.8')
+    parser.add_argument('--length', default='uniform:5,500')
+    parser.add_argument('--storage-days', default='exponential:14', help='Сколько дней лежит удаляемый объект')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    parser.add_argument('--truncate', action='store_true', help='Очистить таблицу перед заливкой')
+    args = parser.parse_args()
+
+    if not math.isfinite(args.deleted_fraction) or not 0 <= args.deleted_fraction <= 1:
+        parser.error('--deleted-fraction должен быть от 0 до 1')
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
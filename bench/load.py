@@ -0,0 +1,281 @@
+"""
+Нагрузочный прогон сервиса.
+
+Запуск против приложения в том же процессе (нужны бд и редис из .env):
+    python -m bench.load --duration 30 --concurrency 32 --output bench/results/run.json
+
+Запуск против поднятого сервиса:
+    python -m bench.load --url http://127.0.0.1:8000 --duration 30
+
+Сравнить два прогона:
+    python -m bench.compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+DEFAULT_MIX = {
+    'create': 15,
+    'delete': 5,
+    'get': 35,
+    'list': 35,
+    'statistics': 10,
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: dict[int, int] = field(default_factory=dict)
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    def add(self, latency: float, response: httpx.Response | None):
+        self.latencies.append(latency)
+        if response is None:
+            self.errors += 1
+            return
+
+        self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+        if response.status_code >= 500:
+            self.errors += 1
+
+        cache = response.headers.get('X-Cache')
+        if cache == 'HIT':
+            self.cache_hits += 1
+        elif cache == 'MISS':
+            self.cache_misses += 1
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        result = {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'statuses': {str(code): count for code, count in sorted(self.statuses.items())},
+            'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        }
+        for p in PERCENTILES:
+            result[f'p{p}_ms'] = round(percentile(latencies, p) * 1000, 3) if latencies else None
+        if self.cache_hits or self.cache_misses:
+            result['cache_hit_ratio'] = round(self.cache_hits / (self.cache_hits + self.cache_misses), 4)
+        return result
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Перцентиль с линейной интерполяцией по отсортированному списку"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'Неизвестный вызов {name}, доступны: {", ".join(DEFAULT_MIX)}')
+        mix[name] = int(weight)
+    return mix
+
+
+class LoadRunner:
+    """Набор сценариев, похожих на реальный трафик: сканеры создают и удаляют, остальные читают"""
+
+    def __init__(self, client: httpx.AsyncClient, mix: dict[str, int], rng: random.Random):
+        self.client = client
+        self.rng = rng
+        self.names = [name for name, weight in mix.items() if weight > 0]
+        self.weights = [mix[name] for name in self.names]
+        self.stats = {name: EndpointStats() for name in self.names}
+        self.known_ids: list[int] = []
+        self.today = datetime.now(timezone.utc).date()
+        self.scenarios = {
+            'create': self.create,
+            'delete': self.delete,
+            'get': self.get_by_id,
+            'list': self.list_filtered,
+            'statistics': self.statistics,
+        }
+
+    async def seed(self, count: int):
+        for _ in range(count):
+            await self.create()
+
+    def random_filters(self) -> dict:
+        choice = self.rng.randrange(6)
+        if choice == 0:
+            return {}
+        if choice == 1:
+            low = self.rng.choice([1, 10, 50, 100])
+            return {'weight_min': low, 'weight_max': low * 10}
+        if choice == 2:
+            return {'is_active': self.rng.choice(['true', 'false'])}
+        if choice == 3:
+            return {'length_min': self.rng.choice([1, 50, 200])}
+        if choice == 4:
+            return {'created_after': (self.today - timedelta(days=self.rng.randrange(30))).isoformat()}
+        return {'weight_min': self.rng.choice([1, 10]), 'is_active': 'true'}
+
+    def random_period(self) -> dict:
+        days = self.rng.choice([1, 7, 30, 90])
+        start = self.today - timedelta(days=days)
+        return {'start_date': datetime.combine(start, datetime.min.time()).isoformat(),
+                'end_date': datetime.combine(self.today, datetime.min.time()).isoformat()}
+
+    async def create(self) -> httpx.Response:
+        response = await self.client.post('/api/subjects', json={
+            'length': round(self.rng.uniform(1, 500), 2),
+            'weight': round(self.rng.lognormvariate(3, 1) + 0.1, 2),
+        })
+        if response.status_code == 201:
+            self.known_ids.append(response.json()['id'])
+        return response
+
+    async def delete(self) -> httpx.Response:
+        if not self.known_ids:
+            return await self.create()
+        subject_id = self.known_ids.pop(self.rng.randrange(len(self.known_ids)))
+        return await self.client.delete(f'/api/subjects/{subject_id}')
+
+    async def get_by_id(self) -> httpx.Response:
+        subject_id = self.rng.choice(self.known_ids) if self.known_ids else 1
+        return await self.client.get(f'/api/subjects/{subject_id}')
+
+    async def list_filtered(self) -> httpx.Response:
+        return await self.client.get('/api/subjects', params=self.random_filters())
+
+    async def statistics(self) -> httpx.Response:
+        return await self.client.get('/api/subjects/statistics', params=self.random_period())
+
+    async def call(self, record: bool = True):
+        name = self.rng.choices(self.names, self.weights)[0]
+        started = time.perf_counter()
+        try:
+            response = await self.scenarios[name]()
+        except httpx.HTTPError:
+            response = None
+        if record:
+            self.stats[name].add(time.perf_counter() - started, response)
+
+    async def worker(self, deadline: float, counter: list[int], limit: int | None, record: bool):
+        while time.perf_counter() < deadline:
+            if limit is not None:
+                if counter[0] >= limit:
+                    return
+                counter[0] += 1
+            await self.call(record)
+
+    async def run(self, concurrency: int, duration: float, limit: int | None, record: bool = True) -> float:
+        counter = [0]
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self.worker(deadline, counter, limit, record) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+@asynccontextmanager
+async def make_client(url: str | None, timeout: float):
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+            yield client
+        return
+
+    from src.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=timeout) as client:
+            yield client
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    mix = args.mix or DEFAULT_MIX
+
+    async with make_client(args.url, args.timeout) as client:
+        runner = LoadRunner(client, mix, rng)
+        await runner.seed(args.seed_subjects)
+
+        if args.warmup:
+            await runner.run(args.concurrency, args.warmup, None, record=False)
+
+        elapsed = await runner.run(args.concurrency, args.duration, args.requests)
+
+    endpoints = {name: stats.summary(elapsed) for name, stats in runner.stats.items()}
+    all_latencies = EndpointStats()
+    for stats in runner.stats.values():
+        all_latencies.latencies.extend(stats.latencies)
+        all_latencies.errors += stats.errors
+        all_latencies.cache_hits += stats.cache_hits
+        all_latencies.cache_misses += stats.cache_misses
+
+    return {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'target': args.url or 'in-process',
+            'concurrency': args.concurrency,
+            'duration_s': round(elapsed, 3),
+            'mix': mix,
+            'seed': args.seed,
+            'python': platform.python_version(),
+        },
+        'total': all_latencies.summary(elapsed),
+        'endpoints': endpoints,
+    }
+
+
+def print_report(result: dict):
+    meta = result['meta']
+    print(f"target={meta['target']} concurrency={meta['concurrency']} duration={meta['duration_s']}s")
+    header = f"{'endpoint':<12}{'req':>8}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'hit':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, row in [*result['endpoints'].items(), ('TOTAL', result['total'])]:
+        hit = row.get('cache_hit_ratio')
+        print(f"{name:<12}{row['requests']:>8}{row['errors']:>6}{row['throughput_rps']:>10}"
+              f"{row['p50_ms'] or 0:>10.2f}{row['p95_ms'] or 0:>10.2f}{row['p99_ms'] or 0:>10.2f}"
+              f"{'' if hit is None else f'{hit:.1%}':>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон API subjects')
+    parser.add_argument('--url', help='Адрес сервиса, без него приложение поднимается в процессе')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='Длительность замера, секунды')
+    parser.add_argument('--requests', type=int, help='Остановиться после стольких запросов')
+    parser.add_argument('--warmup', type=float, default=3, help='Прогрев без записи результатов, секунды')
+    parser.add_argument('--mix', type=parse_mix, help='Веса вызовов, например create=10,get=50,list=40')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--seed-subjects', type=int, default=50, help='Сколько subjects создать перед замером')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--output', type=Path, help='Куда сохранить json с результатами')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+        print(f'Результаты сохранены в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""
+Микро-бенчмарки горячих функций: фильтры, валидация и кодирование ответов, кеш в редисе, статистика.
+
+    python -m bench.micro                                   # все группы
+    python -m bench.micro --only filters,validate --save bench/results/micro_base.json
+    python -m bench.micro --compare bench/results/micro_base.json --fail-on-regression 10
+    python -m bench.micro --only redis --redis fake          # fakeredis вместо локального редиса
+
+Для группы stats нужна бд из .env, размер выборки выводится в имени бенчмарка.
+С --stats-rows 10000,1000000 таблица перед каждым размером очищается и заполняется bench.datagen.
+"""
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import statistics
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+GROUPS = ('filters', 'validate', 'redis', 'stats')
+
+
+@dataclass
+class Result:
+    name: str
+    number: int
+    repeats: int
+    best_us: float
+    median_us: float
+    stdev_us: float
+
+    def as_dict(self) -> dict:
+        return self.__dict__.copy()
+
+
+class Timer:
+    """
+    Прогрев, подбор числа вызовов на замер так, чтобы замер длился не меньше min_time,
+    и несколько замеров, из которых берётся минимум и медиана на один вызов
+    """
+
+    def __init__(self, min_time: float = 0.2, repeats: int = 7, warmup: int = 3):
+        self.min_time = min_time
+        self.repeats = repeats
+        self.warmup = warmup
+
+    @staticmethod
+    async def _run(fn: Callable[[], Any], number: int, is_async: bool) -> float:
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            if is_async:
+                for _ in range(number):
+                    await fn()
+            else:
+                for _ in range(number):
+                    fn()
+            return time.perf_counter() - started
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    async def measure(self, name: str, fn: Callable[[], Any | Awaitable[Any]], number: int | None = None) -> Result:
+        # lambda над корутиной тоже считается асинхронной
+        first = fn()
+        is_async = inspect.isawaitable(first)
+        if is_async:
+            await first
+
+        for _ in range(self.warmup):
+            await self._run(fn, 1, is_async)
+
+        if number is None:
+            number = 1
+            while True:
+                elapsed = await self._run(fn, number, is_async)
+                if elapsed >= self.min_time or number >= 1_000_000:
+                    break
+                number *= 10 if elapsed < self.min_time / 10 else 2
+
+        timings = [await self._run(fn, number, is_async) / number * 1e6 for _ in range(self.repeats)]
+        return Result(
+            name=name,
+            number=number,
+            repeats=self.repeats,
+            best_us=round(min(timings), 3),
+            median_us=round(statistics.median(timings), 3),
+            stdev_us=round(statistics.stdev(timings), 3) if len(timings) > 1 else 0.0,
+        )
+
+
+FULL_FILTERS = {
+    'id_min': 1, 'id_max': 100000,
+    'weight_min': 10, 'weight_max': 1000,
+    'length_min': 5, 'length_max': 500,
+    'is_active': True,
+    'created_after': date(2026, 1, 1), 'created_before': date(2026, 12, 31),
+    'deleted_after': None, 'deleted_before': None,
+}
+
+
+def make_dict_rows(count: int) -> list[dict]:
+    """Строки в том виде, в котором их отдаёт subjects_manager.get_with_filters"""
+    created = datetime(2026, 1, 1)
+    return [
+        {'length': 10.5 + i % 300, 'weight': 1.25 + i % 1000, 'id': i, 'is_active': i % 5 != 0,
+         'create_at': created + timedelta(minutes=i),
+         'delete_at': None if i % 5 else created + timedelta(minutes=i, days=3)}
+        for i in range(1, count + 1)
+    ]
+
+
+def make_rows(count: int) -> list:
+    from src.models import SubjectsORM
+
+    return [SubjectsORM(**row) for row in make_dict_rows(count)]
+
+
+async def bench_filters(timer: Timer) -> list[Result]:
+    from src.models import SubjectsORM
+    from src.utils.filters_db import build_filters, serialize_filters
+    from src.utils.key_redis import create_key_filters
+
+    return [
+        await timer.measure('filters.build_filters[full]', lambda: build_filters(SubjectsORM, **FULL_FILTERS)),
+        await timer.measure('filters.build_filters[empty]', lambda: build_filters(SubjectsORM)),
+        await timer.measure('filters.serialize_filters[full]', lambda: serialize_filters(dict(FULL_FILTERS))),
+        await timer.measure('filters.create_key_filters[full]', lambda: create_key_filters(FULL_FILTERS)),
+    ]
+
+
+async def bench_validate(timer: Timer, sizes: list[int]) -> list[Result]:
+    from fastapi.encoders import jsonable_encoder
+
+    from src.schemes.subjects import ReadSubjects
+    from src.utils import codec
+
+    results = []
+    for size in sizes:
+        rows = make_rows(size)
+        dict_rows = make_dict_rows(size)
+        items = [ReadSubjects.model_validate(row, from_attributes=True) for row in rows]
+        results.append(await timer.measure(
+            f'validate.ReadSubjects.model_validate[{size}]',
+            lambda rows=rows: [ReadSubjects.model_validate(row, from_attributes=True) for row in rows],
+        ))
+        # Старый путь ответа: jsonable_encoder и json из стандартной библиотеки
+        results.append(await timer.measure(
+            f'validate.jsonable_encoder+json.dumps[{size}]',
+            lambda items=items: json.dumps(jsonable_encoder(items)).encode(),
+        ))
+        results.append(await timer.measure(
+            f'validate.codec.dumps[{size}]',
+            lambda dict_rows=dict_rows: codec.dumps(dict_rows),
+        ))
+    return results
+
+
+async def bench_redis(timer: Timer, sizes: list[int], backend: str) -> list[Result]:
+    from src.service.redisManager import redis_manager
+    from src.service.redis_conn import redis_client
+    from src.utils import codec
+
+    if backend == 'fake':
+        import fakeredis
+
+        redis_client.redis = fakeredis.FakeAsyncRedis()
+    else:
+        await redis_client.connect()
+
+    results = []
+    try:
+        for size in sizes:
+            rows = make_dict_rows(size)
+            key = f'bench:{size}'
+            await redis_manager.set_subject_with_filters(key, codec.dumps(rows), 'bench')
+
+            # Кодирование входит в замер, как и в роутере
+            results.append(await timer.measure(
+                f'redis.set_subject_with_filters[{size}]',
+                lambda key=key, rows=rows: redis_manager.set_subject_with_filters(key, codec.dumps(rows), 'bench'),
+            ))
+            results.append(await timer.measure(
+                f'redis.get_subject_with_filters[{size}]',
+                lambda key=key: redis_manager.get_subject_with_filters(key, 'bench'),
+            ))
+
+        r = await redis_client.get_redis()
+
+        async def invalidate():
+            await r.mset({f'subject:bench:{i}': '1' for i in range(100)})
+            await redis_manager.delete_subject_with_filters('bench')
+
+        results.append(await timer.measure('redis.delete_subject_with_filters[100 keys]', invalidate))
+    finally:
+        await redis_client.close()
+    return results
+
+
+async def bench_stats(timer: Timer, dataset_rows: list[int] | None) -> list[Result]:
+    from sqlalchemy import func, select, text
+
+    from bench.datagen import DatasetSpec, fill_subjects_with_session
+    from src.db.connection import async_session_maker, engine
+    from src.db.subjectsManager import subjects_manager
+    from src.models import SubjectsORM
+
+    results = []
+    try:
+        # Без --stats-rows меряем на том, что уже лежит в бд
+        for size in dataset_rows or [None]:
+            async with async_session_maker() as session:
+                if size is not None:
+                    await fill_subjects_with_session(session, DatasetSpec(rows=size), truncate=True)
+                    await session.commit()
+                    await session.execute(text('ANALYZE subjects'))
+
+                rows = (await session.execute(select(func.count(SubjectsORM.id)))).scalar()
+                first = (await session.execute(select(func.min(SubjectsORM.create_at)))).scalar()
+                last = (await session.execute(select(func.max(SubjectsORM.create_at)))).scalar()
+
+                if not rows:
+                    print('stats: таблица subjects пустая, пропускаем')
+                    continue
+
+                async def full_period():
+                    await subjects_manager.get_subjects_statistics(session, first, last, 'bench')
+
+                async def last_week():
+                    await subjects_manager.get_subjects_statistics(session, last - timedelta(days=7), last, 'bench')
+
+                results.append(await timer.measure(f'stats.get_subjects_statistics[{rows} rows, full]',
+                                                   full_period))
+                results.append(await timer.measure(f'stats.get_subjects_statistics[{rows} rows, 7 days]',
+                                                   last_week))
+    finally:
+        await engine.dispose()
+    return results
+
+
+def compare(results: list[Result], baseline: dict, threshold: float) -> list[str]:
+    base = {item['name']: item for item in baseline['results']}
+    regressions = []
+    print(f"\n{'benchmark':<58}{'base us':>14}{'now us':>14}{'change':>10}")
+    for result in results:
+        old = base.get(result.name)
+        if old is None:
+            print(f'{result.name:<58}{"-":>14}{result.median_us:>14.3f}{"new":>10}')
+            continue
+        change = (result.median_us - old['median_us']) / old['median_us'] * 100
+        mark = ''
+        if change > threshold:
+            mark = '  <-- регрессия'
+            regressions.append(result.name)
+        print(f'{result.name:<58}{old["median_us"]:>14.3f}{result.median_us:>14.3f}{change:>+9.1f}%{mark}')
+    return regressions
+
+
+async def run(args) -> list[Result]:
+    timer = Timer(min_time=args.min_time, repeats=args.repeats, warmup=args.warmup)
+    groups = args.only or GROUPS
+    results = []
+
+    if 'filters' in groups:
+        results += await bench_filters(timer)
+    if 'validate' in groups:
+        results += await bench_validate(timer, args.sizes)
+    if 'redis' in groups:
+        results += await bench_redis(timer, args.sizes, args.redis)
+    if 'stats' in groups:
+        results += await bench_stats(timer, args.stats_rows)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Микро-бенчмарки горячих функций')
+    parser.add_argument('--only', type=lambda value: [g for g in value.split(',') if g],
+                        help=f'Группы через запятую: {",".join(GROUPS)}')
+    parser.add_argument('--sizes', type=lambda value: [int(v) for v in value.split(',')], default=[100, 10000],
+                        help='Количество строк для validate и redis')
+    parser.add_argument('--redis', choices=('real', 'fake'), default='real')
+    parser.add_argument('--stats-rows', type=lambda value: [int(v) for v in value.split(',')],
+                        help='Перед stats заливать столько строк через bench.datagen, например 10000,1000000. '
+                             'Очищает таблицу subjects!')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Минимальная длительность одного замера, с')
+    parser.add_argument('--repeats', type=int, default=7)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--save', type=Path, help='Сохранить результаты как базовую линию')
+    parser.add_argument('--compare', type=Path, help='Сравнить с сохранённой базовой линией')
+    parser.add_argument('--fail-on-regression', type=float, metavar='PCT',
+                        help='Код выхода 1, если медиана выросла больше чем на PCT процентов')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(f"{'benchmark':<58}{'number':>10}{'best us':>14}{'median us':>14}{'stdev us':>12}")
+    for result in results:
+        print(f'{result.name:<58}{result.number:>10}{result.best_us:>14.3f}'
+              f'{result.median_us:>14.3f}{result.stdev_us:>12.3f}')
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps({
+            'created_at': datetime.now().isoformat(),
+            'results': [result.as_dict() for result in results],
+        }, indent=2))
+        print(f'Базовая линия сохранена в {args.save}')
+
+    if args.compare:
+        threshold = args.fail_on_regression if args.fail_on_regression is not None else 10
+        regressions = compare(results, json.loads(args.compare.read_text()), threshold)
+        if regressions and args.fail_on_regression is not None:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Время холодного старта воркера: импорт приложения и стартовый lifespan, каждый прогон в новом процессе.
+
+    python -m bench.startup --runs 5
+    python -m bench.startup --runs 10 --output bench/results/startup.json
+
+Подробно по модулям импорта: python -X importtime -c "import src.main" 2> importtime.log
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+from src.main import app
+from src.utils.startup import startup_stats
+imported = time.perf_counter() - started
+
+async def main():
+    async with app.router.lifespan_context(app):
+        pass
+
+asyncio.run(main())
+print(json.dumps({'process_import_s': imported, **startup_stats}))
+"""
+
+
+def run_once() -> dict:
+    completed = subprocess.run([sys.executable, '-c', CHILD], capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время импорта и старта приложения')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', type=Path, help='Куда сохранить json с результатами')
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    summary = {}
+    for name in ('process_import_s', 'import_s', 'startup_s'):
+        values = [run[name] for run in runs]
+        summary[name] = {'median': round(statistics.median(values), 3), 'max': round(max(values), 3)}
+    for check in runs[0]['checks']:
+        values = [run['checks'][check]['ms'] for run in runs]
+        summary[f'check_{check}_ms'] = {'median': round(statistics.median(values), 1), 'max': max(values)}
+
+    print(f"{'metric':<24}{'median':>10}{'max':>10}")
+    for name, row in summary.items():
+        print(f"{name:<24}{row['median']:>10}{row['max']:>10}")
+    degraded = sorted({item for run in runs for item in run['degraded']})
+    if degraded:
+        print(f'Старт без: {", ".join(degraded)}')
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'summary': summary,
+            'runs': runs,
+        }, ensure_ascii=False, indent=2))
+        print(f'Результаты сохранены в {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,3 @@
 from .subjects import router as subjects_router  # noqa: F401
-
+from .internal import router as internal_router  # noqa: F401
+from .health import router as health_router  # noqa: F401
@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+from starlette import status
+
+from src.service.health import health_checker
+
+router = APIRouter(prefix='/health', tags=["health"])
+
+
+@router.get('/live',
+            status_code=status.HTTP_200_OK,
+            summary="Liveness probe",
+            )
+async def live():
+    return health_checker.live()
+
+
+@router.get('/ready',
+            status_code=status.HTTP_200_OK,
+            summary="Readiness probe",
+            responses={
+                503: {"description": "Database is unavailable"}
+            }
+            )
+async def ready():
+    result = await health_checker.ready()
+    if result['status'] == 'fail':
+        return ORJSONResponse(result, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return result
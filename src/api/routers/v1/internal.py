@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Query
+from starlette import status
+
+from src.db.connection import pool_stats, replica_router, statement_stats
+from src.db.events import event_broker
+from src.db.ingest import ingest_queue
+from src.db.lookup import subject_coalescer
+from src.db.query_log import slow_query_log
+from src.service.admission import admission_limiters
+from src.utils.startup import startup_stats
+
+router = APIRouter(prefix='/internal', tags=["internal"])
+
+
+@router.get('/slow-queries',
+            status_code=status.HTTP_200_OK,
+            summary="Get slow queries",
+            )
+async def get_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    return slow_query_log.get_entries(limit)
+
+
+@router.delete('/slow-queries',
+               status_code=status.HTTP_204_NO_CONTENT,
+               summary="Clear slow queries",
+               )
+async def clear_slow_queries():
+    slow_query_log.clear()
+
+
+@router.get('/replicas',
+            status_code=status.HTTP_200_OK,
+            summary="Get read replicas lag",
+            )
+async def get_replicas():
+    return replica_router.status()
+
+
+@router.get('/pool',
+            status_code=status.HTTP_200_OK,
+            summary="Get connection pool stats",
+            )
+async def get_pool_stats():
+    return [stats.snapshot() for stats in pool_stats.values()]
+
+
+@router.get('/statements',
+            status_code=status.HTTP_200_OK,
+            summary="Get compiled cache and prepared statement hit rates",
+            )
+async def get_statement_stats():
+    return [stats.snapshot() for stats in statement_stats.values()]
+
+
+@router.delete('/statements',
+               status_code=status.HTTP_204_NO_CONTENT,
+               summary="Reset statement cache counters",
+               )
+async def reset_statement_stats():
+    for stats in statement_stats.values():
+        stats.reset()
+
+
+@router.get('/admission',
+            status_code=status.HTTP_200_OK,
+            summary="Get admission control queues and shed counts",
+            )
+async def get_admission_stats():
+    return [limiter.stats() for limiter in admission_limiters.values()]
+
+
+@router.get('/ingest',
+            status_code=status.HTTP_200_OK,
+            summary="Get buffered ingestion stats",
+            )
+async def get_ingest_stats():
+    return ingest_queue.stats()
+
+
+@router.get('/lookup',
+            status_code=status.HTTP_200_OK,
+            summary="Get single get coalescing stats",
+            )
+async def get_lookup_stats():
+    return subject_coalescer.stats()
+
+
+@router.get('/events',
+            status_code=status.HTTP_200_OK,
+            summary="Get change feed stats",
+            )
+async def get_events_stats():
+    return event_broker.stats()
+
+
+@router.get('/startup',
+            status_code=status.HTTP_200_OK,
+            summary="Get worker startup timings",
+            )
+async def get_startup_stats():
+    return startup_stats
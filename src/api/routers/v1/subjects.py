@@ -1,14 +1,31 @@
+import asyncio
 import logging
-from datetime import date, datetime
+import math
+import time
+from datetime import date, datetime, timedelta
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Path, Query, BackgroundTasks
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Path, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from starlette import status
 
+from src.config import settings
+from src.db.events import Subscription, event_broker, format_sse
+from src.db.ingest import ingest_queue
+from src.db.lookup import subject_coalescer
 from src.db.subjectsManager import subjects_manager
 from src.schemes import subjects
-from src.db.connection import get_async_session
-from src.service.redisManager import redis_manager
+from src.db.connection import (LazySession, get_lazy_session, get_lazy_read_session, has_read_primary_cookie,
+                               mark_read_primary, must_read_primary, read_primary_for)
+from src.service.admission import admit
+from src.service.conditional import Validator, check_not_modified
+from src.service.inventory import inventory_reconciler
+from src.service.percentiles import get_percentiles
+from src.service.timeseries import get_timeseries
+from src.service.redisManager import (CACHE_PREFIX, CACHE_TTL_S, DataVersion, cache_variant, cache_version_key,
+                                      redis_manager)
+from src.utils import codec
+from src.utils.compression import ENCODINGS, choose_encoding, compress_async, should_compress
 from src.utils.filters_db import serialize_filters
 from src.utils.key_redis import create_key_filters
 
@@ -16,6 +33,10 @@ router = APIRouter(tags=["subjects"])
 
 router_logger = logging.getLogger('Роутер Subjects')
 
+# Столько после последней записи реплики могут её не иметь: отставание до DB_REPLICA_MAX_LAG_S
+# плюс время до следующей проверки отставания
+REPLICA_CATCH_UP_S = settings.DB_REPLICA_MAX_LAG_S + settings.DB_REPLICA_LAG_CHECK_S
+
 
 def get_request_id(request: Request) -> str:
     try:
@@ -25,6 +46,118 @@ def get_request_id(request: Request) -> str:
         return ''
 
 
+def get_response_encoding(request: Request) -> str | None:
+    if not settings.COMPRESS_ENABLED:
+        return None
+    return choose_encoding(request.headers.get('accept-encoding'))
+
+
+def cached_json_response(body: bytes, encoding: str | None, cache: str | None,
+                         validator: Validator | None = None) -> codec.JSONBytesResponse:
+    """encoding - в какой кодировке body, по ней же считается ETag"""
+    headers = {'Vary': 'Accept-Encoding', **(validator.headers(encoding) if validator is not None else {})}
+    if cache is not None:
+        headers['X-Cache'] = cache
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return codec.JSONBytesResponse(body, headers=headers)
+
+
+async def encoded_json_response(payload: bytes, encoding: str | None,
+                                validator: Validator | None = None) -> codec.JSONBytesResponse:
+    """Ответ мимо кеша, сжатый здесь, а не в CompressionMiddleware, чтобы ETag знал итоговую кодировку"""
+    if encoding is not None and should_compress(len(payload), 'application/json'):
+        return cached_json_response(await compress_async(payload, encoding), encoding, None, validator)
+    return cached_json_response(payload, None, None, validator)
+
+
+async def get_read_version(request: Request, request_id: str) -> DataVersion | None:
+    """
+    Версия данных до чтения из бд: с ней ответ кладётся в кеш и по ней считается ETag.
+    Пока недавняя запись может не дойти до реплик, чтения идут с основной бд
+    """
+    version = await redis_manager.get_data_version(request_id)
+    if version is not None and time.time() - version.written_at < REPLICA_CATCH_UP_S:
+        read_primary_for(request)
+    return version
+
+
+def cache_readable(request: Request, version: DataVersion | None) -> bool:
+    # Клиент после своей записи читает с основной бд мимо общего кеша
+    return version is not None and not has_read_primary_cookie(request)
+
+
+async def read_cache(key: str, version: DataVersion, request_id: str, variant: str | None = None) -> bytes | None:
+    """Значение из кеша, только если оно собрано из текущей версии данных, иначе промах"""
+    version_key = cache_version_key(key)
+    entry = variant or key
+    found = await redis_manager.get_many(CACHE_PREFIX, [version_key, entry], request_id)
+    if found.get(version_key) != str(version.version).encode():
+        return None
+    return found.get(entry)
+
+
+async def write_cache(key: str, variants: dict[str, bytes], version: DataVersion | None, request_id: str):
+    """Значения кладутся вместе с версией данных, из которой собраны"""
+    if version is None:
+        return
+    variants = {**variants, cache_version_key(key): str(version.version).encode()}
+    await redis_manager.set_many(CACHE_PREFIX, variants, request_id, ttl_s=CACHE_TTL_S)
+
+
+async def get_cached_json(request: Request, key: str, encoding: str | None, version: DataVersion | None,
+                          request_id: str, validator: Validator | None = None) -> codec.JSONBytesResponse | None:
+    """Ответ из кеша как есть: сжатая копия лежит рядом, на попадании ничего не сжимается"""
+    if not cache_readable(request, version):
+        return None
+    if encoding is not None:
+        body = await read_cache(key, version, request_id, cache_variant(key, encoding))
+        if body is not None:
+            return cached_json_response(body, encoding, 'HIT', validator)
+
+    # Сжатой копии нет, если ответ меньше порога сжатия
+    body = await read_cache(key, version, request_id)
+    if body:
+        return cached_json_response(body, None, 'HIT', validator)
+    return None
+
+
+async def set_cached_json(key: str, payload: bytes, encoding: str | None, version: DataVersion | None,
+                          request_id: str, validator: Validator | None = None) -> codec.JSONBytesResponse:
+    """Кладёт json и его сжатые копии во всех поддерживаемых кодировках одним пайплайном"""
+    variants = {key: payload}
+    if should_compress(len(payload), 'application/json'):
+        compressed = await asyncio.gather(*(compress_async(payload, name) for name in ENCODINGS))
+        variants.update({cache_variant(key, name): body for name, body in zip(ENCODINGS, compressed)})
+    await write_cache(key, variants, version, request_id)
+
+    variant = cache_variant(key, encoding) if encoding is not None else None
+    if variant in variants:
+        return cached_json_response(variants[variant], encoding, 'MISS', validator)
+    return cached_json_response(payload, None, 'MISS', validator)
+
+
+def count_key(filters: dict, estimate: bool = False) -> str:
+    # Под subject:, запись сбрасывает и счётчики
+    return 'count:' + create_key_filters({**filters, 'estimate': estimate or None})
+
+
+async def get_total_count(request: Request, filters: dict, session: LazySession, version: DataVersion | None,
+                          request_id: str) -> int | None:
+    """Точное число строк по фильтрам из кеша счётчиков или count(*), None - не удалось посчитать"""
+    key = count_key(filters)
+    cached = await read_cache(key, version, request_id) if cache_readable(request, version) else None
+    if cached:
+        return codec.loads(cached)['count']
+    try:
+        result = await subjects_manager.count_with_filters(session, request_id, **filters)
+    except Exception as e:
+        router_logger.error('%s | Ошибка в подсчёте для X-Total-Count', request_id, exc_info=e)
+        return None
+    await write_cache(key, {key: codec.dumps(result)}, version, request_id)
+    return result['count']
+
+
 def get_filter_query(
         id_min: int | None = Query(None, ge=0, le=2147483647, ),
         id_max: int | None = Query(None, gt=0, le=2147483647, ),
@@ -42,6 +175,7 @@ def get_filter_query(
 
 
 @router.post('/subjects',
+             dependencies=[Depends(admit('write', cancellable=False, buffered=True), scope='function')],
              response_model=subjects.ReadSubjects,
              status_code=status.HTTP_201_CREATED,
              summary="Create subject",
@@ -52,29 +186,37 @@ def get_filter_query(
              }
              )
 async def create_subjects(subject_data: subjects.CreateSubjects,
+                          response: Response,
                           request_id: str = Depends(get_request_id),
-                          session: AsyncSession = Depends(get_async_session)):
-    router_logger.info(f'{request_id} | Создание Subject')
+                          session: LazySession = Depends(get_lazy_session)):
+    router_logger.info('%s | Создание Subject', request_id)
 
     try:
 
-        subject_read: subjects.ReadSubjects = await subjects_manager.create(subject_data,
-                                                                            session,
-                                                                            request_id)
+        if settings.INGEST_BUFFERED:
+            subject_read: subjects.ReadSubjects = await ingest_queue.submit(subject_data, request_id)
+        else:
+            subject_read: subjects.ReadSubjects = await subjects_manager.create(subject_data,
+                                                                                session,
+                                                                                request_id)
 
-        router_logger.info(f"{request_id} | Успешное создание Subject: id={subject_read.id}")
+        router_logger.info("%s | Успешное создание Subject: id=%s", request_id, subject_read.id)
+        mark_read_primary(response)
         await redis_manager.delete_subject_with_filters(request_id)
+        await redis_manager.bump_data_version(request_id)
+        await redis_manager.change_inventory(1, subject_read.weight, subject_read.create_at.date(), 'added',
+                                             request_id)
         return subject_read
 
     except ConnectionError:
-        router_logger.critical(f'{request_id} | База данных не доступна')
+        router_logger.critical('%s | База данных не доступна', request_id)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail='Database connection error',
         )
     except Exception:
-        router_logger.error(f'{request_id} | Ошибка в создании')
+        router_logger.error('%s | Ошибка в создании', request_id)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -82,6 +224,7 @@ async def create_subjects(subject_data: subjects.CreateSubjects,
         )
 
 @router.delete('/subjects/{subject_id}',
+               dependencies=[Depends(admit('write', cancellable=False), scope='function')],
                response_model=subjects.ReadSubjects,
                status_code=status.HTTP_200_OK,
                summary="Delete subject",
@@ -93,10 +236,11 @@ async def create_subjects(subject_data: subjects.CreateSubjects,
                    500: {"description": "Database connection error | Error in object delete"}
                }
                )
-async def delete_subject(subject_id: int = Path(..., ge=0, description='Айди удаляемого объекта', ),
+async def delete_subject(response: Response,
+                         subject_id: int = Path(..., ge=0, description='Айди удаляемого объекта', ),
                          request_id: str = Depends(get_request_id),
-                         session: AsyncSession = Depends(get_async_session)):
-    router_logger.info(f'{request_id} | Удаление Subject, id={subject_id}')
+                         session: LazySession = Depends(get_lazy_session)):
+    router_logger.info('%s | Удаление Subject, id=%s', request_id, subject_id)
 
     try:
 
@@ -104,21 +248,25 @@ async def delete_subject(subject_id: int = Path(..., ge=0, description='Айди
                                                                             session,
                                                                             request_id)
 
-        router_logger.info(f"{request_id} | Успешное удаление Subject: id={subject_read.id}")
+        router_logger.info("%s | Успешное удаление Subject: id=%s", request_id, subject_read.id)
+        mark_read_primary(response)
         await redis_manager.delete_subject_with_filters(request_id)
+        await redis_manager.bump_data_version(request_id)
+        await redis_manager.change_inventory(-1, -subject_read.weight, subject_read.delete_at.date(), 'deleted',
+                                             request_id)
         return subject_read
     except HTTPException as e:
-        router_logger.info(f'{request_id} |' + e.detail)
+        router_logger.info('%s | %s', request_id, e.detail)
         raise
     except ConnectionError:
-        router_logger.critical(f'{request_id} | База данных не доступна')
+        router_logger.critical('%s | База данных не доступна', request_id)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail='Database connection error',
         )
     except Exception:
-        router_logger.error(f'{request_id} | Ошибка в удалении')
+        router_logger.error('%s | Ошибка в удалении', request_id)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -127,6 +275,7 @@ async def delete_subject(subject_id: int = Path(..., ge=0, description='Айди
 
 
 @router.get('/subjects',
+            dependencies=[Depends(admit('list'), scope='function')],
             response_model=list[subjects.ReadSubjects],
             status_code=status.HTTP_200_OK,
             summary="Get subjects",
@@ -138,34 +287,55 @@ async def delete_subject(subject_id: int = Path(..., ge=0, description='Айди
             }
             )
 async def get_with_filters(
+        request: Request,
+        total_count: bool = Query(False, description='Добавить заголовок X-Total-Count'),
         filters: dict = Depends(get_filter_query),
+        encoding: str | None = Depends(get_response_encoding),
         request_id: str = Depends(get_request_id),
-        session: AsyncSession = Depends(get_async_session),
+        session: LazySession = Depends(get_lazy_read_session),
 
 ):
-    router_logger.info(f"{request_id} | Получение Subjects")
+    router_logger.info("%s | Получение Subjects", request_id)
     key = create_key_filters(filters)
 
-    result = await redis_manager.get_subject_with_filters(key, request_id)
+    # Клиент с актуальным ETag получает 304 ещё до кеша и бд
+    version = await get_read_version(request, request_id)
+    validator = check_not_modified(request.headers.get('if-none-match'), version, 'list:' + key, encoding,
+                                   request_id)
 
-    if result:
-        return [subjects.ReadSubjects.model_validate(res, from_attributes=True) for res in result]
+    # В кеше лежит готовый json ответа, в том числе сжатый, его отдаём как есть
+    cached = await get_cached_json(request, key, encoding, version, request_id, validator)
+    if cached is not None:
+        if total_count:
+            count = await get_total_count(request, filters, session, version, request_id)
+            if count is not None:
+                cached.headers['X-Total-Count'] = str(count)
+        return cached
 
     try:
         result = await subjects_manager.get_with_filters(session, request_id, **filters)
-        router_logger.info(f"{request_id} | Успешное получение Subjects")
+        router_logger.info("%s | Успешное получение Subjects", request_id)
 
+        payload = codec.dumps(result)
         if result:
-            await redis_manager.set_subject_with_filters(key, result, request_id)
-
-        return result
+            response = await set_cached_json(key, payload, encoding, version, request_id, validator)
+            # Строки уже получены, их число и есть count, кладём его для следующих попаданий в кеш
+            total_key = count_key(filters)
+            await write_cache(total_key, {total_key: codec.dumps({'count': len(result), 'exact': True})},
+                              version, request_id)
+        else:
+            response = cached_json_response(payload, None, 'MISS', validator)
+
+        if total_count:
+            response.headers['X-Total-Count'] = str(len(result))
+        return response
 
     except HTTPException as e:
-        router_logger.info(f'{request_id} |' + e.detail)
+        router_logger.info('%s | %s', request_id, e.detail)
         raise
 
     except ConnectionError:
-        router_logger.critical(f'{request_id} | База данных не доступна')
+        router_logger.critical('%s | База данных не доступна', request_id)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -173,7 +343,7 @@ async def get_with_filters(
         )
 
     except Exception as e:
-        router_logger.error(f'{request_id} | Ошибка в получении', exc_info=e)
+        router_logger.error('%s | Ошибка в получении', request_id, exc_info=e)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -181,27 +351,101 @@ async def get_with_filters(
         )
 
 
-@router.get('/subjects/statistics')
+@router.get('/subjects/count',
+            dependencies=[Depends(admit('list'), scope='function')],
+            status_code=status.HTTP_200_OK,
+            summary="Count subjects",
+            responses={
+                200: {"description": "Number of subjects matching the filters; exact=false for a planner estimate"},
+                500: {"description": "Database connection error | Error in count"}
+            }
+            )
+async def count_subjects(
+        request: Request,
+        estimate: bool = Query(False, description='Оценка планировщика вместо count(*) для больших выборок'),
+        filters: dict = Depends(get_filter_query),
+        encoding: str | None = Depends(get_response_encoding),
+        request_id: str = Depends(get_request_id),
+        session: LazySession = Depends(get_lazy_read_session),
+):
+    router_logger.info("%s | Подсчёт Subjects", request_id)
+    key = count_key(filters, estimate)
+
+    version = await get_read_version(request, request_id)
+    cached = await get_cached_json(request, key, encoding, version, request_id)
+    if cached is not None:
+        return cached
+
+    try:
+        result = await subjects_manager.count_with_filters(session, request_id, estimate, **filters)
+    except ConnectionError:
+        router_logger.critical('%s | База данных не доступна', request_id)
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Database connection error',
+        )
+    except Exception as e:
+        router_logger.error('%s | Ошибка в подсчёте', request_id, exc_info=e)
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Error in count',
+        )
+
+    return await set_cached_json(key, codec.dumps(result), encoding, version, request_id)
+
+
+@router.get('/subjects/statistics',
+            dependencies=[Depends(admit('statistics'), scope='function')],
+            responses={
+                200: {"description": "avg/min/max/total over subjects present in the period. "
+                                     "percentiles: weight and length over subjects created in the period, "
+                                     "time_in_storage_s over subjects deleted in the period, "
+                                     "see percentiles.population"},
+            }
+            )
 async def get_statistics(
+        request: Request,
         start_date: datetime | None = Query(None),
         end_date: datetime | None = Query(None),
+        percentiles: bool = Query(False, description='Добавить p50/p90/p99 по дневным скетчам: вес и длина '
+                                                     'созданных за период, время хранения удалённых за период'),
+        exact: bool = Query(False, description='Точные перцентили по строкам, для сверки скетчей'),
+        encoding: str | None = Depends(get_response_encoding),
         request_id: str = Depends(get_request_id),
-        session: AsyncSession = Depends(get_async_session)):
-    router_logger.info(f"{request_id} | Получение статистики по Subjects")
+        session: LazySession = Depends(get_lazy_read_session)):
+    router_logger.info("%s | Получение статистики по Subjects", request_id)
+
+    # Без end_date период заканчивается сейчас: тело меняется и без записей, поэтому ETag слабый и по дням
+    key = create_key_filters({'start_date': start_date, 'end_date': end_date or date.today(),
+                              'percentiles': percentiles, 'exact': exact})
+    version = await get_read_version(request, request_id)
+    validator = check_not_modified(request.headers.get('if-none-match'), version, 'statistics:' + key, encoding,
+                                   request_id, weak=end_date is None)
     try:
-        return await subjects_manager.get_subjects_statistics(
+        result = await subjects_manager.get_subjects_statistics(
             start_date=start_date,
             end_date=end_date,
             request_id=request_id,
             session=session,
         )
+        if percentiles:
+            result['percentiles'] = await get_percentiles(
+                session,
+                datetime.fromisoformat(result['period']['start']),
+                datetime.fromisoformat(result['period']['end']),
+                request_id,
+                exact=exact,
+            )
+        return await encoded_json_response(codec.dumps(result), encoding, validator)
 
     except HTTPException as e:
-        router_logger.info(f'{request_id} |' + e.detail)
+        router_logger.info('%s | %s', request_id, e.detail)
         raise
 
     except ConnectionError:
-        router_logger.critical(f'{request_id} | База данных не доступна')
+        router_logger.critical('%s | База данных не доступна', request_id)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -209,39 +453,299 @@ async def get_statistics(
         )
 
     except Exception as e:
-        router_logger.error(f'{request_id} | Ошибка в получении статистики', exc_info=e)
+        router_logger.error('%s | Ошибка в получении статистики', request_id, exc_info=e)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail='Error select subject',
         )
+
+
+@router.get('/subjects/histogram',
+            dependencies=[Depends(admit('analytics'), scope='function')],
+            status_code=status.HTTP_200_OK,
+            summary="Get weight or length histogram",
+            responses={
+                200: {"description": "Buckets with count and sum, plus values outside the range"},
+                422: {"description": "Invalid bucket spec"},
+                500: {"description": "Database connection error | Error in histogram"}
+            }
+            )
+async def get_histogram(
+        request: Request,
+        field: Literal['weight', 'length'] = Query('weight'),
+        scale: Literal['fixed', 'log', 'edges'] = Query('fixed'),
+        buckets: int = Query(20, ge=1, le=1000, description='Количество корзин для fixed и log'),
+        edges: str | None = Query(None, examples=['0,10,50,100,1000'], description='Границы корзин для edges'),
+        range_min: float | None = Query(None, description='Левая граница для fixed и log, по умолчанию минимум'),
+        range_max: float | None = Query(None, description='Правая граница для fixed и log, по умолчанию максимум'),
+        filters: dict = Depends(get_filter_query),
+        encoding: str | None = Depends(get_response_encoding),
+        request_id: str = Depends(get_request_id),
+        session: LazySession = Depends(get_lazy_read_session),
+):
+    router_logger.info("%s | Получение гистограммы Subjects", request_id)
+
+    edge_values = None
+    if scale == 'edges':
+        try:
+            edge_values = [float(edge) for edge in (edges or '').split(',') if edge.strip()]
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail='edges must be numbers')
+        if not all(math.isfinite(edge) for edge in edge_values):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail='edges must be finite')
+        if len(edge_values) < 2 or any(a >= b for a, b in zip(edge_values, edge_values[1:])):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail='edges must be at least two increasing numbers')
+    if any(bound is not None and not math.isfinite(bound) for bound in (range_min, range_max)):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail='range_min and range_max must be finite')
+    if range_min is not None and range_max is not None and range_min >= range_max:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail='range_min cannot be greater than range_max')
+    if scale == 'log' and any(bound is not None and bound <= 0 for bound in (range_min, range_max)):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail='log scale needs positive range')
+
+    spec = {'field': field, 'scale': scale, 'buckets': None if scale == 'edges' else buckets,
+            'edges': edge_values, 'range_min': range_min, 'range_max': range_max}
+    # Под subject:, чтобы запись сбрасывала и гистограммы
+    key = 'histogram:' + create_key_filters({**filters, **spec})
+
+    version = await get_read_version(request, request_id)
+    cached = await get_cached_json(request, key, encoding, version, request_id)
+    if cached is not None:
+        return cached
+
+    try:
+        result = await subjects_manager.get_histogram(session, request_id, field, scale, buckets, edge_values,
+                                                      range_min, range_max, **filters)
+    except ConnectionError:
+        router_logger.critical('%s | База данных не доступна', request_id)
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Database connection error',
+        )
+    except Exception as e:
+        router_logger.error('%s | Ошибка в построении гистограммы', request_id, exc_info=e)
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Error in histogram',
+        )
+
+    payload = codec.dumps({'field': field, 'scale': scale, **result})
+    return await set_cached_json(key, payload, encoding, version, request_id)
+
+
+@router.get('/subjects/timeseries',
+            dependencies=[Depends(admit('analytics'), scope='function')],
+            status_code=status.HTTP_200_OK,
+            summary="Get subjects time series",
+            responses={
+                200: {"description": "Added, deleted, active count and total weight per bucket"},
+                422: {"description": "Invalid range"},
+                500: {"description": "Database connection error | Error in time series"}
+            }
+            )
+async def get_subjects_timeseries(
+        bucket: Literal['hour', 'day', 'week', 'month'] = Query('day'),
+        start_date: datetime | None = Query(None, description='По умолчанию 30 дней до end_date'),
+        end_date: datetime | None = Query(None, description='По умолчанию сейчас'),
+        request_id: str = Depends(get_request_id),
+        session: LazySession = Depends(get_lazy_read_session),
+):
+    router_logger.info("%s | Получение временного ряда Subjects по %s", request_id, bucket)
+
+    end_date = end_date or datetime.now()
+    start_date = start_date or end_date - timedelta(days=30)
+    if start_date > end_date:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail='start_date cannot be greater than end_date')
+
+    try:
+        return await get_timeseries(session, bucket, start_date, end_date, request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except ConnectionError:
+        router_logger.critical('%s | База данных не доступна', request_id)
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Database connection error',
+        )
+    except Exception as e:
+        router_logger.error('%s | Ошибка в получении временного ряда', request_id, exc_info=e)
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Error in time series',
+        )
+
+
+async def stream_events(request: Request, subscription: Subscription, request_id: str):
+    try:
+        yield b'retry: 3000\n\n'
+        while not subscription.overflowed:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), settings.EVENTS_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                # Комментарий держит соединение живым через прокси
+                yield b': ping\n\n'
+                continue
+            yield format_sse(message)
+
+        if subscription.overflowed:
+            router_logger.warning('%s | Клиент не успевает читать события, поток закрыт', request_id)
+            yield b'event: overflow\ndata: {}\n\n'
+    finally:
+        event_broker.unsubscribe(subscription)
+        router_logger.info('%s | Подписка на события закрыта', request_id)
+
+
+@router.get('/subjects/events',
+            status_code=status.HTTP_200_OK,
+            summary="Subjects change feed",
+            response_class=StreamingResponse,
+            responses={
+                200: {"description": "Server-Sent Events: create и delete с данными Subject",
+                      "content": {"text/event-stream": {}}},
+                503: {"description": "Event source unavailable"}
+            }
+            )
+async def subjects_events(
+        request: Request,
+        filters: dict = Depends(get_filter_query),
+        request_id: str = Depends(get_request_id),
+):
+    router_logger.info("%s | Подписка на события Subjects", request_id)
+    try:
+        subscription = await event_broker.subscribe(filters)
+    except Exception as e:
+        router_logger.error('%s | Не удалось подписаться на события', request_id, exc_info=e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Event source unavailable',
+        )
+
+    return StreamingResponse(stream_events(request, subscription, request_id),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@router.get('/subjects/inventory',
+            dependencies=[Depends(admit('get'), scope='function')],
+            status_code=status.HTTP_200_OK,
+            summary="Get current inventory",
+            responses={
+                200: {"description": "Active count, total weight and added/deleted per day"},
+                500: {"description": "Database connection error | Error in inventory"}
+            }
+            )
+async def get_inventory(
+        days: int = Query(7, ge=0, le=settings.INVENTORY_DAYS, description='За сколько последних дней отдать счётчики'),
+        request_id: str = Depends(get_request_id),
+        session: LazySession = Depends(get_lazy_read_session),
+):
+    router_logger.info("%s | Получение остатков", request_id)
+
+    inventory = await redis_manager.get_inventory(request_id)
+    source = 'redis'
+
+    if inventory is None:
+        # Счётчики ещё не сверены или редиса нет: считаем по бд, в редис их положит сверка
+        source = 'db'
+        try:
+            inventory = await subjects_manager.get_inventory(session, inventory_reconciler.since(), request_id)
+        except Exception as e:
+            router_logger.error('%s | Ошибка в получении остатков', request_id, exc_info=e)
+
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Error in inventory',
+            )
+
+    since = (date.today() - timedelta(days=days)).isoformat()
+    inventory['days'] = {day: counts for day, counts in sorted(inventory['days'].items()) if day >= since}
+    inventory['source'] = source
+    return inventory
+
+
+@router.post('/subjects/lookup',
+             dependencies=[Depends(admit('list'), scope='function')],
+             response_model=subjects.LookupResultSubjects,
+             status_code=status.HTTP_200_OK,
+             summary="Get subjects by ids",
+             responses={
+                 200: {"description": "Found subjects in request order and ids that were not found"},
+                 500: {"description": "Database connection error | Error in lookup"}
+             }
+             )
+async def lookup_subjects(
+        lookup: subjects.LookupSubjects,
+        request_id: str = Depends(get_request_id),
+        session: LazySession = Depends(get_lazy_read_session),
+):
+    router_logger.info('%s | Получение %s Subjects по id', request_id, len(lookup.ids))
+    try:
+        found = await subjects_manager.get_many(lookup.ids, session, request_id)
+    except ConnectionError:
+        router_logger.critical('%s | База данных не доступна', request_id)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Database connection error',
+        )
+    except Exception as e:
+        router_logger.error('%s | Ошибка в получении по id', request_id, exc_info=e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Error in lookup',
+        )
+
+    return {
+        'items': [found[subject_id] for subject_id in lookup.ids if subject_id in found],
+        'missing': [subject_id for subject_id in lookup.ids if subject_id not in found],
+    }
+
+
 @router.get('/subjects/{subject_id}',
+            dependencies=[Depends(admit('get'), scope='function')],
             response_model=subjects.ReadSubjects,
             status_code=status.HTTP_200_OK,
             )
 async def get_subject(
+        request: Request,
         subject_id: int,
         request_id: str = Depends(get_request_id),
-        session: AsyncSession = Depends(get_async_session),
+        session: LazySession = Depends(get_lazy_read_session),
 ):
-    router_logger.info(f'{request_id} | Получение Subject, id={subject_id}')
+    router_logger.info('%s | Получение Subject, id=%s', request_id, subject_id)
     try:
-        subject_read: subjects.ReadSubjects = await subjects_manager.get(subject_id,session , request_id)
-
-        router_logger.info(f'{request_id} | Успешно получен Subject, id={subject_id}')
+        if settings.LOOKUP_COALESCE:
+            # Одиночные получения из параллельных запросов уходят в бд одной пачкой
+            subject_read = await subject_coalescer.load(subject_id, must_read_primary(request), request_id)
+            if subject_read is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        else:
+            subject_read: subjects.ReadSubjects = await subjects_manager.get(subject_id,session , request_id)
+
+        router_logger.info('%s | Успешно получен Subject, id=%s', request_id, subject_id)
         return subject_read
 
     except HTTPException as e:
-        router_logger.info(f'{request_id} |' + e.detail)
+        router_logger.info('%s | %s', request_id, e.detail)
         raise
     except ConnectionError:
-        router_logger.critical(f'{request_id} | База данных не доступна')
+        router_logger.critical('%s | База данных не доступна', request_id)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail='Database connection error',
         )
     except Exception:
-        router_logger.error(f'{request_id} | Ошибка в получении')
+        router_logger.error('%s | Ошибка в получении', request_id)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
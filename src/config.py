@@ -1,8 +1,27 @@
+import math
+import os
 from pathlib import Path
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 BASE_DIR = Path(__file__).parent.parent
 
+
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # В контейнере лимит задаётся квотой cgroup v2, а не числом видимых ядер
+    try:
+        quota, period = Path('/sys/fs/cgroup/cpu.max').read_text().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
 class Settings(BaseSettings):
 
     # Настройки приложения
@@ -17,6 +36,94 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASS: str
 
+    # Запуск через python -m src.serve. 0 воркеров - по числу доступных CPU в пределах бюджета соединений
+    WEB_WORKERS: int = 0
+    WEB_PRELOAD: bool = True
+    WEB_KEEPALIVE_S: int = 5
+    WEB_BACKLOG: int = 2048
+    WEB_TIMEOUT_S: int = 30
+    WEB_GRACEFUL_TIMEOUT_S: int = 30
+    # Перезапуск воркера после стольких запросов, 0 - никогда; jitter разносит перезапуски воркеров
+    WEB_MAX_REQUESTS: int = 0
+    WEB_MAX_REQUESTS_JITTER: int = 0
+
+    # Пул соединений. Бюджет соединений с основной бд делится на все воркеры: пул, overflow и LISTEN.
+    # Автоматическое число воркеров не больше, чем помещается в бюджет по DB_MIN_CONNECTIONS_PER_WORKER.
+    # overflow по умолчанию не больше четверти доли воркера
+    DB_MAX_CONNECTIONS: int = 100
+    DB_MIN_CONNECTIONS_PER_WORKER: int = 8
+    DB_POOL_SIZE: int | None = None
+    DB_MAX_OVERFLOW: int = 5
+    # Ожидание свободного соединения. Очередь держит допуск (ADMISSION_*), здесь только страховка
+    DB_POOL_TIMEOUT: float = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = False
+    # Кеш подготовленных выражений asyncpg на соединение, 0 - выключен
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # Для PgBouncer в режиме transaction: без серверных подготовленных выражений между запросами
+    DB_PGBOUNCER_MODE: bool = False
+
+    # Реплики для чтения, полные url через запятую
+    DB_REPLICA_URLS: str = ''
+    DB_REPLICA_MAX_LAG_S: float = 5
+    DB_REPLICA_LAG_CHECK_S: float = 2
+    # Сколько после записи клиент читает с основной бд
+    DB_READ_YOUR_WRITES_S: float = 10
+
+    # Допуск запросов: одновременных на воркер по группам эндпоинтов, очередь limit * QUEUE_FACTOR,
+    # ожидание не дольше MAX_WAIT_S, сверх этого 503 с Retry-After. По умолчанию лимиты - доли ADMISSION_SHARES
+    # от пула воркера (pool + overflow), чтобы допущенные запросы не ждали соединение внутри пула;
+    # ADMISSION_LIMITS задаёт лимиты явно. Создания через буфер записи (INGEST_BUFFERED) соединение не держат
+    # и допускаются отдельной группой ingest: по умолчанию две пачки, одна копится, пока пишется другая
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_LIMITS: dict[str, int] | None = None
+    ADMISSION_SHARES: dict[str, float] = {
+        'get': 0.4,
+        'list': 0.2,
+        'write': 0.2,
+        'analytics': 0.1,
+        'statistics': 0.1,
+    }
+    ADMISSION_QUEUE_FACTOR: int = 4
+    ADMISSION_MAX_WAIT_S: float = 2
+    ADMISSION_RETRY_AFTER_S: int = 1
+    # Дедлайн запросов к бд по тем же группам: statement_timeout на каждую транзакцию эндпоинта, 0 - без дедлайна.
+    # Превышение - 504. Если клиент отключился, чтение из бд отменяется, не дожидаясь дедлайна; запись - нет
+    DB_STATEMENT_TIMEOUTS_MS: dict[str, int] = {
+        'get': 2000,
+        'list': 10000,
+        'write': 5000,
+        'analytics': 15000,
+        'statistics': 30000,
+    }
+    DB_CANCEL_ON_DISCONNECT: bool = True
+
+    # Буферизованная запись создаваемых subjects пачками, ответ после commit пачки
+    INGEST_BUFFERED: bool = False
+    INGEST_BATCH_SIZE: int = 500
+    INGEST_FLUSH_MS: float = 5
+
+    # Получение по id: склейка одиночных запросов в окне LOOKUP_COALESCE_MS и лимит id в пакетном запросе
+    LOOKUP_COALESCE: bool = False
+    LOOKUP_COALESCE_MS: float = 2
+    LOOKUP_BATCH_SIZE: int = 500
+    LOOKUP_MAX_IDS: int = 1000
+
+    # /subjects/count?estimate=true: оценка планировщика отдаётся, только если она не меньше порога
+    COUNT_ESTIMATE_MIN_ROWS: int = 10000
+
+    # Поток событий по subjects
+    EVENTS_QUEUE_SIZE: int = 1000
+    EVENTS_HEARTBEAT_S: float = 15
+
+    # Счётчики остатков в редисе: как часто сверять с бд и сколько дней хранить по дням
+    INVENTORY_RECONCILE_S: float = 300
+    INVENTORY_DAYS: int = 90
+
+    # Перцентили статистики по дневным скетчам: относительная ошибка и сколько хранить прошедшие дни
+    STATS_SKETCH_ALPHA: float = 0.01
+    STATS_SKETCH_TTL_S: int = 30 * 24 * 3600
+
     # Бд тест
     DB_HOST_TEST: str
     DB_PORT_TEST: str
@@ -30,8 +137,31 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: str
     REDIS_DB_CACHE: int = 1
 
+    # Старт и пробы: ограничение на проверку при старте, пауза переподключения к редису, кеш readiness
+    STARTUP_TIMEOUT_S: float = 5
+    REDIS_RECONNECT_S: float = 5
+    HEALTH_CHECK_TIMEOUT_S: float = 1
+    HEALTH_CACHE_S: float = 2
+
+    # Сжатие ответов по Accept-Encoding. Ответы из кеша списка хранятся в редисе уже сжатыми
+    COMPRESS_ENABLED: bool = True
+    COMPRESS_MIN_BYTES: int = 1024
+    COMPRESS_GZIP_LEVEL: int = 6
+    COMPRESS_ZSTD_LEVEL: int = 3
+    COMPRESS_BROTLI_QUALITY: int = 5
+
+    # Cache-Control для списка и статистики: сколько клиент может не перепроверять ETag
+    HTTP_CACHE_MAX_AGE_S: int = 0
+
     # Логирование
     LOG_LEVEL: str = 'DEBUG'
+    LOG_JSON: bool = False
+
+    # Лог медленных запросов
+    SLOW_QUERY_THRESHOLD_MS: float = 200
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = 0.1
+    SLOW_QUERY_REDACT_PARAMS: bool = True
+    SLOW_QUERY_LOG_SIZE: int = 200
 
     model_config = SettingsConfigDict(env_file=BASE_DIR/".env",
                                       extra="ignore")
@@ -40,6 +170,43 @@ class Settings(BaseSettings):
     def DATABASE_URL(self):
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def WEB_WORKERS_COUNT(self) -> int:
+        if self.WEB_WORKERS:
+            return self.WEB_WORKERS
+        return max(1, min(available_cpus(), self.DB_MAX_CONNECTIONS // self.DB_MIN_CONNECTIONS_PER_WORKER))
+
+    @property
+    def DB_CONNECTIONS_PER_WORKER(self) -> int:
+        # Одно соединение воркера уходит на LISTEN потока событий
+        return max(1, self.DB_MAX_CONNECTIONS // self.WEB_WORKERS_COUNT - 1)
+
+    @property
+    def DB_MAX_OVERFLOW_PER_WORKER(self) -> int:
+        if self.DB_POOL_SIZE is not None:
+            return self.DB_MAX_OVERFLOW
+        return min(self.DB_MAX_OVERFLOW, self.DB_CONNECTIONS_PER_WORKER // 4)
+
+    @property
+    def DB_POOL_SIZE_PER_WORKER(self) -> int:
+        if self.DB_POOL_SIZE is not None:
+            return self.DB_POOL_SIZE
+        return max(1, self.DB_CONNECTIONS_PER_WORKER - self.DB_MAX_OVERFLOW_PER_WORKER)
+
+    @property
+    def ADMISSION_LIMITS_PER_WORKER(self) -> dict[str, int]:
+        if self.ADMISSION_LIMITS is not None:
+            limits = dict(self.ADMISSION_LIMITS)
+        else:
+            capacity = self.DB_POOL_SIZE_PER_WORKER + self.DB_MAX_OVERFLOW_PER_WORKER
+            limits = {group: max(1, int(capacity * share)) for group, share in self.ADMISSION_SHARES.items()}
+        limits.setdefault('ingest', 2 * self.INGEST_BATCH_SIZE)
+        return limits
+
+    @property
+    def DATABASE_REPLICA_URLS(self) -> list[str]:
+        return [url.strip() for url in self.DB_REPLICA_URLS.split(',') if url.strip()]
+
     @property
     def DATABASE_URL_TEST(self):
         return f"postgresql+asyncpg://{self.DB_USER_TEST}:{self.DB_PASS_TEST}@{self.DB_HOST_TEST}:{self.DB_PORT_TEST}/{self.DB_NAME_TEST}"
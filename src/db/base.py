@@ -5,10 +5,12 @@ from fastapi import HTTPException, status
 from typing import Generic, TypeVar
 
 from pydantic import BaseModel
+from sqlalchemy import ARRAY, BigInteger, any_, bindparam, select
 from sqlalchemy.exc import OperationalError, SQLAlchemyError, InterfaceError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.db.connection import async_session_maker
+from src.db.events import notify
 from src.models import Base
 
 TCreate = TypeVar("TCreate", bound=BaseModel)
@@ -24,18 +26,27 @@ class BaseManager(Generic[TCreate, TRead, TUpdate, TModel]):
     read_schema: type[TRead]
     update_schema: type[TUpdate]
     model: type[TModel]
+    # Канал NOTIFY для изменений, None - без уведомлений
+    events_channel: str | None = None
 
     async def __create_entity(self, data: dict, session: AsyncSession) -> TModel:
         instance = self.model(**data)
         session.add(instance)
         await session.flush()
         await session.refresh(instance)
+        await self._notify(session, 'create', instance)
         return instance
 
+    async def _notify(self, session: AsyncSession, event: str, entity: TModel):
+        if self.events_channel is None:
+            return
+        data = self.read_schema.model_validate(entity, from_attributes=True).model_dump()
+        await notify(session, self.events_channel, event, [data])
+
     async def get(self, entity_id: int,
                   session: AsyncSession | None = None,
                   request_id: str | None = None) -> TRead:
-        database_logger.debug(f"{request_id} | Начало получения {self.model.__name__}")
+        database_logger.debug("%s | Начало получения %s", request_id, self.model.__name__)
 
         try:
             if session is None:
@@ -47,41 +58,75 @@ class BaseManager(Generic[TCreate, TRead, TUpdate, TModel]):
                 entity = await session.get(self.model, entity_id)
 
             if entity is None:
-                database_logger.debug(f"{request_id} | Не найден {self.model.__name__} id: {entity_id}")
+                database_logger.debug("%s | Не найден %s id: %s", request_id, self.model.__name__, entity_id)
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,)
 
-            database_logger.debug(f"{request_id} | Успешно получен {self.model.__name__} id: {entity_id}")
+            database_logger.debug("%s | Успешно получен %s id: %s", request_id, self.model.__name__, entity_id)
             return self.read_schema.model_validate(entity, from_attributes=True)
 
         except HTTPException:
             raise
         except (OperationalError, InterfaceError) as e:
             database_logger.critical(
-                f"{request_id} | База данных недоступна {self.model.__name__}: {e}",
+                "%s | База данных недоступна %s: %s", request_id, self.model.__name__, e,
                 exc_info=True,
             )
             raise ConnectionError(f"{request_id} | База данных недоступна: {e}") from e
 
         except SQLAlchemyError as e:
             database_logger.error(
-                f"{request_id} | Ошибка БД при получении {self.model.__name__}, Ошибка: {e}",
+                "%s | Ошибка БД при получении %s, Ошибка: %s", request_id, self.model.__name__, e,
                 exc_info=True,
             )
             raise
 
         except Exception as e:
             database_logger.error(
-                f"Ошибка при получении {self.model.__name__}: {e}",
+                "Ошибка при получении %s: %s", self.model.__name__, e,
                 exc_info=True,
             )
             raise
 
 
 
+    async def get_many(self, entity_ids: list[int],
+                       session: AsyncSession,
+                       request_id: str | None = None) -> dict[int, TRead]:
+        """
+        Несколько объектов одним запросом id = ANY(:ids): один параметр-массив, поэтому
+        текст запроса не зависит от числа id. Ненайденных id в ответе нет
+        """
+        database_logger.debug("%s | Получение %s %s по id", request_id, len(entity_ids), self.model.__name__)
+
+        fields = list(self.read_schema.model_fields)
+        query = select(*(getattr(self.model, name) for name in fields)).where(
+            self.model.id == any_(bindparam('ids', type_=ARRAY(BigInteger)))
+        )
+        try:
+            result = await session.execute(query, {'ids': list(set(entity_ids))})
+            rows = [self.read_schema.model_validate(dict(zip(fields, row))) for row in result]
+
+        except (OperationalError, InterfaceError) as e:
+            database_logger.critical(
+                "%s | База данных недоступна %s: %s", request_id, self.model.__name__, e,
+                exc_info=True,
+            )
+            raise ConnectionError(f"{request_id} | База данных недоступна: {e}") from e
+
+        except SQLAlchemyError as e:
+            database_logger.error(
+                "%s | Ошибка БД при получении %s по id, Ошибка: %s", request_id, self.model.__name__, e,
+                exc_info=True,
+            )
+            raise
+
+        database_logger.debug("%s | Найдено %s из %s", request_id, len(rows), len(entity_ids))
+        return {row.id: row for row in rows}
+
     async def create(self, create_data: TCreate,
                      session: AsyncSession | None = None,
                      request_id: str | None = None) -> TRead:
-        database_logger.debug(f"{request_id} | Начало создания {self.model.__name__}")
+        database_logger.debug("%s | Начало создания %s", request_id, self.model.__name__)
 
         data = create_data.model_dump(exclude_unset=True)
 
@@ -96,27 +141,27 @@ class BaseManager(Generic[TCreate, TRead, TUpdate, TModel]):
 
             await session.commit()
 
-            database_logger.debug(f"{request_id} | Успешно создан {self.model.__name__}: {entity}")
+            database_logger.debug("%s | Успешно создан %s: id=%s", request_id, self.model.__name__, entity.id)
 
             return self.read_schema.model_validate(entity, from_attributes=True)
 
         except (OperationalError, InterfaceError) as e:
             database_logger.critical(
-                f"{request_id} | База данных недоступна {self.model.__name__}: {e}",
+                "%s | База данных недоступна %s: %s", request_id, self.model.__name__, e,
                 exc_info=True,
             )
             raise ConnectionError(f"{request_id} | База данных недоступна: {e}") from e
 
         except SQLAlchemyError as e:
             database_logger.error(
-                f"{request_id} | Ошибка БД при создании {self.model.__name__}: {data}, Ошибка: {e}",
+                "%s | Ошибка БД при создании %s: %s, Ошибка: %s", request_id, self.model.__name__, data, e,
                 exc_info=True,
             )
             raise
 
         except Exception as e:
             database_logger.error(
-                f"Ошибка при создании {self.model.__name__}: {e}",
+                "Ошибка при создании %s: %s", self.model.__name__, e,
                 exc_info=True,
             )
             raise
@@ -124,7 +169,7 @@ class BaseManager(Generic[TCreate, TRead, TUpdate, TModel]):
     async def delete(self, index_entity: str,
                      session: AsyncSession | None = None,
                      request_id: str | None = None) -> TRead:
-        database_logger.debug(f"{request_id} | Начало удаления {self.model.__name__} с индексом: {index_entity}")
+        database_logger.debug("%s | Начало удаления %s с индексом: %s", request_id, self.model.__name__, index_entity)
 
         try:
             if session is None:
@@ -137,22 +182,23 @@ class BaseManager(Generic[TCreate, TRead, TUpdate, TModel]):
 
             if entity is None:
                 database_logger.debug(
-                    f"{request_id} | Объект {self.model.__name__} с индексом: {index_entity} не найден")
+                    "%s | Объект %s с индексом: %s не найден", request_id, self.model.__name__, index_entity)
 
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Object not found')
 
             if not entity.is_active:
                 database_logger.debug(
-                    f"{request_id} | Объект {self.model.__name__} с индексом: {index_entity} уже удалён")
+                    "%s | Объект %s с индексом: %s уже удалён", request_id, self.model.__name__, index_entity)
 
                 raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Object already deleted')
 
             entity.is_active = False
             entity.delete_at = datetime.now(timezone.utc).replace(tzinfo=None)
+            await self._notify(session, 'delete', entity)
             await session.commit()
 
             database_logger.debug(
-                f"{request_id} | Объект {self.model.__name__} с индексом: {index_entity} удалён")
+                "%s | Объект %s с индексом: %s удалён", request_id, self.model.__name__, index_entity)
 
             return self.read_schema.model_validate(entity, from_attributes=True)
 
@@ -161,14 +207,14 @@ class BaseManager(Generic[TCreate, TRead, TUpdate, TModel]):
 
         except (OperationalError, InterfaceError) as e:
             database_logger.critical(
-                f"{request_id} | База данных недоступна {self.model.__name__}: {e}",
+                "%s | База данных недоступна %s: %s", request_id, self.model.__name__, e,
                 exc_info=True,
             )
             raise ConnectionError(f"{request_id} | База данных недоступна: {e}") from e
 
         except Exception as e:
             database_logger.error(
-                f"Ошибка при удалении {self.model.__name__}: {e}",
+                "Ошибка при удалении %s: %s", self.model.__name__, e,
                 exc_info=True,
             )
             raise
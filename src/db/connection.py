@@ -1,19 +1,61 @@
 import logging
-from fastapi import HTTPException
-from typing import AsyncGenerator
+import time
+from uuid import uuid4
+from fastapi import HTTPException, Request, Response
+from typing import AsyncGenerator, Callable
 
 from sqlalchemy.pool import AsyncAdaptedQueuePool
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, create_async_engine, async_sessionmaker
 from src.config import settings
+from src.db.pool_stats import PoolStats
+from src.db.query_log import slow_query_log
+from src.db.replicas import ReplicaRouter
+from src.db.statement_stats import StatementStats
 
 logger = logging.getLogger('Бд')
 
-engine = create_async_engine(settings.DATABASE_URL, poolclass=AsyncAdaptedQueuePool,
-                             pool_size=20,
-                             max_overflow=5,
-                             pool_timeout=300,
-                             pool_recycle=1800
-                             )
+# Пока в куке время в будущем, клиент читает с основной бд и видит свои записи
+READ_PRIMARY_COOKIE = 'read_primary_until'
+
+pool_stats: dict[str, PoolStats] = {}
+statement_stats: dict[str, StatementStats] = {}
+
+
+def get_connect_args() -> dict:
+    if settings.DB_PGBOUNCER_MODE:
+        # PgBouncer в режиме transaction отдаёт каждую транзакцию разному серверному соединению,
+        # поэтому кеши выражений выключаются, а имена делаются уникальными
+        return {
+            'statement_cache_size': 0,
+            'prepared_statement_cache_size': 0,
+            'prepared_statement_name_func': lambda: f'__asyncpg_{uuid4()}__',
+        }
+    return {'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE}
+
+
+def make_engine(url: str) -> AsyncEngine:
+    new_engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool,
+                                     pool_size=settings.DB_POOL_SIZE_PER_WORKER,
+                                     max_overflow=settings.DB_MAX_OVERFLOW_PER_WORKER,
+                                     pool_timeout=settings.DB_POOL_TIMEOUT,
+                                     pool_recycle=settings.DB_POOL_RECYCLE,
+                                     pool_pre_ping=settings.DB_POOL_PRE_PING,
+                                     connect_args=get_connect_args(),
+                                     )
+    slow_query_log.attach(new_engine.sync_engine)
+    pool_stats[new_engine.url.render_as_string(hide_password=True)] = PoolStats(new_engine.sync_engine)
+    statement_stats[new_engine.url.render_as_string(hide_password=True)] = StatementStats(new_engine.sync_engine)
+    return new_engine
+
+
+engine = make_engine(settings.DATABASE_URL)
+
+replica_router = ReplicaRouter(
+    primary=engine,
+    replicas=[make_engine(url) for url in settings.DATABASE_REPLICA_URLS],
+    max_lag=settings.DB_REPLICA_MAX_LAG_S,
+    check_interval=settings.DB_REPLICA_LAG_CHECK_S,
+)
 
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
@@ -22,3 +64,78 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
 
+
+async def get_async_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    async with make_read_session(request) as session:
+        yield session
+
+
+def make_read_session(request: Request) -> AsyncSession:
+    read_engine = engine if must_read_primary(request) else replica_router.pick()
+    return async_session_maker(bind=read_engine)
+
+
+class LazySession:
+    """
+    Обёртка над AsyncSession, которая создаёт сессию при первом обращении к ней.
+    Запросы, которые отдаются из кеша, не создают сессию и не выбирают реплику
+    """
+
+    def __init__(self, factory: Callable[[], AsyncSession]):
+        self._factory = factory
+        self._session: AsyncSession | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._factory()
+        return getattr(self._session, name)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def get_lazy_session() -> AsyncGenerator[LazySession, None]:
+    session = LazySession(async_session_maker)
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def get_lazy_read_session(request: Request) -> AsyncGenerator[LazySession, None]:
+    session = LazySession(lambda: make_read_session(request))
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+def must_read_primary(request: Request) -> bool:
+    return getattr(request.state, 'read_primary', False) or has_read_primary_cookie(request)
+
+
+def has_read_primary_cookie(request: Request) -> bool:
+    """Клиент недавно писал сам: общий кеш мог быть собран до его записи"""
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_primary_for(request: Request):
+    """
+    Чтения этого запроса идут с основной бд: была недавняя запись, которой на репликах может ещё не быть.
+    Вызывается до первого обращения к сессии
+    """
+    request.state.read_primary = True
+
+
+def mark_read_primary(response: Response):
+    """Вызывается после записи, чтобы следующие чтения клиента не ушли на отставшую реплику"""
+    response.set_cookie(READ_PRIMARY_COOKIE, str(time.time() + settings.DB_READ_YOUR_WRITES_S),
+                        max_age=int(settings.DB_READ_YOUR_WRITES_S) + 1, httponly=True)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.utils import codec
+from src.utils.filters_db import match_filters
+
+logger = logging.getLogger('События')
+
+SUBJECTS_CHANNEL = 'subjects_events'
+
+NOTIFY_QUERY = text('SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload')
+
+
+async def notify(session: AsyncSession, channel: str, event: str, rows: list[dict]):
+    """
+    Ставит уведомления в транзакцию сессии, postgres разошлёт их только после commit,
+    при откате они пропадут вместе с изменениями
+    """
+    if not rows:
+        return
+    payloads = [codec.dumps({'event': event, 'data': row}).decode() for row in rows]
+    await session.execute(NOTIFY_QUERY, {'channel': channel, 'payloads': payloads})
+
+
+class Subscription:
+
+    def __init__(self, filters: dict, queue_size: int):
+        self.filters = {key: value for key, value in filters.items() if value is not None}
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(queue_size)
+        # Медленный клиент не копит события бесконечно: поток закрывается, клиент переподключается
+        self.overflowed = False
+
+    def offer(self, message: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventBroker:
+    """
+    Одно LISTEN соединение на воркер, уведомления раздаются подписчикам с подходящими фильтрами.
+    Соединение открывается при первой подписке и переподключается при обрыве.
+    Через PgBouncer в режиме transaction LISTEN не работает, dsn должен смотреть прямо в postgres
+    """
+
+    def __init__(self, dsn: str, channel: str, queue_size: int = 1000, reconnect_s: float = 1.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.queue_size = queue_size
+        self.reconnect_s = reconnect_s
+        self.sequence = 0
+        self.received = 0
+        self.reconnects = 0
+        self._subscribers: set[Subscription] = set()
+        self._conn: asyncpg.Connection | None = None
+        self._lock = asyncio.Lock()
+        self._reconnect_task: asyncio.Task | None = None
+        self._closing = False
+
+    @property
+    def listening(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    async def _listen(self):
+        async with self._lock:
+            if self.listening:
+                return
+            self._closing = False
+            conn = await asyncpg.connect(self.dsn)
+            await conn.add_listener(self.channel, self._on_notify)
+            conn.add_termination_listener(self._on_terminate)
+            self._conn = conn
+            logger.info('Слушаем канал %s', self.channel)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            message = codec.loads(payload)
+        except ValueError:
+            logger.warning('Не удалось разобрать уведомление из канала %s', channel)
+            return
+
+        self.received += 1
+        self.sequence += 1
+        message['id'] = self.sequence
+        for subscription in list(self._subscribers):
+            if match_filters(message['data'], subscription.filters):
+                subscription.offer(message)
+
+    def _on_terminate(self, conn):
+        self._conn = None
+        if self._closing:
+            return
+        logger.warning('LISTEN соединение с бд оборвалось')
+        if self._subscribers and (self._reconnect_task is None or self._reconnect_task.done()):
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while self._subscribers and not self._closing:
+            await asyncio.sleep(self.reconnect_s)
+            try:
+                await self._listen()
+                self.reconnects += 1
+                return
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.error('Не удалось переподключить LISTEN: %s', e)
+
+    async def subscribe(self, filters: dict) -> Subscription:
+        await self._listen()
+        subscription = Subscription(filters, self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    async def close(self):
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+    def stats(self) -> dict:
+        return {
+            'channel': self.channel,
+            'listening': self.listening,
+            'subscribers': len(self._subscribers),
+            'received': self.received,
+            'reconnects': self.reconnects,
+            'overflowed': sum(1 for subscription in self._subscribers if subscription.overflowed),
+        }
+
+
+def format_sse(message: dict) -> bytes:
+    return (f'id: {message["id"]}\nevent: {message["event"]}\ndata: '.encode()
+            + codec.dumps(message['data']) + b'\n\n')
+
+
+event_broker = EventBroker(
+    dsn=settings.DATABASE_URL.replace('postgresql+asyncpg://', 'postgresql://'),
+    channel=SUBJECTS_CHANNEL,
+    queue_size=settings.EVENTS_QUEUE_SIZE,
+)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from pydantic import BaseModel
+from sqlalchemy import insert
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.db.connection import async_session_maker
+from src.db.events import SUBJECTS_CHANNEL, notify
+from src.db.timeouts import statement_timeout_ctx
+from src.models import SubjectsORM
+from src.schemes import subjects
+
+logger = logging.getLogger('Буфер записи')
+
+
+class IngestQueue:
+    """
+    Буферизованная запись: создания копятся в очереди процесса и пишутся одной вставкой
+    на пачку, когда набралось batch_size штук или прошло flush_ms с первой в пачке.
+    Каждый запрос ждёт commit своей пачки и получает свою строку с id
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession], model: type, read_schema: type[BaseModel],
+                 batch_size: int, flush_ms: float, events_channel: str | None = None,
+                 statement_timeout_ms: int | None = None):
+        self.session_factory = session_factory
+        self.model = model
+        self.read_schema = read_schema
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.events_channel = events_channel
+        self.statement_timeout_ms = statement_timeout_ms
+        self._queue: asyncio.Queue[tuple[dict, asyncio.Future]] | None = None
+        self._task: asyncio.Task | None = None
+
+        self.batches = 0
+        self.items = 0
+        self.failed_batches = 0
+        self.max_batch = 0
+        self.flush_time_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info('Буфер записи запущен: пачка до %s, не дольше %s мс', self.batch_size, self.flush_ms)
+
+    async def stop(self):
+        """Дописывает всё, что уже в очереди, и останавливает фоновую задачу"""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info('Буфер записи остановлен')
+
+    async def submit(self, create_data: BaseModel, request_id: str | None = None):
+        if not self.running:
+            raise RuntimeError('Буфер записи не запущен')
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((create_data.model_dump(exclude_unset=True), future))
+        logger.debug('%s | Создание поставлено в очередь, в очереди %s', request_id, self._queue.qsize())
+        return await future
+
+    async def _collect(self) -> list[tuple[dict, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_ms / 1000
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        # Фоновая задача не проходит через зависимость эндпоинта, дедлайн вставки задаётся здесь
+        statement_timeout_ctx.set(self.statement_timeout_ms)
+        while True:
+            batch = await self._collect()
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # Задача одна на процесс: после её смерти все следующие submit висели бы вечно
+                logger.error('Необработанная ошибка пачки из %s', len(batch), exc_info=e)
+                self._fail(batch, e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _fail(batch: list[tuple[dict, asyncio.Future]], e: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+
+    async def _flush(self, batch: list[tuple[dict, asyncio.Future]]):
+        # Запросы, которые уже отменены клиентом, в пачку не попадают
+        batch = [(data, future) for data, future in batch if not future.done()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        try:
+            fields = list(self.read_schema.model_fields)
+            query = insert(self.model).returning(*(getattr(self.model, name) for name in fields),
+                                                 sort_by_parameter_order=True)
+            async with self.session_factory() as session:
+                result = await session.execute(query, [data for data, _ in batch])
+                rows = [dict(zip(fields, row)) for row in result]
+                if self.events_channel is not None:
+                    await notify(session, self.events_channel, 'create', rows)
+                await session.commit()
+            created = [self.read_schema.model_validate(row) for row in rows]
+        except Exception as e:
+            self.failed_batches += 1
+            if isinstance(e, (OperationalError, InterfaceError)):
+                logger.critical('База данных недоступна, пачка из %s не записана: %s', len(batch), e)
+                e = ConnectionError(f'База данных недоступна: {e}')
+            else:
+                logger.error('Ошибка записи пачки из %s', len(batch), exc_info=e)
+            self._fail(batch, e)
+            return
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.items += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        self.flush_time_ms += elapsed
+        logger.debug('Записана пачка из %s за %.1f мс', len(batch), elapsed)
+
+        for (_, future), subject in zip(batch, created):
+            if not future.done():
+                future.set_result(subject)
+
+    def stats(self) -> dict:
+        return {
+            'running': self.running,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'batch_size': self.batch_size,
+            'flush_ms': self.flush_ms,
+            'batches': self.batches,
+            'items': self.items,
+            'failed_batches': self.failed_batches,
+            'max_batch': self.max_batch,
+            'avg_batch': round(self.items / self.batches, 2) if self.batches else None,
+            'avg_flush_ms': round(self.flush_time_ms / self.batches, 3) if self.batches else None,
+        }
+
+
+ingest_queue = IngestQueue(
+    session_factory=async_session_maker,
+    model=SubjectsORM,
+    read_schema=subjects.ReadSubjects,
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_ms=settings.INGEST_FLUSH_MS,
+    events_channel=SUBJECTS_CHANNEL,
+    statement_timeout_ms=settings.DB_STATEMENT_TIMEOUTS_MS.get('write'),
+)
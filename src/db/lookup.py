@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.db.base import BaseManager
+from src.db.connection import async_session_maker, engine, replica_router
+from src.db.subjectsManager import subjects_manager
+
+logger = logging.getLogger('Склейка чтений')
+
+
+def make_lookup_session(primary: bool) -> AsyncSession:
+    return async_session_maker(bind=engine if primary else replica_router.pick())
+
+
+class GetCoalescer:
+    """
+    Получение по одному id, склеенное в пачки: запросы, пришедшие в окне window_ms
+    с первого, уходят в бд одним get_many. Повторяющиеся id запрашиваются один раз.
+    Чтения с основной бд (после записи клиента) и с реплик склеиваются отдельно
+    """
+
+    def __init__(self, session_factory: Callable[[bool], AsyncSession], manager: BaseManager,
+                 window_ms: float, batch_size: int):
+        self.session_factory = session_factory
+        self.manager = manager
+        self.window_ms = window_ms
+        self.batch_size = batch_size
+        self._pending: dict[bool, dict[int, list[asyncio.Future]]] = {}
+        self._timers: dict[bool, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.requests = 0
+        self.ids = 0
+        self.max_batch = 0
+        self.failed_batches = 0
+        self.fetch_time_ms = 0.0
+
+    async def load(self, entity_id: int, primary: bool = False, request_id: str | None = None) -> BaseModel | None:
+        """None - объекта с таким id нет"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        group = self._pending.setdefault(primary, {})
+        group.setdefault(entity_id, []).append(future)
+        self.requests += 1
+
+        if len(group) >= self.batch_size:
+            self._dispatch(primary)
+        elif primary not in self._timers:
+            self._timers[primary] = loop.call_later(self.window_ms / 1000, self._dispatch, primary)
+        logger.debug('%s | id=%s ждёт пачку, в пачке %s', request_id, entity_id, len(group))
+        return await future
+
+    def _dispatch(self, primary: bool):
+        timer = self._timers.pop(primary, None)
+        if timer is not None:
+            timer.cancel()
+        group = self._pending.pop(primary, None)
+        if not group:
+            return
+        task = asyncio.get_running_loop().create_task(self._fetch(group, primary))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, group: dict[int, list[asyncio.Future]], primary: bool):
+        # Отменённые клиентом запросы в пачку не попадают
+        group = {entity_id: futures for entity_id, futures in group.items()
+                 if any(not future.done() for future in futures)}
+        if not group:
+            return
+
+        started = time.perf_counter()
+        try:
+            async with self.session_factory(primary) as session:
+                found = await self.manager.get_many(list(group), session, 'coalescer')
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error('Ошибка получения пачки из %s id', len(group), exc_info=e)
+            for futures in group.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.ids += len(group)
+        self.max_batch = max(self.max_batch, len(group))
+        self.fetch_time_ms += elapsed
+        logger.debug('Пачка из %s id получена за %.1f мс, найдено %s', len(group), elapsed, len(found))
+
+        for entity_id, futures in group.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(found.get(entity_id))
+
+    def stats(self) -> dict:
+        return {
+            'enabled': settings.LOOKUP_COALESCE,
+            'window_ms': self.window_ms,
+            'batch_size': self.batch_size,
+            'pending': sum(len(group) for group in self._pending.values()),
+            'requests': self.requests,
+            'batches': self.batches,
+            'ids': self.ids,
+            'failed_batches': self.failed_batches,
+            'max_batch': self.max_batch,
+            'avg_batch': round(self.ids / self.batches, 2) if self.batches else None,
+            'avg_fetch_ms': round(self.fetch_time_ms / self.batches, 3) if self.batches else None,
+        }
+
+
+subject_coalescer = GetCoalescer(
+    session_factory=make_lookup_session,
+    manager=subjects_manager,
+    window_ms=settings.LOOKUP_COALESCE_MS,
+    batch_size=settings.LOOKUP_BATCH_SIZE,
+)
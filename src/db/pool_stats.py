@@ -0,0 +1,79 @@
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def _percentiles(values, points=(50, 95, 99)) -> dict:
+    if not values:
+        return {f'p{p}': None for p in points}
+    ordered = sorted(values)
+    return {f'p{p}': ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points}
+
+
+class PoolStats:
+    """
+    Счётчики пула по событиям: сколько соединений занято в момент выдачи и сколько их держат.
+    По перцентилям занятых соединений подбирается DB_POOL_SIZE
+    """
+
+    def __init__(self, engine: Engine, window: int = 10000):
+        self.engine = engine
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.exhausted_checkouts = 0
+        self.peak_checked_out = 0
+        self.checked_out_samples: deque[int] = deque(maxlen=window)
+        self.hold_times_ms: deque[float] = deque(maxlen=window)
+
+        for name, listener in self._listeners():
+            event.listen(engine, name, listener)
+
+    def _listeners(self):
+        return [('connect', self._on_connect), ('checkout', self._on_checkout),
+                ('checkin', self._on_checkin), ('invalidate', self._on_invalidate)]
+
+    def detach(self):
+        for name, listener in self._listeners():
+            event.remove(self.engine, name, listener)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        pool = self.engine.pool
+        checked_out = pool.checkedout()
+        self.checkouts += 1
+        self.peak_checked_out = max(self.peak_checked_out, checked_out)
+        self.checked_out_samples.append(checked_out)
+        if checked_out > pool.size():
+            self.exhausted_checkouts += 1
+        connection_record.info['checkout_at'] = time.perf_counter()
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        started = connection_record.info.pop('checkout_at', None)
+        if started is not None:
+            self.hold_times_ms.append((time.perf_counter() - started) * 1000)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        pool = self.engine.pool
+        hold = _percentiles(self.hold_times_ms)
+        return {
+            'url': self.engine.url.render_as_string(hide_password=True),
+            'pool_size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': pool.overflow(),
+            'peak_checked_out': self.peak_checked_out,
+            'checkouts': self.checkouts,
+            'checkouts_over_pool_size': self.exhausted_checkouts,
+            'connects': self.connects,
+            'invalidations': self.invalidations,
+            'checked_out_at_checkout': _percentiles(self.checked_out_samples),
+            'hold_time_ms': {key: round(value, 3) if value is not None else None for key, value in hold.items()},
+        }
@@ -0,0 +1,107 @@
+import logging
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.config import settings
+from src.utils.request_context import request_id_ctx
+
+logger = logging.getLogger('Медленные запросы')
+
+
+class SlowQueryLog:
+    """
+    Замеряет время каждого запроса через события движка и складывает медленные
+    в ограниченный кольцевой буфер, для части из них снимает план EXPLAIN (ANALYZE, BUFFERS)
+    """
+
+    def __init__(self, threshold_ms: float, explain_sample_rate: float, redact_params: bool, size: int):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.redact_params = redact_params
+        self.entries: deque[dict] = deque(maxlen=size)
+
+    def attach(self, engine: Engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def get_entries(self, limit: int | None = None) -> list[dict]:
+        entries = list(reversed(self.entries))
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        self.entries.clear()
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.slow_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'slow_query_start', None)
+        if started is None:
+            return
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        request_id = request_id_ctx.get()
+        plan = None
+        if not executemany and self._is_select(statement) and random.random() < self.explain_sample_rate:
+            plan = self._explain(conn, statement, parameters, request_id)
+
+        self.entries.append({
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'request_id': request_id,
+            'duration_ms': round(duration_ms, 2),
+            'statement': statement,
+            'parameters': self._format_params(parameters),
+            'plan': plan,
+        })
+        logger.warning('%s | Медленный запрос %.1f мс: %s', request_id, duration_ms, statement)
+
+    @staticmethod
+    def _is_select(statement: str) -> bool:
+        # EXPLAIN ANALYZE выполняет запрос повторно, поэтому только для чтения. WITH может содержать
+        # INSERT/UPDATE/DELETE, поэтому _explain всё равно откатывает повтор
+        return statement.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+    def _format_params(self, parameters):
+        if not self.redact_params or parameters is None:
+            return repr(parameters)
+        if isinstance(parameters, dict):
+            return {key: type(value).__name__ for key, value in parameters.items()}
+        if isinstance(parameters, (list, tuple)):
+            return [type(value).__name__ for value in parameters]
+        return type(parameters).__name__
+
+    @staticmethod
+    def _explain(conn, statement: str, parameters, request_id: str | None) -> str | None:
+        # Отдельный курсор, чтобы не затереть результат исходного запроса, и savepoint,
+        # который откатывается всегда: ни ошибка EXPLAIN, ни повторные изменения данных не остаются в транзакции
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        except Exception as e:
+            logger.error('%s | Не удалось получить план медленного запроса', request_id, exc_info=e)
+            return None
+        finally:
+            cursor.close()
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+    explain_sample_rate=settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+    redact_params=settings.SLOW_QUERY_REDACT_PARAMS,
+    size=settings.SLOW_QUERY_LOG_SIZE,
+)
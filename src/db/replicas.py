@@ -0,0 +1,86 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger('Реплики')
+
+# Если реплика догнала весь полученный wal, считаем отставание нулевым,
+# иначе время с последней применённой транзакции. На основной бд обе функции дают NULL
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+
+    def __init__(self, engine: AsyncEngine, check_interval: float):
+        self.engine = engine
+        self.check_interval = check_interval
+        self.lag: float | None = None
+        self.checked_at = 0.0
+        self._refresh_task: asyncio.Task | None = None
+
+    @property
+    def name(self) -> str:
+        return self.engine.url.render_as_string(hide_password=True)
+
+    def get_lag(self) -> float | None:
+        """
+        Отставание в секундах по последней проверке, None если реплика недоступна или ещё не проверялась.
+        Устаревшее значение обновляется в фоне, чтобы запрос не ждал проверку
+        """
+        stale = time.monotonic() - self.checked_at >= self.check_interval
+        if stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self.lag
+
+    async def refresh(self) -> float | None:
+        try:
+            async with self.engine.connect() as conn:
+                self.lag = float((await conn.execute(LAG_QUERY)).scalar() or 0)
+        except Exception as e:
+            logger.warning('Реплика %s недоступна: %s', self.name, e)
+            self.lag = None
+        self.checked_at = time.monotonic()
+        return self.lag
+
+
+class ReplicaRouter:
+    """
+    Раздаёт чтение по репликам по кругу, пропуская недоступные и отставшие больше max_lag.
+    Если подходящих нет - чтение идёт в основную бд, в том числе пока реплики ещё не проверены
+    """
+
+    def __init__(self, primary: AsyncEngine, replicas: list[AsyncEngine], max_lag: float, check_interval: float):
+        self.primary = primary
+        self.replicas = [Replica(engine, check_interval) for engine in replicas]
+        self.max_lag = max_lag
+        self._counter = itertools.count()
+
+    def pick(self) -> AsyncEngine:
+        if not self.replicas:
+            return self.primary
+
+        start = next(self._counter)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            lag = replica.get_lag()
+            if lag is not None and lag <= self.max_lag:
+                return replica.engine
+
+        logger.warning('Нет реплик с отставанием до %s с, читаем с основной бд', self.max_lag)
+        return self.primary
+
+    def status(self) -> list[dict]:
+        return [{'replica': replica.name, 'lag_s': replica.lag} for replica in self.replicas]
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
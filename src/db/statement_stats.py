@@ -0,0 +1,76 @@
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import CacheStats
+
+# Статусы кеша компиляции SQLAlchemy, как их показывает echo движка
+_COMPILED_STATUS = {
+    CacheStats.CACHE_HIT: 'hit',
+    CacheStats.CACHE_MISS: 'miss',
+    CacheStats.CACHING_DISABLED: 'disabled',
+    CacheStats.NO_CACHE_KEY: 'no_key',
+    CacheStats.NO_DIALECT_SUPPORT: 'no_dialect_support',
+}
+
+
+def _rate(hits: int, total: int) -> float | None:
+    return round(hits / total, 4) if total else None
+
+
+class StatementStats:
+    """
+    Попадания в кеш компиляции SQLAlchemy и в кеш подготовленных выражений asyncpg по каждому запросу.
+    Промахи при стабильной нагрузке значат, что текст запросов каждый раз разный
+    """
+
+    def __init__(self, engine: Engine, max_shapes: int = 10000):
+        self.engine = engine
+        self.max_shapes = max_shapes
+        self.compiled: Counter[str] = Counter()
+        self.prepared: Counter[str] = Counter()
+        self.shapes: set[int] = set()
+
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def detach(self):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        status = _COMPILED_STATUS.get(getattr(context, 'cache_hit', None), 'other')
+        self.compiled[status] += 1
+
+        # Кеш выражений живёт в адаптере соединения asyncpg, ключ - текст запроса
+        cache = getattr(conn.connection.dbapi_connection, '_prepared_statement_cache', None)
+        if cache is None:
+            self.prepared['disabled'] += 1
+        else:
+            self.prepared['hit' if statement in cache else 'miss'] += 1
+
+        # Разные тексты считаются только у запросов из конструкций SQLAlchemy, без служебных SAVEPOINT и т.п.
+        if status in ('hit', 'miss') and len(self.shapes) < self.max_shapes:
+            self.shapes.add(hash(statement))
+
+    def reset(self):
+        self.compiled.clear()
+        self.prepared.clear()
+        self.shapes.clear()
+
+    def snapshot(self) -> dict:
+        compiled_cache = getattr(self.engine, '_compiled_cache', None)
+        compiled_total = sum(self.compiled.values())
+        prepared_total = sum(self.prepared.values())
+        return {
+            'url': self.engine.url.render_as_string(hide_password=True),
+            'compiled_cache': {
+                **self.compiled,
+                'hit_rate': _rate(self.compiled['hit'], compiled_total),
+                'size': len(compiled_cache) if compiled_cache is not None else None,
+                'capacity': getattr(compiled_cache, 'capacity', None),
+            },
+            'prepared_statements': {
+                **self.prepared,
+                'hit_rate': _rate(self.prepared['hit'], prepared_total - self.prepared['disabled']),
+            },
+            'distinct_compiled_statements': len(self.shapes),
+        }
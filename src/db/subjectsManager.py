@@ -1,15 +1,22 @@
 import logging
-from datetime import datetime, timedelta, time
+import math
+from datetime import date, datetime, timedelta, time
 
 from fastapi import HTTPException, status
-from sqlalchemy import select, and_, func, or_, text, DateTime, Date, literal, union_all
+from sqlalchemy import select, and_, func, or_, text, DateTime, Date, Float, cast, case, literal, literal_column, union_all
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY, array
 from sqlalchemy.exc import InterfaceError, OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.config import settings
 from src.db.base import BaseManager
+from src.db.events import SUBJECTS_CHANNEL
 from src.schemes import subjects
 from src.models import SubjectsORM
-from src.utils.filters_db import build_filters
+from src.utils import codec
+from src.utils.filters_db import build_filters, filter_params, filter_template
+from src.utils.sketch import LogSketch
 
 logger = logging.getLogger('Бд')
 
@@ -20,62 +27,91 @@ SubjectsORM]):
     create_schema = subjects.CreateSubjects
     read_schema = subjects.ReadSubjects
     update_schema = subjects.UpdateSubjects
+    events_channel = SUBJECTS_CHANNEL
 
     async def get_with_filters(
             self,
             session: AsyncSession,
             request_id: str,
             **filters
-    ) -> list[read_schema]:
+    ) -> list[dict]:
+        """
+        Строки отдаются словарями с полями ReadSubjects без создания объектов orm и pydantic,
+        их сразу кодирует src.utils.codec
+        """
 
-        logger.debug(f'{request_id} | Начинаем получение Subject с фильтрами')
+        logger.debug('%s | Начинаем получение Subject с фильтрами', request_id)
 
         try:
-            logger.debug(f'{request_id} | Создание фильтров')
-            filters = build_filters(
-                self.model,
-                **filters
-            )
-            logger.debug(f'{request_id} | Фильтры успешно созданы')
-        except Exception as e:
-            logger.error(f'{request_id} | Ошибка при создании фильтров', exc_info=e)
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Filters create failed')
-
-        try:
-            logger.debug(f'{request_id} | Выполнение запроса к бд')
+            logger.debug('%s | Выполнение запроса к бд', request_id)
 
-            query = select(self.model)
-            if filters:
-                query = query.where(and_(*filters))
+            # Шаблон условия по форме фильтров, значения идут параметрами
+            fields = list(self.read_schema.model_fields)
+            query = (select(*(getattr(self.model, name) for name in fields))
+                     .where(filter_template(self.model, **filters)))
 
-            result = await session.execute(query)
-            result = result.scalars().all()
+            result = await session.execute(query, filter_params(**filters))
+            result = [dict(zip(fields, row)) for row in result.tuples()]
 
             if result is None:
-                logger.debug(f'{request_id} | Subjects не было найдено по таким фильтрам')
+                logger.debug('%s | Subjects не было найдено по таким фильтрам', request_id)
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Subjects not found')
 
-            logger.debug(f'{request_id} | Subject успешно получены с фильтрами')
+            logger.debug('%s | Subject успешно получены с фильтрами', request_id)
 
         except HTTPException:
             raise
 
         except (OperationalError, InterfaceError) as e:
             logger.critical(
-                f"{request_id} | База данных недоступна {self.model.__name__}: {e}",
+                "%s | База данных недоступна %s: %s", request_id, self.model.__name__, e,
                 exc_info=True,
             )
             raise ConnectionError(f"{request_id} | База данных недоступна: {e}") from e
 
         except Exception as e:
             logger.error(
-                f"{request_id} |Ошибка при получении {self.model.__name__}: {e}",
+                "%s |Ошибка при получении %s: %s", request_id, self.model.__name__, e,
                 exc_info=True,
             )
             raise
 
-        return [self.read_schema.model_validate(entity, from_attributes=True)
-                for entity in result]
+        return result
+
+    async def count_with_filters(
+            self,
+            session: AsyncSession,
+            request_id: str,
+            estimate: bool = False,
+            **filters
+    ) -> dict:
+        """
+        count(*) по тем же фильтрам, что и список. С estimate сначала берётся оценка планировщика:
+        если она не меньше COUNT_ESTIMATE_MIN_ROWS, она и отдаётся, иначе считается точно -
+        на малых выборках оценка неточная, а точный подсчёт дешёвый
+        """
+        if estimate:
+            # Планировщику нужны сами значения: по шаблону с параметрами он оценивает вслепую
+            conditions = build_filters(self.model, **filters)
+            query = select(literal(1)).select_from(self.model)
+            if conditions:
+                query = query.where(and_(*conditions))
+            estimated = await self._planner_rows(session, query)
+            logger.debug('%s | Оценка планировщика: %s строк', request_id, estimated)
+            if estimated >= settings.COUNT_ESTIMATE_MIN_ROWS:
+                return {'count': estimated, 'exact': False}
+
+        query = select(func.count()).select_from(self.model).where(filter_template(self.model, **filters))
+        return {'count': await session.scalar(query, filter_params(**filters)), 'exact': True}
+
+    @staticmethod
+    async def _planner_rows(session: AsyncSession, query) -> int:
+        # Значения фильтров уже проверены типами запроса (числа, даты, bool), их можно встроить в текст
+        compiled = query.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+        plan = await session.scalar(text(f'EXPLAIN (FORMAT JSON) {compiled}'))
+        if isinstance(plan, (str, bytes)):
+            plan = codec.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
 
     async def get_subjects_statistics(
             self,
@@ -84,7 +120,7 @@ SubjectsORM]):
             end_date: datetime,
             request_id: str,
     ):
-        logger.debug(f'{request_id} | Получение даты')
+        logger.debug('%s | Получение даты', request_id)
         try:
             if start_date is None:
                 first_date_query = select(func.min(SubjectsORM.create_at))
@@ -95,13 +131,13 @@ SubjectsORM]):
             if end_date is None:
                 end_date = datetime.now()
         except Exception as e:
-            logger.error(f'{request_id} | ошибка в получении периода', exc_info=e)
-        logger.debug(f'{request_id} | Период получен')
+            logger.error('%s | ошибка в получении периода', request_id, exc_info=e)
+        logger.debug('%s | Период получен', request_id)
 
         start_of_day = datetime.combine(start_date.date(), time.min)
         end_of_day = datetime.combine(end_date.date(), time.max)
 
-        logger.debug(f'{request_id} | Начинаем получение статистики')
+        logger.debug('%s | Начинаем получение статистики', request_id)
 
         added_count_query = select(func.count(SubjectsORM.id)).where(
             and_(
@@ -159,7 +195,7 @@ SubjectsORM]):
         time_stats_result = await session.execute(time_stats_query)
         time_stats = time_stats_result.first()
 
-        logger.debug(f'{request_id} | Получаем дни')
+        logger.debug('%s | Получаем дни', request_id)
         try:
             extreme_days = await self._get_extreme_days(session, start_of_day, end_of_day, request_id)
             max_subjects_day = extreme_days.get('max_subjects') or {'date': None, 'count': 0}
@@ -185,9 +221,9 @@ SubjectsORM]):
                     "weight": round(min_weight_day['total_weight'], 2)
                 }
             }
-            logger.debug(f'{request_id} | Статистика по дням получена')
+            logger.debug('%s | Статистика по дням получена', request_id)
         except Exception as e:
-            logger.error(f'{request_id} | Ошибка в получении дней', exc_info=e)
+            logger.error('%s | Ошибка в получении дней', request_id, exc_info=e)
             day_stats = {}
 
         result = {
@@ -211,6 +247,277 @@ SubjectsORM]):
         result.update(day_stats)
         return result
 
+    async def get_inventory(self, session: AsyncSession, since: date, request_id: str | None = None) -> dict:
+        """Сколько сейчас лежит и сколько весит, плюс добавленные и удалённые по дням с since"""
+        logger.debug('%s | Считаем остатки по бд', request_id)
+
+        totals = (await session.execute(
+            select(func.count(self.model.id), func.coalesce(func.sum(self.model.weight), 0))
+            .where(self.model.is_active == True)
+        )).one()
+
+        since_at = datetime.combine(since, time.min)
+        added_day = cast(self.model.create_at, Date).label('day')
+        added = await session.execute(
+            select(added_day, func.count(self.model.id))
+            .where(self.model.create_at >= since_at)
+            .group_by(added_day)
+        )
+        deleted_day = cast(self.model.delete_at, Date).label('day')
+        deleted = await session.execute(
+            select(deleted_day, func.count(self.model.id))
+            .where(self.model.delete_at >= since_at, self.model.is_active == False)
+            .group_by(deleted_day)
+        )
+
+        days: dict[str, dict[str, int]] = {}
+        for event, rows in (('added', added), ('deleted', deleted)):
+            for day, count in rows:
+                days.setdefault(day.isoformat(), {'added': 0, 'deleted': 0})[event] = count
+
+        return {
+            'active_count': totals[0],
+            'total_weight': round(float(totals[1]), 2),
+            'days': days,
+        }
+
+    async def get_histogram(
+            self,
+            session: AsyncSession,
+            request_id: str,
+            field: str,
+            scale: str,
+            buckets: int,
+            edges: list[float] | None = None,
+            lower: float | None = None,
+            upper: float | None = None,
+            **filters
+    ) -> dict:
+        """
+        Гистограмма одним запросом через width_bucket, из бд приходит только таблица корзин.
+        scale: fixed - равные корзины, log - равные в логарифме, edges - свои границы.
+        Корзина 0 и последняя за диапазоном - значения вне границ, если границы заданы явно
+        """
+        logger.debug('%s | Строим гистограмму %s, %s', request_id, field, scale)
+
+        column = getattr(self.model, field)
+        conditions = [filter_template(self.model, **filters)]
+        params = filter_params(**filters)
+
+        if scale == 'edges':
+            bucket = func.width_bucket(column, cast(array(edges), ARRAY(Float)))
+            query = (select(bucket.label('bucket'), func.count().label('count'), func.sum(column).label('sum'))
+                     .where(*conditions)
+                     .group_by(text('bucket')))
+            rows = (await session.execute(query, params)).all()
+            return self._histogram_table(rows, edges)
+
+        if scale == 'log':
+            conditions.append(column > 0)
+            value = func.ln(column)
+            to_scale, from_scale = math.log, math.exp
+        else:
+            value = column
+            to_scale = from_scale = float
+
+        # Не заданные границы берутся из данных в том же запросе, но не заходят за явно заданную:
+        # если все данные по другую сторону от неё, диапазон вырождается в точку
+        bounds = select(func.min(value).label('lower'), func.max(value).label('upper')).where(*conditions).cte('bounds')
+        lower_expr = bounds.c.lower if lower is None else literal(to_scale(lower), Float)
+        upper_expr = bounds.c.upper if upper is None else literal(to_scale(upper), Float)
+        if lower is None and upper is not None:
+            lower_expr = func.least(lower_expr, upper_expr)
+        if upper is None and lower is not None:
+            upper_expr = func.greatest(upper_expr, lower_expr)
+
+        bucket = func.width_bucket(value, lower_expr, upper_expr, buckets)
+        if upper is None:
+            # Максимум попадает в правую границу, а не за неё
+            bucket = func.least(bucket, buckets)
+        # В вырожденном диапазоне одна корзина, значения по сторонам от неё - за границами
+        bucket = case((upper_expr > lower_expr, bucket),
+                      (value < lower_expr, 0),
+                      (value > upper_expr, 2),
+                      else_=1).label('bucket')
+
+        source = self.model.__table__
+        if lower is None or upper is None:
+            source = source.join(bounds, literal(True))
+        query = (select(bucket, func.count().label('count'), func.sum(column).label('sum'),
+                        lower_expr.label('range_lower'), upper_expr.label('range_upper'))
+                 .select_from(source)
+                 .where(*conditions)
+                 .group_by(text('bucket'), text('range_lower'), text('range_upper')))
+        rows = (await session.execute(query, params)).all()
+        if not rows:
+            return self._histogram_table([], [])
+
+        low, high = rows[0].range_lower, rows[0].range_upper
+        if high <= low:
+            high = low
+            buckets = 1
+        step = (high - low) / buckets
+        table_edges = [from_scale(low + step * i) for i in range(buckets)] + [from_scale(high)]
+        return self._histogram_table(rows, table_edges)
+
+    @staticmethod
+    def _histogram_table(rows, edges: list[float]) -> dict:
+        counts = {row.bucket: (row.count, float(row.sum or 0)) for row in rows}
+
+        def cell(index: int) -> dict:
+            count, total = counts.get(index, (0, 0.0))
+            return {'count': count, 'sum': round(total, 2)}
+
+        return {
+            'total_count': sum(count for count, _ in counts.values()),
+            'total_sum': round(sum(total for _, total in counts.values()), 2),
+            'buckets': [{'lower': round(edges[i - 1], 6), 'upper': round(edges[i], 6), **cell(i)}
+                        for i in range(1, len(edges))],
+            'underflow': cell(0),
+            'overflow': cell(len(edges)),
+        }
+
+    async def get_settled_before(self, session: AsyncSession) -> datetime:
+        """
+        Момент, раньше которого данные уже не меняются. Считается по часам бд, как и create_at:
+        now() - начало транзакции, поэтому строка может зафиксироваться позже своего create_at не больше
+        чем на дедлайн записи, а на реплику попасть ещё не больше чем через DB_REPLICA_MAX_LAG_S
+        """
+        write_timeout_ms = settings.DB_STATEMENT_TIMEOUTS_MS.get('write') or settings.WEB_TIMEOUT_S * 1000
+        margin = timedelta(milliseconds=write_timeout_ms, seconds=settings.DB_REPLICA_MAX_LAG_S)
+        db_now = await session.scalar(select(cast(func.clock_timestamp(), DateTime)))
+        return db_now - margin
+
+    async def get_timeseries(
+            self,
+            session: AsyncSession,
+            bucket: str,
+            first: datetime,
+            last: datetime,
+            end: datetime,
+            request_id: str | None = None,
+    ) -> list[dict]:
+        """
+        Ряд по корзинам date_trunc от first до last включительно одним запросом:
+        добавлено и удалено в корзине, а сколько лежит и сколько весит на конец корзины -
+        остаток до first плюс накопленная сумма окном. end - конец последней корзины
+        """
+        logger.debug('%s | Считаем ряд по %s с %s по %s', request_id, bucket, first, last)
+        step = literal_column(f"interval '1 {bucket}'")
+
+        series = select(func.generate_series(first, last, step).label('bucket')).cte('series')
+
+        def per_bucket(name: str, column, *where):
+            bucket_column = func.date_trunc(bucket, column).label('bucket')
+            return (select(bucket_column, func.count().label('count'), func.sum(self.model.weight).label('weight'))
+                    .where(column >= first, column < end, *where)
+                    .group_by(text('bucket'))
+                    .cte(name))
+
+        added = per_bucket('added', self.model.create_at)
+        deleted = per_bucket('deleted', self.model.delete_at, self.model.delete_at.isnot(None))
+        base = (select(func.count().label('count'), func.coalesce(func.sum(self.model.weight), 0).label('weight'))
+                .where(self.model.create_at < first,
+                       or_(self.model.delete_at.is_(None), self.model.delete_at >= first))
+                .cte('base'))
+
+        added_count = func.coalesce(added.c.count, 0)
+        deleted_count = func.coalesce(deleted.c.count, 0)
+        net_weight = func.coalesce(added.c.weight, 0) - func.coalesce(deleted.c.weight, 0)
+        order = {'order_by': series.c.bucket}
+
+        query = (select(series.c.bucket,
+                        added_count.label('added'),
+                        deleted_count.label('deleted'),
+                        (base.c.count + func.sum(added_count - deleted_count).over(**order)).label('active_count'),
+                        (base.c.weight + func.sum(net_weight).over(**order)).label('total_weight'))
+                 .select_from(series.join(base, literal(True))
+                              .outerjoin(added, added.c.bucket == series.c.bucket)
+                              .outerjoin(deleted, deleted.c.bucket == series.c.bucket))
+                 .order_by(series.c.bucket))
+
+        result = await session.execute(query)
+        return [{'bucket': row.bucket.isoformat(),
+                 'added': row.added,
+                 'deleted': row.deleted,
+                 'active_count': int(row.active_count),
+                 'total_weight': round(float(row.total_weight), 2)}
+                for row in result]
+
+    def _storage_seconds(self):
+        return func.extract('epoch', self.model.delete_at - self.model.create_at)
+
+    async def get_daily_sketches(
+            self,
+            session: AsyncSession,
+            first_day: date,
+            last_day: date,
+            alpha: float,
+            request_id: str | None = None,
+    ) -> dict[date, dict[str, LogSketch]]:
+        """
+        Скетчи по дням одним запросом: вес и длина по дню создания, время хранения по дню удаления.
+        Корзины считаются в бд, наружу уходят только пары (корзина, количество)
+        """
+        logger.debug('%s | Считаем скетчи с %s по %s', request_id, first_day, last_day)
+        log_gamma = literal_column(repr(math.log((1 + alpha) / (1 - alpha))))
+        start = datetime.combine(first_day, time.min)
+        end = datetime.combine(last_day, time.max)
+
+        def bucket(value):
+            return case((value > 0, func.ceil(func.ln(value) / log_gamma)), else_=None).label('bucket')
+
+        def daily(metric: str, value, day_column, *where):
+            return (select(cast(day_column, Date).label('day'), literal_column(f"'{metric}'").label('metric'),
+                           bucket(value), func.count().label('count'))
+                    .where(day_column >= start, day_column <= end, *where)
+                    .group_by(text('day'), text('bucket')))
+
+        query = union_all(
+            daily('weight', self.model.weight, self.model.create_at),
+            daily('length', self.model.length, self.model.create_at),
+            daily('time_in_storage_s', self._storage_seconds(), self.model.delete_at,
+                  self.model.delete_at.isnot(None)),
+        )
+        result = await session.execute(query)
+
+        sketches: dict[date, dict[str, LogSketch]] = {}
+        for day, metric, key, count in result:
+            day_sketches = sketches.setdefault(day, {})
+            sketch = day_sketches.setdefault(metric, LogSketch(alpha))
+            sketch.add_bucket(None if key is None else int(key), count)
+        return sketches
+
+    async def get_exact_percentiles(
+            self,
+            session: AsyncSession,
+            start: datetime,
+            end: datetime,
+            quantiles: list[float],
+            request_id: str | None = None,
+    ) -> dict[str, dict]:
+        """Точные percentile_cont по тем же выборкам, что и скетчи, для сверки"""
+        logger.debug('%s | Считаем точные перцентили', request_id)
+        points = cast(array(quantiles), ARRAY(Float))
+
+        created = (await session.execute(
+            select(func.percentile_cont(points).within_group(self.model.weight),
+                   func.percentile_cont(points).within_group(self.model.length),
+                   func.count(self.model.id))
+            .where(self.model.create_at >= start, self.model.create_at <= end)
+        )).one()
+        storage = self._storage_seconds()
+        deleted = (await session.execute(
+            select(func.percentile_cont(points).within_group(storage), func.count(self.model.id))
+            .where(self.model.delete_at >= start, self.model.delete_at <= end, self.model.delete_at.isnot(None))
+        )).one()
+
+        return {
+            'weight': (created[0], created[2]),
+            'length': (created[1], created[2]),
+            'time_in_storage_s': (deleted[0], deleted[1]),
+        }
+
     @staticmethod
     async def _get_extreme_days(
             session: AsyncSession,
@@ -218,58 +525,65 @@ SubjectsORM]):
             end_date: datetime,
             request_id: str
     ):
-        logger.debug(f'{request_id} | Ищем дни')
-
-        dates = []
-        current_date = start_date.date()
-        while current_date <= end_date.date():
-            dates.append(current_date)
-            current_date += timedelta(days=1)
-
-        if not dates:
+        """
+        Сколько объектов лежало и сколько весило в каждый день периода. Лежал в день - создан до конца дня
+        и не удалён до его начала, поэтому на день D это остаток до периода плюс накопленные
+        созданные по D минус удалённые не позже начала D. Один запрос с днями из generate_series:
+        его текст не зависит от длины периода
+        """
+        logger.debug('%s | Ищем дни', request_id)
+
+        first_day, last_day = start_date.date(), end_date.date()
+        if first_day > last_day:
             return {}
 
-        subqueries = []
-
-        for day in dates:
-            day_start = datetime.combine(day, datetime.min.time())
-            day_end = datetime.combine(day, datetime.max.time())
-
-            subquery = select(
-                literal(day).label('date'),
-                func.count(SubjectsORM.id).label('count'),
-                func.coalesce(func.sum(SubjectsORM.weight), 0).label('total_weight')
-            ).where(
-                and_(
-                    SubjectsORM.create_at <= day_end,
-                    or_(
-                        SubjectsORM.delete_at > day_start,
-                        SubjectsORM.delete_at.is_(None),
-                        SubjectsORM.is_active == True
-                    )
-                )
-            )
-            subqueries.append(subquery)
-
-        if len(subqueries) == 1:
-            union_query = subqueries[0]
-        else:
-            union_query = union_all(*subqueries)
-
-        result = await session.execute(union_query)
-        rows = result.all()
-
-        stats_by_date = {day: {'count': 0, 'total_weight': 0.0} for day in dates}
-
-        for row in rows:
-            date = row.date
-            if date in stats_by_date:
-                stats_by_date[date]['count'] = row.count
-                stats_by_date[date]['total_weight'] = float(row.total_weight)
+        first_start = datetime.combine(first_day, time.min)
+        last_start = datetime.combine(last_day, time.min)
+        model = SubjectsORM
+
+        days = select(cast(func.generate_series(first_start, last_start, literal_column("interval '1 day'")),
+                           Date).label('day')).cte('days')
+
+        created_day = cast(model.create_at, Date).label('day')
+        created = (select(created_day, func.count().label('count'), func.sum(model.weight).label('weight'))
+                   .where(model.create_at >= first_start, model.create_at < last_start + timedelta(days=1))
+                   .group_by(created_day)
+                   .cte('created'))
+
+        # Первый день, к началу которого объект уже удалён: удаление ровно в полночь относится к этому дню
+        deleted_day = cast(model.delete_at + literal_column("interval '1 day' - interval '1 microsecond'"),
+                           Date).label('day')
+        is_deleted = and_(model.is_active == False, model.delete_at.isnot(None))
+        deleted = (select(deleted_day, func.count().label('count'), func.sum(model.weight).label('weight'))
+                   .where(is_deleted, model.delete_at > first_start - timedelta(days=1),
+                          model.delete_at <= last_start)
+                   .group_by(deleted_day)
+                   .cte('deleted'))
+
+        deleted_before = and_(is_deleted, model.delete_at <= first_start - timedelta(days=1))
+        base = select(
+            (func.count().filter(model.create_at < first_start)
+             - func.count().filter(deleted_before)).label('count'),
+            (func.coalesce(func.sum(model.weight).filter(model.create_at < first_start), 0)
+             - func.coalesce(func.sum(model.weight).filter(deleted_before), 0)).label('weight'),
+        ).cte('base')
+
+        net_count = func.coalesce(created.c.count, 0) - func.coalesce(deleted.c.count, 0)
+        net_weight = func.coalesce(created.c.weight, 0) - func.coalesce(deleted.c.weight, 0)
+        order = {'order_by': days.c.day}
+        query = (select(days.c.day.label('date'),
+                        (base.c.count + func.sum(net_count).over(**order)).label('count'),
+                        (base.c.weight + func.sum(net_weight).over(**order)).label('total_weight'))
+                 .select_from(days.join(base, literal(True))
+                              .outerjoin(created, created.c.day == days.c.day)
+                              .outerjoin(deleted, deleted.c.day == days.c.day))
+                 .order_by(days.c.day))
+
+        rows = (await session.execute(query)).all()
 
         stats_list = [
-            {'date': date, 'count': data['count'], 'total_weight': data['total_weight']}
-            for date, data in stats_by_date.items()
+            {'date': row.date, 'count': int(row.count), 'total_weight': float(row.total_weight)}
+            for row in rows
         ]
 
         if not stats_list:
@@ -300,7 +614,7 @@ SubjectsORM]):
             'total_weight': min_weight['total_weight']
         }
 
-        logger.debug(f'{request_id} | Экстремальные дни найдены')
+        logger.debug('%s | Экстремальные дни найдены', request_id)
         return result_dict
 
 
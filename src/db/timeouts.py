@@ -0,0 +1,44 @@
+from contextvars import ContextVar
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+# Дедлайн запросов текущего эндпоинта, задаётся зависимостью admit
+statement_timeout_ctx: ContextVar[int | None] = ContextVar('statement_timeout_ms', default=None)
+
+# query_canceled: statement_timeout или отмена запроса на сервере
+QUERY_CANCELED = '57014'
+
+
+@event.listens_for(Session, 'after_begin')
+def _set_statement_timeout(session, transaction, connection):
+    # SET LOCAL живёт до конца транзакции, поэтому соединение возвращается в пул без дедлайна
+    timeout_ms = statement_timeout_ctx.get()
+    if timeout_ms:
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout_ms)}')
+
+
+def _in_chain(exc: BaseException | None, predicate: Callable[[BaseException], bool]) -> bool:
+    """
+    Роутеры заворачивают ошибки бд в HTTPException 500, исходная ошибка остаётся в __context__,
+    поэтому проверяется вся цепочка
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if predicate(exc):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def is_statement_timeout(exc: BaseException | None) -> bool:
+    """Есть ли в цепочке исключений отменённый сервером запрос"""
+    return _in_chain(exc, lambda e: getattr(e, 'sqlstate', None) == QUERY_CANCELED)
+
+
+def is_pool_timeout(exc: BaseException | None) -> bool:
+    """Не дождались свободного соединения в пуле за DB_POOL_TIMEOUT"""
+    return _in_chain(exc, lambda e: isinstance(e, PoolTimeoutError))
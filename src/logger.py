@@ -1,9 +1,15 @@
+import atexit
+import copy
+import json
 import logging
 import sys
 from logging import Formatter, StreamHandler
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 from typing import Optional
 
 from src.config import settings
+from src.utils.request_context import request_id_ctx
 
 
 class ColorFormatter(Formatter):
@@ -26,19 +32,80 @@ class ColorFormatter(Formatter):
         logging.CRITICAL: bold_red + msg + reset
     }
 
+    def __init__(self):
+        super().__init__(self.msg)
+        # Форматтеры собираются один раз, а не на каждую запись
+        self.formatters = {level: Formatter(fmt) for level, fmt in self.FORMATS.items()}
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = Formatter(log_fmt)
+        formatter = self.formatters.get(record.levelno)
+        if formatter is None:
+            return super().format(record)
         return formatter.format(record)
 
 
+class JsonFormatter(Formatter):
+    """
+    Одна запись - одна json строка, request_id отдельным полем
+    """
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', None),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Забирает request_id из контекста запроса, пока запись ещё в потоке event loop
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_ctx.get()
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Кладёт в очередь запись как есть: подстановку args и traceback форматирует поток QueueListener,
+    а не event loop. Стандартный prepare делает это сразу и очищает exc_info.
+    Откладывается только подстановка простых значений: repr объекта (например ORM сущности)
+    из другого потока читает его состояние, которое к тому времени могло измениться или истечь
+    """
+
+    PRIMITIVES = (str, int, float, type(None))
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        args = record.args
+        values = args.values() if isinstance(args, dict) else args or ()
+        if not all(isinstance(value, self.PRIMITIVES) for value in values):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+listener: QueueListener | None = None
+
+
 def setup_logging(name: Optional[str] = None, log_level: str = settings.LOG_LEVEL):
     """
-    Функция для настройки логгера
+    Функция для настройки логгера.
+    Логгер пишет в очередь, а форматирование и вывод в stdout делает QueueListener
+    в отдельном потоке, чтобы не блокировать event loop
     :param name: имя логгера (если None - настраивает корневой логгер)
     :param log_level: уровень логирования
     :return: объект логгера
     """
+    global listener
+
     logger = logging.getLogger(name) if name else logging.getLogger()
 
     if not logger.handlers:
@@ -47,10 +114,18 @@ def setup_logging(name: Optional[str] = None, log_level: str = settings.LOG_LEVE
         logger.handlers.clear()
 
         console_handler = StreamHandler(sys.stdout)
-        console_handler.setFormatter(ColorFormatter())
-        logger.addHandler(console_handler)
+        console_handler.setFormatter(JsonFormatter() if settings.LOG_JSON else ColorFormatter())
+
+        queue = SimpleQueue()
+        queue_handler = DeferredQueueHandler(queue)
+        queue_handler.addFilter(RequestIdFilter())
+        logger.addHandler(queue_handler)
+
+        listener = QueueListener(queue, console_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
 
         if name:
             logger.propagate = False
 
-    return logger
\ No newline at end of file
+    return logger
@@ -1,15 +1,26 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-import uvicorn
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.cors import CORSMiddleware
 
 import src.api.routers.v1 as v1
 from src.config import settings
+from src.db.events import event_broker
+from src.db.ingest import ingest_queue
 from src.logger import setup_logging
+from src.middlewares.compressionMiddleware import CompressionMiddleware
 from src.middlewares.loggingMiddleware import LoggingMiddleware
+from src.service.inventory import inventory_reconciler
 from src.service.redis_conn import redis_client
 from src.utils.check_db import ping_database
+from src.utils.startup import run_checks, startup_stats
+
+startup_stats['import_s'] = round(time.perf_counter() - IMPORT_STARTED, 3)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -17,18 +28,37 @@ async def lifespan(app: FastAPI):
     log = logging.getLogger(__name__)
 
     log.info('Начинается lifespan')
-    await redis_client.connect()
-    await ping_database()
-    log.info('Стартовый lifespan успешно прошёл')
+    started = time.perf_counter()
+    # Бд и редис проверяются параллельно и не дольше STARTUP_TIMEOUT_S
+    errors = await run_checks({'database': ping_database(), 'redis': redis_client.connect()},
+                              settings.STARTUP_TIMEOUT_S, startup_stats['checks'])
+    if errors['database'] is not None:
+        raise errors['database']
+    if errors['redis'] is not None:
+        log.warning('Редис недоступен (%s), стартуем без кеша', errors['redis'])
+        startup_stats['degraded'].append('redis')
+        redis_client.start_reconnect()
+    if settings.INGEST_BUFFERED:
+        ingest_queue.start()
+    inventory_reconciler.start()
+    startup_stats['startup_s'] = round(time.perf_counter() - started, 3)
+    log.info('Стартовый lifespan успешно прошёл: импорт %s с, старт %s с',
+             startup_stats['import_s'], startup_stats['startup_s'])
     yield
+    await inventory_reconciler.stop()
+    await ingest_queue.stop()
+    await event_broker.close()
     await redis_client.close()
     log.info('завершающий lifespan')
 
 app = FastAPI(
         lifespan=lifespan,
+        default_response_class=ORJSONResponse,
     )
 
 app.include_router(v1.subjects_router, prefix='/api')
+app.include_router(v1.internal_router, prefix='/api')
+app.include_router(v1.health_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,11 +68,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(LoggingMiddleware)
 
 if __name__ == "__main__":
-    uvicorn.run(
-        app,
-        host=settings.APP_HOST,
-        port=settings.APP_PORT,
-    )
+    # Тот же запуск, что и в докере: python -m src.serve
+    from src.serve import main
+
+    main()
@@ -0,0 +1,62 @@
+import logging
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.utils.compression import choose_encoding, compress_async, should_compress
+
+
+log = logging.getLogger('Сжатие')
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответ целиком по Accept-Encoding, если он больше порога.
+    Потоковые ответы (SSE) и уже сжатые (готовые байты из кеша) проходят как есть
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start, passthrough
+
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if passthrough or message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start['headers'])
+            body = message.get('body', b'')
+            if (message.get('more_body', False) or 'content-encoding' in headers
+                    or not should_compress(len(body), headers.get('content-type'))):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            compressed = await compress_async(body, encoding)
+            headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(len(compressed))
+            if 'accept-encoding' not in headers.get('vary', '').lower():
+                headers.add_vary_header('Accept-Encoding')
+            log.debug('Ответ сжат %s: %s -> %s байт', encoding, len(body), len(compressed))
+            await send(start)
+            await send({'type': 'http.response.body', 'body': compressed})
+
+        await self.app(scope, receive, send_wrapper)
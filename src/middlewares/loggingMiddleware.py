@@ -5,6 +5,8 @@ import uuid
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 
+from src.utils.request_context import request_id_ctx
+
 
 log = logging.getLogger('ЛогерМиделвеир')
 
@@ -14,11 +16,12 @@ class LoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         request_id = str(uuid.uuid4())
         request.state.request_id = request_id
-        log.info(f"{request_id} | Request")
+        request_id_ctx.set(request_id)
+        log.info("%s | Request", request_id)
         time_start = time.time()
 
         response = await call_next(request)
 
-        log.info(f"{request_id} | Response time = {time.time() - time_start}")
+        log.info("%s | Response time = %s", request_id, time.time() - time_start)
 
         return response
\ No newline at end of file
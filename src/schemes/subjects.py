@@ -1,7 +1,10 @@
 from datetime import datetime
+from typing import Annotated
 
 from pydantic import BaseModel, Field
 
+from src.config import settings
+
 class Subjects(BaseModel):
     length: float = Field(..., gt=0)
     weight: float = Field(..., gt=0)
@@ -16,4 +19,16 @@ class ReadSubjects(Subjects):
     delete_at: datetime | None = None
 
 class UpdateSubjects(Subjects):
-    pass
\ No newline at end of file
+    pass
+
+
+class LookupSubjects(BaseModel):
+    # Те же границы, что у id_max в фильтрах: id вне диапазона колонки не передать в запрос к бд
+    ids: list[Annotated[int, Field(ge=1, le=2147483647)]] = Field(..., min_length=1,
+                                                                  max_length=settings.LOOKUP_MAX_IDS)
+
+
+class LookupResultSubjects(BaseModel):
+    # Найденные в порядке ids из запроса
+    items: list[ReadSubjects]
+    missing: list[int]
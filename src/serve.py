@@ -0,0 +1,103 @@
+"""
+Продовый запуск: gunicorn мастер и uvicorn воркеры.
+
+    python -m src.serve
+    python -m src.serve --workers 8 --no-preload
+    python -m src.serve --print-config
+
+Число воркеров по умолчанию - по доступным процессу CPU с учётом квоты cgroup,
+пул соединений к бд каждого воркера делится из DB_MAX_CONNECTIONS на это число.
+"""
+import argparse
+import importlib.util
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from src.config import settings
+
+def has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+class ServerWorker(UvicornWorker):
+    """uvloop и httptools, если установлены, иначе стандартный asyncio и h11"""
+    CONFIG_KWARGS = {
+        'loop': 'uvloop' if has_module('uvloop') else 'asyncio',
+        'http': 'httptools' if has_module('httptools') else 'h11',
+        'lifespan': 'on',
+        'proxy_headers': True,
+    }
+
+
+def post_fork(server, worker):
+    # При preload движки созданы в мастере: соединения пула не должны переходить в воркер
+    from src.db.connection import engine, replica_router
+
+    engine.sync_engine.dispose(close=False)
+    for replica in replica_router.replicas:
+        replica.engine.sync_engine.dispose(close=False)
+
+
+def build_options(workers: int | None = None, bind: str | None = None, preload: bool | None = None) -> dict:
+    return {
+        'bind': bind or f'{settings.APP_HOST}:{settings.APP_PORT}',
+        'workers': workers or settings.WEB_WORKERS_COUNT,
+        # Полный путь, а не __module__: при python -m src.serve модуль называется __main__
+        'worker_class': 'src.serve.ServerWorker',
+        'preload_app': settings.WEB_PRELOAD if preload is None else preload,
+        'keepalive': settings.WEB_KEEPALIVE_S,
+        'backlog': settings.WEB_BACKLOG,
+        'timeout': settings.WEB_TIMEOUT_S,
+        'graceful_timeout': settings.WEB_GRACEFUL_TIMEOUT_S,
+        'max_requests': settings.WEB_MAX_REQUESTS,
+        'max_requests_jitter': settings.WEB_MAX_REQUESTS_JITTER,
+        'post_fork': post_fork,
+        'loglevel': settings.LOG_LEVEL.lower(),
+    }
+
+
+class Server(BaseApplication):
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from src.main import app
+
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запуск сервиса через gunicorn с uvicorn воркерами')
+    parser.add_argument('--workers', type=int, help='По умолчанию WEB_WORKERS или число CPU')
+    parser.add_argument('--bind', help='host:port, по умолчанию APP_HOST:APP_PORT')
+    parser.add_argument('--preload', action=argparse.BooleanOptionalAction, default=None,
+                        help='Импортировать приложение в мастере до fork, воркеры делят память')
+    parser.add_argument('--print-config', action='store_true', help='Показать итоговые настройки и выйти')
+    args = parser.parse_args()
+
+    options = build_options(args.workers, args.bind, args.preload)
+    # Размер пула в каждом воркере считается от числа воркеров, поэтому оно фиксируется до импорта приложения
+    settings.WEB_WORKERS = options['workers']
+
+    if args.print_config:
+        for key, value in options.items():
+            if not callable(value):
+                print(f'{key} = {value}')
+        print(f"loop = {ServerWorker.CONFIG_KWARGS['loop']}")
+        print(f"http = {ServerWorker.CONFIG_KWARGS['http']}")
+        print(f'db_pool_size = {settings.DB_POOL_SIZE_PER_WORKER}')
+        print(f'db_max_overflow = {settings.DB_MAX_OVERFLOW_PER_WORKER}')
+        return
+
+    Server(options).run()
+
+
+if __name__ == '__main__':
+    main()
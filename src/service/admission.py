@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from typing import AsyncGenerator, Callable
+
+from fastapi import HTTPException, Request
+from starlette import status
+
+from src.config import settings
+from src.db.timeouts import is_pool_timeout, is_statement_timeout, statement_timeout_ctx
+from src.utils.request_context import request_id_ctx
+
+logger = logging.getLogger('Допуск')
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdmissionLimiter:
+    """
+    Не больше limit одновременных запросов группы. Остальные ждут в очереди до queue_size
+    не дольше max_wait_s, а сверх очереди или по истечении ожидания сразу получают отказ:
+    лучше быстрый 503, чем минуты в очереди пула соединений
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait_s: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait_s = max_wait_s
+        self._semaphore = asyncio.Semaphore(limit)
+
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.shed_pool_timeout = 0
+        self.wait_time_ms = 0.0
+        self.timed_out = 0
+        self.client_gone = 0
+
+    async def acquire(self, request_id: str | None = None):
+        if self._semaphore.locked():
+            if self.queued >= self.queue_size:
+                self.shed_queue_full += 1
+                logger.warning('%s | %s: очередь заполнена (%s), отказ', request_id, self.name, self.queued)
+                raise Overloaded(self.name)
+
+            started = time.perf_counter()
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait_s)
+            except asyncio.TimeoutError:
+                self.shed_timeout += 1
+                logger.warning('%s | %s: не дождался очереди за %s с, отказ', request_id, self.name, self.max_wait_s)
+                raise Overloaded(self.name)
+            finally:
+                self.queued -= 1
+            self.wait_time_ms += (time.perf_counter() - started) * 1000
+        else:
+            await self._semaphore.acquire()
+
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'limit': self.limit,
+            'queue_size': self.queue_size,
+            'max_wait_s': self.max_wait_s,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'max_queued': self.max_queued,
+            'admitted': self.admitted,
+            'shed_queue_full': self.shed_queue_full,
+            'shed_timeout': self.shed_timeout,
+            'shed_pool_timeout': self.shed_pool_timeout,
+            'avg_wait_ms': round(self.wait_time_ms / self.admitted, 3) if self.admitted else None,
+            'statement_timeout_ms': settings.DB_STATEMENT_TIMEOUTS_MS.get(self.name) or None,
+            'timed_out': self.timed_out,
+            'client_gone': self.client_gone,
+        }
+
+
+# Группы эндпоинтов по тяжести, лимиты на воркер
+admission_limiters: dict[str, AdmissionLimiter] = {
+    name: AdmissionLimiter(name, limit, limit * settings.ADMISSION_QUEUE_FACTOR, settings.ADMISSION_MAX_WAIT_S)
+    for name, limit in settings.ADMISSION_LIMITS_PER_WORKER.items()
+}
+
+
+def overloaded() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail='Service overloaded, retry later',
+        headers={'Retry-After': str(settings.ADMISSION_RETRY_AFTER_S)},
+    )
+
+
+async def watch_disconnect(request: Request, task: asyncio.Task) -> bool:
+    """
+    Ждёт http.disconnect и отменяет задачу эндпоинта: asyncpg при отмене шлёт серверу cancel,
+    и запрос в бд останавливается. Тело к этому моменту уже прочитано FastAPI
+    """
+    while (await request.receive())['type'] != 'http.disconnect':
+        pass
+    task.cancel()
+    return True
+
+
+def admit(group: str, cancellable: bool = True,
+          buffered: bool = False) -> Callable[..., AsyncGenerator[None, None]]:
+    """
+    Зависимость эндпоинта: держит место в группе, пока выполняется функция эндпоинта,
+    задаёт дедлайн запросов к бд и, если cancellable, отменяет их, когда клиент отключился.
+    Записи не отменяются: после commit ещё сбрасывается кеш, меняется версия данных и счётчики.
+    Если buffered и включён INGEST_BUFFERED, запрос ждёт пачку буфера записи, а не соединение,
+    и место берётся в группе ingest: лимит группы по пулу не дал бы пачке набраться.
+    Подключается с scope='function', чтобы место освобождалось до отправки ответа
+    """
+    for name in (group, 'ingest') if buffered else (group,):
+        if name not in admission_limiters:
+            raise ValueError(f'Нет группы допуска {name}, задайте её в ADMISSION_SHARES или ADMISSION_LIMITS')
+
+    async def dependency(request: Request) -> AsyncGenerator[None, None]:
+        limiter = admission_limiters['ingest' if buffered and settings.INGEST_BUFFERED else group]
+        request_id = request_id_ctx.get()
+        admitted = settings.ADMISSION_ENABLED
+        if admitted:
+            try:
+                await limiter.acquire(request_id)
+            except Overloaded:
+                raise overloaded()
+
+        token = statement_timeout_ctx.set(settings.DB_STATEMENT_TIMEOUTS_MS.get(group) or None)
+        watcher = None
+        if cancellable and settings.DB_CANCEL_ON_DISCONNECT:
+            watcher = asyncio.create_task(watch_disconnect(request, asyncio.current_task()))
+        try:
+            yield
+
+        except asyncio.CancelledError:
+            if watcher is None or not watcher.done() or watcher.cancelled() or watcher.exception() is not None:
+                raise
+            # Отмену запросил watch_disconnect, а не остановка сервера: ответ уже некому отдавать
+            asyncio.current_task().uncancel()
+            limiter.client_gone += 1
+            logger.info('%s | %s: клиент отключился, запрос отменён', request_id, limiter.name)
+            raise HTTPException(status_code=499, detail='Client closed request')
+
+        except Exception as e:
+            if is_pool_timeout(e):
+                limiter.shed_pool_timeout += 1
+                logger.warning('%s | %s: нет свободного соединения в пуле, отказ', request_id, limiter.name)
+                raise overloaded() from e
+            if not is_statement_timeout(e):
+                raise
+            limiter.timed_out += 1
+            logger.warning('%s | %s: запрос к бд не уложился в %s мс', request_id, limiter.name,
+                           statement_timeout_ctx.get())
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail='Database query timeout',
+            ) from e
+
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            statement_timeout_ctx.reset(token)
+            if admitted:
+                limiter.release()
+
+    return dependency
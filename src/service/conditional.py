@@ -0,0 +1,71 @@
+import hashlib
+import logging
+from typing import NamedTuple
+
+from fastapi import HTTPException
+from starlette import status
+
+from src.config import settings
+from src.service.redisManager import DataVersion
+
+logger = logging.getLogger('Условные запросы')
+
+
+def make_etag(version: int, key: str, encoding: str | None = None, weak: bool = False) -> str:
+    """
+    Версия данных плюс хеш параметров запроса. Сжатое и несжатое тело - разные представления,
+    поэтому кодировка входит в ETag
+    """
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    tag = f'"{version}-{digest}-{encoding or "identity"}"'
+    return 'W/' + tag if weak else tag
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Слабое сравнение, как требует RFC 9110 для If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == opaque for candidate in if_none_match.split(','))
+
+
+def cache_headers(etag: str | None) -> dict[str, str]:
+    headers = {'Cache-Control': f'max-age={settings.HTTP_CACHE_MAX_AGE_S}, must-revalidate',
+               'Vary': 'Accept-Encoding'}
+    if etag is not None:
+        headers['ETag'] = etag
+    return headers
+
+
+class Validator(NamedTuple):
+    """Версия данных, прочитанная до чтения из бд, и параметры запроса, из которых строится ETag"""
+    version: DataVersion | None
+    key: str
+    weak: bool = False
+
+    def headers(self, encoding: str | None) -> dict[str, str]:
+        """encoding - фактический Content-Encoding ответа, а не то, что принимает клиент"""
+        if self.version is None:
+            return cache_headers(None)
+        return cache_headers(make_etag(self.version.version, self.key, encoding, self.weak))
+
+
+def check_not_modified(if_none_match: str | None, version: DataVersion | None, key: str, encoding: str | None,
+                       request_id: str, weak: bool = False) -> Validator:
+    """
+    Если клиент прислал ETag текущей версии - сразу 304, до бд и до чтения кеша.
+    Ответ меньше порога сжатия отдаётся без сжатия и клиенту с Accept-Encoding, поэтому подходит
+    и ETag без кодировки. Без редиса версии нет и ответ отдаётся без ETag
+    """
+    validator = Validator(version, key, weak)
+    if version is None or not if_none_match:
+        return validator
+
+    for candidate in dict.fromkeys((encoding, None)):
+        headers = validator.headers(candidate)
+        if etag_matches(if_none_match, headers['ETag']):
+            logger.debug('%s | Данные не изменились, 304', request_id)
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return validator
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config import settings
+from src.db.connection import engine
+from src.service.redis_conn import RedisClient, redis_client
+from src.utils.startup import run_checks
+
+
+class HealthChecker:
+    """
+    Проверки готовности с кешем на cache_s: частые пробы нескольких оркестраторов
+    не превращаются в запросы к бд и редису на каждую пробу
+    """
+
+    def __init__(self, db_engine: AsyncEngine, cache_client: RedisClient, cache_s: float, timeout_s: float):
+        self.engine = db_engine
+        self.cache_client = cache_client
+        self.cache_s = cache_s
+        self.timeout_s = timeout_s
+        self.started_at = time.time()
+        self._result: dict | None = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _check_database(self):
+        async with self.engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+
+    async def _check_redis(self):
+        r = await self.cache_client.get_redis()
+        await r.ping()
+
+    async def ready(self) -> dict:
+        async with self._lock:
+            if self._result is not None and time.monotonic() - self._checked_at < self.cache_s:
+                return self._result
+
+            errors = await run_checks({'database': self._check_database(), 'redis': self._check_redis()},
+                                      self.timeout_s)
+            # Без редиса сервис работает без кеша, без бд - не работает
+            if errors['database'] is not None:
+                state = 'fail'
+            elif errors['redis'] is not None:
+                state = 'degraded'
+            else:
+                state = 'ok'
+
+            self._result = {
+                'status': state,
+                'checks': {name: 'ok' if error is None else str(error) or type(error).__name__
+                           for name, error in errors.items()},
+                'checked_at': time.time(),
+            }
+            self._checked_at = time.monotonic()
+            return self._result
+
+    def live(self) -> dict:
+        return {'status': 'ok', 'uptime_s': round(time.time() - self.started_at, 1)}
+
+
+health_checker = HealthChecker(engine, redis_client, settings.HEALTH_CACHE_S, settings.HEALTH_CHECK_TIMEOUT_S)
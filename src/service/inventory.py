@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+
+from src.config import settings
+from src.db.connection import async_session_maker
+from src.db.subjectsManager import subjects_manager
+from src.service.redisManager import redis_manager
+
+logger = logging.getLogger('Остатки')
+
+RECONCILE_LOCK = 'inventory:subjects:reconcile'
+
+
+class InventoryReconciler:
+    """
+    Периодически пересчитывает остатки по бд и перезаписывает счётчики в редисе.
+    Исправляет расхождения, если процесс упал между commit и обновлением счётчиков.
+    Изменения, пришедшие во время самой сверки, могут потеряться до следующей
+    """
+
+    def __init__(self, interval_s: float, days: int):
+        self.interval_s = interval_s
+        self.days = days
+        self.runs = 0
+        self._task: asyncio.Task | None = None
+
+    def since(self) -> date:
+        return date.today() - timedelta(days=self.days)
+
+    async def reconcile(self, request_id: str = 'inventory') -> dict:
+        async with async_session_maker() as session:
+            inventory = await subjects_manager.get_inventory(session, self.since(), request_id)
+        await redis_manager.set_inventory(inventory, request_id)
+        self.runs += 1
+        return inventory
+
+    async def _run(self):
+        while True:
+            try:
+                # Из нескольких воркеров сверяет один за интервал
+                if await redis_manager.acquire_lock(RECONCILE_LOCK, self.interval_s * 0.9):
+                    await self.reconcile()
+                    logger.info('Остатки сверены с бд')
+            except Exception as e:
+                logger.error('Ошибка в сверке остатков', exc_info=e)
+            await asyncio.sleep(self.interval_s)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+inventory_reconciler = InventoryReconciler(settings.INVENTORY_RECONCILE_S, settings.INVENTORY_DAYS)
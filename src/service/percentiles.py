@@ -0,0 +1,90 @@
+import logging
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.db.subjectsManager import subjects_manager
+from src.service.redisManager import SKETCH_PREFIX, redis_manager
+from src.utils import codec
+from src.utils.sketch import LogSketch
+
+logger = logging.getLogger('Перцентили')
+
+PERCENTILES = (50, 90, 99)
+METRICS = ('weight', 'length', 'time_in_storage_s')
+# По каким строкам считается метрика: в отличие от avg/min/max статистики, не по лежавшим в периоде
+POPULATION = {
+    'weight': 'created_in_period',
+    'length': 'created_in_period',
+    'time_in_storage_s': 'deleted_in_period',
+}
+
+
+def _sketch_key(day: date, alpha: float) -> str:
+    return f'{alpha}:{day.isoformat()}'
+
+
+def _format(values: list[float | None], count: int) -> dict:
+    result = {'count': count}
+    for p, value in zip(PERCENTILES, values):
+        result[f'p{p}'] = None if value is None else round(float(value), 2)
+    return result
+
+
+async def get_percentiles(
+        session: AsyncSession,
+        start_date: datetime,
+        end_date: datetime,
+        request_id: str,
+        exact: bool = False,
+) -> dict:
+    """
+    p50/p90/p99 веса и длины для созданных за период и времени хранения для удалённых за период.
+    По умолчанию складываются дневные скетчи, прошедшие дни берутся из редиса,
+    exact считает percentile_cont по строкам
+    """
+    first_day, last_day = start_date.date(), end_date.date()
+    quantiles = [p / 100 for p in PERCENTILES]
+
+    if exact:
+        exact_values = await subjects_manager.get_exact_percentiles(
+            session, datetime.combine(first_day, time.min), datetime.combine(last_day, time.max), quantiles,
+            request_id)
+        result = {'mode': 'exact', 'population': POPULATION}
+        for metric, (values, count) in exact_values.items():
+            result[metric] = _format(values or [None] * len(PERCENTILES), count)
+        return result
+
+    alpha = settings.STATS_SKETCH_ALPHA
+    days = [first_day + timedelta(days=n) for n in range((last_day - first_day).days + 1)]
+    cached = await redis_manager.get_many(SKETCH_PREFIX, [_sketch_key(day, alpha) for day in days], request_id)
+
+    daily: dict[date, dict[str, LogSketch]] = {}
+    for day in days:
+        payload = cached.get(_sketch_key(day, alpha))
+        if payload is not None:
+            daily[day] = {metric: LogSketch.from_dict(data) for metric, data in codec.loads(payload).items()}
+
+    missing = [day for day in days if day not in daily]
+    logger.debug('%s | Скетчей из кеша %s, считаем %s', request_id, len(daily), len(missing))
+    if missing:
+        computed = await subjects_manager.get_daily_sketches(session, missing[0], missing[-1], alpha, request_id)
+        settled_before = await subjects_manager.get_settled_before(session)
+        to_cache = {}
+        for day in missing:
+            daily[day] = computed.get(day, {})
+            # Текущий день ещё меняется, кешируются только закрытые по часам бд, как корзины временных рядов
+            if datetime.combine(day + timedelta(days=1), time.min) <= settled_before:
+                to_cache[_sketch_key(day, alpha)] = codec.dumps(
+                    {metric: sketch.to_dict() for metric, sketch in daily[day].items()})
+        await redis_manager.set_many(SKETCH_PREFIX, to_cache, request_id, settings.STATS_SKETCH_TTL_S)
+
+    result = {'mode': 'sketch', 'relative_error': alpha, 'population': POPULATION}
+    for metric in METRICS:
+        merged = LogSketch(alpha)
+        for day_sketches in daily.values():
+            if metric in day_sketches:
+                merged.merge(day_sketches[metric])
+        result[metric] = _format([merged.quantile(q) for q in quantiles], merged.count)
+    return result
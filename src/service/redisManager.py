@@ -1,51 +1,98 @@
-import json
 import logging
+import time
+from datetime import date, datetime
+from typing import NamedTuple
+
 from src.service.redis_conn import redis_client
 
 logger = logging.getLogger('Редис')
 
+# Версия формата значения: в кеше лежит готовый json ответа. Остаётся под префиксом subject:,
+# чтобы общая инвалидация находила и старые ключи
+CACHE_PREFIX = 'subject:v2:'
+CACHE_TTL_S = 300
+
+# Счётчики остатков. Не под subject:, иначе их сотрёт инвалидация кеша
+INVENTORY_KEY = 'inventory:subjects'
+INVENTORY_DAYS_KEY = 'inventory:subjects:days'
+
+# Версия данных для ETag, меняется при каждой записи. Не под subject:, иначе инвалидация её сотрёт.
+# Начинается со времени в микросекундах: после потери ключа версии не повторяются и старые ETag не совпадут
+DATA_VERSION_KEY = 'data_version:subjects'
+# Время последней записи: пока реплики могут её не иметь, чтения идут с основной бд
+DATA_WRITTEN_AT_KEY = 'data_version:subjects:written_at'
+
+# Дневные скетчи статистики и закрытые корзины временных рядов, после закрытия они не меняются
+SKETCH_PREFIX = 'sketch:subjects:'
+TIMESERIES_PREFIX = 'timeseries:subjects:'
+
+# Пока сверки с бд не было, хеша нет и увеличивать нечего: частичные счётчики были бы неверными
+CHANGE_INVENTORY_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'reconciled_at') == 0 then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], 'active_count', ARGV[1])
+redis.call('HINCRBYFLOAT', KEYS[1], 'total_weight', ARGV[2])
+redis.call('HINCRBY', KEYS[2], ARGV[3], 1)
+return 1
+"""
+
+
+def cache_variant(filters_key: str, encoding: str) -> str:
+    """Ключ сжатой копии того же ответа, лежит рядом с исходным и сбрасывается вместе с ним"""
+    return f'{filters_key}|{encoding}'
+
+
+def cache_version_key(filters_key: str) -> str:
+    """Версия данных, из которой собран ответ в кеше"""
+    return f'{filters_key}|version'
+
+
+class DataVersion(NamedTuple):
+    version: int
+    written_at: float
+
 
 class RedisManager:
 
     @staticmethod
-    async def get_subject_with_filters(filters_key: str, request_id: str):
+    async def get_subject_with_filters(filters_key: str, request_id: str) -> bytes | None:
         try:
-            logger.debug(f'{request_id} | Получение данных из кеша')
+            logger.debug('%s | Получение данных из кеша', request_id)
 
             r = await redis_client.get_redis()
-            result = await r.get('subject:' + filters_key)
+            result = await r.get(CACHE_PREFIX + filters_key)
 
             if result:
-                logger.debug(f'{request_id} | Успешно получены данные из кеша')
-                return [json.loads(res) for res in json.loads(result)]
+                logger.debug('%s | Успешно получены данные из кеша', request_id)
+                return result
 
-            logger.debug(f'{request_id} | В кеше нету')
+            logger.debug('%s | В кеше нету', request_id)
             return None
         except RuntimeError:
             return None
         except Exception as e:
-            logger.error(f'{request_id} | Ошибка в получении данных из редиса', exc_info=e)
+            logger.error('%s | Ошибка в получении данных из редиса', request_id, exc_info=e)
             return None
 
     @staticmethod
-    async def set_subject_with_filters(filters_key: str, result, request_id: str):
+    async def set_subject_with_filters(filters_key: str, payload: bytes, request_id: str):
         try:
-            logger.debug(f'{request_id} | Кладём данные в кеш')
+            logger.debug('%s | Кладём данные в кеш', request_id)
             r = await redis_client.get_redis()
 
-            json_data = json.dumps([res.model_dump_json(exclude_unset=True) for res in result])
-            await r.set('subject:' + filters_key, json_data, ex=300)
-            logger.debug(f'{request_id} | Успешно положили')
+            await r.set(CACHE_PREFIX + filters_key, payload, ex=CACHE_TTL_S)
+            logger.debug('%s | Успешно положили', request_id)
 
         except RuntimeError:
             pass
         except Exception as e:
-            logger.error(f'{request_id} | Ошибка при создании кеша с данными', exc_info=e)
+            logger.error('%s | Ошибка при создании кеша с данными', request_id, exc_info=e)
 
     @staticmethod
     async def delete_subject_with_filters(request_id: str):
         try:
-            logger.debug(f'{request_id} | Удаляем весь кеш по subject')
+            logger.debug('%s | Удаляем весь кеш по subject', request_id)
             r = await redis_client.get_redis()
 
             cursor = 0
@@ -61,11 +108,165 @@ class RedisManager:
                 if cursor == 0:
                     break
 
-            logger.debug(f'{request_id} | Успешно удалено {deleted_count} ключей')
+            logger.debug('%s | Успешно удалено %s ключей', request_id, deleted_count)
+        except RuntimeError:
+            pass
+        except Exception as e:
+            logger.error('%s | Ошибка в удалении кеша', request_id, exc_info=e)
+
+
+    @staticmethod
+    async def get_data_version(request_id: str) -> DataVersion | None:
+        """None - редис недоступен, тогда ответы отдаются без ETag и без кеша"""
+        try:
+            r = await redis_client.get_redis()
+            version, written_at = await r.mget([DATA_VERSION_KEY, DATA_WRITTEN_AT_KEY])
+            if version is None:
+                # Когда была последняя запись, неизвестно: считаем, что только что
+                async with r.pipeline(transaction=True) as pipe:
+                    pipe.set(DATA_VERSION_KEY, time.time_ns() // 1000, nx=True)
+                    pipe.set(DATA_WRITTEN_AT_KEY, time.time(), nx=True)
+                    pipe.mget([DATA_VERSION_KEY, DATA_WRITTEN_AT_KEY])
+                    *_, (version, written_at) = await pipe.execute()
+            return DataVersion(int(version), float(written_at or 0))
+        except RuntimeError:
+            return None
+        except Exception as e:
+            logger.error('%s | Ошибка в получении версии данных', request_id, exc_info=e)
+            return None
+
+    @staticmethod
+    async def bump_data_version(request_id: str):
+        try:
+            r = await redis_client.get_redis()
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.set(DATA_VERSION_KEY, time.time_ns() // 1000, nx=True)
+                pipe.incr(DATA_VERSION_KEY)
+                pipe.set(DATA_WRITTEN_AT_KEY, time.time())
+                _, version, _ = await pipe.execute()
+            logger.debug('%s | Версия данных %s', request_id, version)
+        except RuntimeError:
+            pass
+        except Exception as e:
+            logger.error('%s | Ошибка в обновлении версии данных', request_id, exc_info=e)
+
+    @staticmethod
+    async def change_inventory(count: int, weight: float, day: date, event: str, request_id: str):
+        """event - added или deleted, счётчики меняются одним скриптом атомарно"""
+        try:
+            r = await redis_client.get_redis()
+            await r.eval(CHANGE_INVENTORY_SCRIPT, 2, INVENTORY_KEY, INVENTORY_DAYS_KEY,
+                         count, weight, f'{day.isoformat()}:{event}')
+            logger.debug('%s | Остатки обновлены: %s', request_id, event)
+        except RuntimeError:
+            pass
+        except Exception as e:
+            logger.error('%s | Ошибка в обновлении остатков', request_id, exc_info=e)
+
+    @staticmethod
+    async def get_inventory(request_id: str) -> dict | None:
+        try:
+            r = await redis_client.get_redis()
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.hgetall(INVENTORY_KEY)
+                pipe.hgetall(INVENTORY_DAYS_KEY)
+                totals, raw_days = await pipe.execute()
+        except RuntimeError:
+            return None
+        except Exception as e:
+            logger.error('%s | Ошибка в получении остатков из редиса', request_id, exc_info=e)
+            return None
+
+        if b'reconciled_at' not in totals:
+            logger.debug('%s | Остатков в редисе нет', request_id)
+            return None
+
+        days: dict[str, dict[str, int]] = {}
+        for field, value in raw_days.items():
+            day, _, event = field.decode().partition(':')
+            days.setdefault(day, {'added': 0, 'deleted': 0})[event] = int(value)
+
+        return {
+            'active_count': int(totals[b'active_count']),
+            'total_weight': round(float(totals[b'total_weight']), 2),
+            'days': days,
+            'reconciled_at': totals[b'reconciled_at'].decode(),
+        }
+
+    @staticmethod
+    async def set_inventory(inventory: dict, request_id: str):
+        """Перезаписывает счётчики снимком из бд, старые дни при этом уходят"""
+        try:
+            r = await redis_client.get_redis()
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.delete(INVENTORY_KEY, INVENTORY_DAYS_KEY)
+                pipe.hset(INVENTORY_KEY, mapping={
+                    'active_count': inventory['active_count'],
+                    'total_weight': inventory['total_weight'],
+                    'reconciled_at': datetime.now().isoformat(timespec='seconds'),
+                })
+                days = {f'{day}:{event}': count
+                        for day, counts in inventory['days'].items() for event, count in counts.items()}
+                if days:
+                    pipe.hset(INVENTORY_DAYS_KEY, mapping=days)
+                await pipe.execute()
+            logger.debug('%s | Остатки в редисе сверены с бд', request_id)
         except RuntimeError:
             pass
         except Exception as e:
-            logger.error(f'{request_id} | Ошибка в удалении кеша', exc_info=e)
+            logger.error('%s | Ошибка в записи остатков', request_id, exc_info=e)
+
+    @staticmethod
+    async def acquire_lock(name: str, ttl_s: float) -> bool:
+        """Один воркер из нескольких на ttl_s, без редиса работает каждый сам по себе"""
+        try:
+            r = await redis_client.get_redis()
+            return bool(await r.set(name, b'1', nx=True, px=int(ttl_s * 1000)))
+        except RuntimeError:
+            return True
+        except Exception as e:
+            logger.error('Ошибка в получении блокировки %s', name, exc_info=e)
+            return True
 
+    @staticmethod
+    async def get_many(prefix: str, keys: list[str], request_id: str) -> dict[str, bytes]:
+        """Значения, которые уже посчитаны и не меняются, одним MGET; отсутствующих ключей нет в ответе"""
+        if not keys:
+            return {}
+        try:
+            r = await redis_client.get_redis()
+            values = await r.mget([prefix + key for key in keys])
+            return {key: value for key, value in zip(keys, values) if value is not None}
+        except RuntimeError:
+            return {}
+        except Exception as e:
+            logger.error('%s | Ошибка в получении %s*', request_id, prefix, exc_info=e)
+            return {}
+
+    @staticmethod
+    async def set_many(prefix: str, payloads: dict[str, bytes], request_id: str, ttl_s: int | None = None):
+        """ttl_s=None - навсегда"""
+        if not payloads:
+            return
+        try:
+            r = await redis_client.get_redis()
+            async with r.pipeline(transaction=False) as pipe:
+                for key, payload in payloads.items():
+                    pipe.set(prefix + key, payload, ex=ttl_s)
+                await pipe.execute()
+            logger.debug('%s | Положили %s ключей %s*', request_id, len(payloads), prefix)
+        except RuntimeError:
+            pass
+        except Exception as e:
+            logger.error('%s | Ошибка при записи %s*', request_id, prefix, exc_info=e)
 
 redis_manager = RedisManager()
+
+
+async def _reset_after_outage():
+    # Пока редиса не было, записи не сбрасывали кеш и не меняли версию данных
+    await redis_manager.delete_subject_with_filters('reconnect')
+    await redis_manager.bump_data_version('reconnect')
+
+
+redis_client.on_reconnect.append(_reset_after_outage)
@@ -1,6 +1,7 @@
 import asyncio
 import redis.asyncio as redis
 import logging
+from typing import Awaitable, Callable
 
 from src.config import settings
 
@@ -12,33 +13,68 @@ class RedisClient:
     def __init__(self):
 
         self.redis = None
+        # Фоновое переподключение включается только после попытки подключиться из lifespan
+        self.reconnect_enabled = False
+        self._reconnect_task: asyncio.Task | None = None
+        # Вызываются после переподключения: записи, прошедшие без редиса, не отразились в кеше
+        self.on_reconnect: list[Callable[[], Awaitable]] = []
 
     async def connect(self):
+        """Одна попытка без пауз, ограничивать её по времени должен вызывающий"""
         if self.redis is None:
-            for attempt in range(3):
+            self.reconnect_enabled = True
+            client = redis.from_url(settings.REDIS_URL, decode_responses=False,
+                                    socket_connect_timeout=settings.STARTUP_TIMEOUT_S)
+            try:
+                await client.ping()
+            except BaseException:
+                await client.aclose()
+                raise
+            self.redis = client
+
+    def start_reconnect(self):
+        if not self.reconnect_enabled:
+            return
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while self.redis is None:
+            await asyncio.sleep(settings.REDIS_RECONNECT_S)
+            try:
+                await asyncio.wait_for(self.connect(), settings.STARTUP_TIMEOUT_S)
+            except Exception as e:
+                logger.debug('Редис всё ещё недоступен: %s', e)
+                continue
+            logger.warning('Редис снова доступен, кеш включён')
+            for callback in self.on_reconnect:
                 try:
-                    self.redis = await redis.from_url(settings.REDIS_URL, decode_responses=True, encoding='utf-8')
-                    await self.redis.ping()
-                    return
-                except:
-                    self.redis = None
-                    await asyncio.sleep(1)
-            raise RuntimeError("Redis connection failed")
+                    await callback()
+                except Exception as e:
+                    logger.error('Ошибка в обработчике переподключения', exc_info=e)
 
     async def get_redis(self):
+        if self.redis is None:
+            # Работаем без кеша, пока фоновая задача не подключится
+            self.start_reconnect()
+            raise RuntimeError('Redis connection failed')
+
         try:
             await self.redis.ping()
-        except:
-            self.redis = None
-
-        if self.redis is None:
+        except Exception:
             logger.critical('Редис недоступен во время запроса')
+            self.redis = None
+            self.start_reconnect()
             raise RuntimeError('Redis connection failed')
         return self.redis
 
     async def close(self):
+        self.reconnect_enabled = False
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
         if self.redis:
-            await self.redis.close()
+            await self.redis.aclose()
+            self.redis = None
 
 
 redis_client = RedisClient()
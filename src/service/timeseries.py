@@ -0,0 +1,90 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.subjectsManager import subjects_manager
+from src.service.redisManager import TIMESERIES_PREFIX, redis_manager
+from src.utils import codec
+
+logger = logging.getLogger('Временные ряды')
+
+BUCKETS = ('hour', 'day', 'week', 'month')
+MAX_BUCKETS = 2000
+
+
+def truncate(moment: datetime, bucket: str) -> datetime:
+    """Как date_trunc в postgres, неделя начинается с понедельника"""
+    if bucket == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_bucket(moment: datetime, bucket: str) -> datetime:
+    if bucket == 'hour':
+        return moment + timedelta(hours=1)
+    if bucket == 'day':
+        return moment + timedelta(days=1)
+    if bucket == 'week':
+        return moment + timedelta(weeks=1)
+    return moment.replace(year=moment.year + moment.month // 12, month=moment.month % 12 + 1)
+
+
+def bucket_starts(start: datetime, end: datetime, bucket: str) -> list[datetime]:
+    starts = []
+    current = truncate(start, bucket)
+    while current <= end:
+        starts.append(current)
+        if len(starts) > MAX_BUCKETS:
+            raise ValueError(f'Больше {MAX_BUCKETS} корзин, возьмите корзину крупнее')
+        current = next_bucket(current, bucket)
+    return starts
+
+
+async def get_timeseries(
+        session: AsyncSession,
+        bucket: str,
+        start: datetime,
+        end: datetime,
+        request_id: str,
+) -> dict:
+    """
+    Закрытые корзины не меняются и берутся из редиса без срока жизни,
+    из бд считается только хвост с первой незакешированной корзины, обычно одна текущая.
+    Закрытой считается корзина, которая кончилась раньше get_settled_before по часам бд
+    """
+    starts = bucket_starts(start, end, bucket)
+    keys = [f'{bucket}:{moment.isoformat()}' for moment in starts]
+    cached = await redis_manager.get_many(TIMESERIES_PREFIX, keys, request_id)
+
+    points = []
+    for key in keys:
+        if key not in cached:
+            break
+        points.append(codec.loads(cached[key]))
+    from_cache = len(points)
+
+    if from_cache < len(starts):
+        computed = await subjects_manager.get_timeseries(session, bucket, starts[from_cache], starts[-1],
+                                                         next_bucket(starts[-1], bucket), request_id)
+        settled_before = await subjects_manager.get_settled_before(session)
+        to_cache = {}
+        for moment, key, point in zip(starts[from_cache:], keys[from_cache:], computed):
+            points.append(point)
+            if next_bucket(moment, bucket) <= settled_before:
+                to_cache[key] = codec.dumps(point)
+        await redis_manager.set_many(TIMESERIES_PREFIX, to_cache, request_id)
+
+    logger.debug('%s | Корзин из кеша %s из %s', request_id, from_cache, len(keys))
+    return {
+        'bucket': bucket,
+        'start': starts[0].isoformat(),
+        'end': next_bucket(starts[-1], bucket).isoformat(),
+        'cached_buckets': from_cache,
+        'points': points,
+    }
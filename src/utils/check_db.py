@@ -1,28 +1,24 @@
 from src.db.connection import engine
-from sqlalchemy import inspect, text
+from sqlalchemy import text
 
 from src.models import Base
 
+# Одно соединение и один запрос вместо отражения всей схемы через inspect
+MISSING_TABLES_QUERY = text(
+    'SELECT name FROM unnest(CAST(:names AS text[])) AS name WHERE to_regclass(name) IS NULL'
+)
+
 
 async def ping_database():
     try:
-        async with engine.begin() as conn:
-            await conn.execute(text("SELECT 1"))
-
-        async with engine.begin() as conn:
-            available_tables = await conn.run_sync(
-                lambda sync_conn: inspect(sync_conn).get_table_names()
-            )
-
-        expected_tables = Base.metadata.tables.keys()
+        expected_tables = list(Base.metadata.tables.keys())
 
         if not expected_tables:
             raise ValueError("Нет ни одной таблицы")
 
-        missing_tables = []
-        for table_name in expected_tables:
-            if table_name not in available_tables:
-                missing_tables.append(table_name)
+        async with engine.connect() as conn:
+            result = await conn.execute(MISSING_TABLES_QUERY, {'names': expected_tables})
+            missing_tables = result.scalars().all()
 
         if missing_tables:
             raise ConnectionError(
@@ -34,4 +30,4 @@ async def ping_database():
     except Exception as e:
         if isinstance(e, (TimeoutError, ConnectionError, ValueError)):
             raise e
-        raise TimeoutError(f'Нет соединения с бд: {str(e)}')
\ No newline at end of file
+        raise TimeoutError(f'Нет соединения с бд: {str(e)}')
@@ -0,0 +1,18 @@
+import orjson
+from starlette.responses import Response
+
+# Один кодек для ответов и для кеша в редисе: orjson сразу отдаёт bytes,
+# понимает datetime и пишет его в том же ISO формате, что и pydantic
+
+
+def dumps(data) -> bytes:
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+def loads(data: bytes | str):
+    return orjson.loads(data)
+
+
+class JSONBytesResponse(Response):
+    """Ответ из уже закодированного json, без повторной сериализации"""
+    media_type = 'application/json'
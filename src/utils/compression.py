@@ -0,0 +1,73 @@
+import asyncio
+import gzip
+
+from src.config import settings
+
+# zstd и brotli необязательны: без пакетов остаётся только gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Порядок предпочтения при равном q у клиента
+ENCODINGS: tuple[str, ...] = tuple(
+    name for name, available in (('zstd', zstandard), ('br', brotli), ('gzip', gzip)) if available
+)
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/html', 'text/csv')
+
+# Сжатие больших тел уходит в поток: zlib, zstd и brotli отпускают GIL
+THREAD_THRESHOLD_BYTES = 256 * 1024
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """Лучшая из поддерживаемых кодировок по Accept-Encoding, None - отдавать без сжатия"""
+    if not accept_encoding:
+        return None
+
+    weights: dict[str, float] = {}
+    for item in accept_encoding.lower().split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+
+    best, best_q = None, 0.0
+    for name in ENCODINGS:
+        q = weights.get(name, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        # mtime=0: одинаковые данные дают одинаковые байты
+        return gzip.compress(data, compresslevel=settings.COMPRESS_GZIP_LEVEL, mtime=0)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=settings.COMPRESS_ZSTD_LEVEL).compress(data)
+    if encoding == 'br':
+        return brotli.compress(data, quality=settings.COMPRESS_BROTLI_QUALITY)
+    raise ValueError(f'Неизвестная кодировка: {encoding}')
+
+
+async def compress_async(data: bytes, encoding: str) -> bytes:
+    if len(data) >= THREAD_THRESHOLD_BYTES:
+        return await asyncio.to_thread(compress, data, encoding)
+    return compress(data, encoding)
+
+
+def should_compress(size: int, content_type: str | None) -> bool:
+    if not settings.COMPRESS_ENABLED or size < settings.COMPRESS_MIN_BYTES:
+        return False
+    return bool(content_type) and content_type.split(';')[0].strip() in COMPRESSIBLE_TYPES
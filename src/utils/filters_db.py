@@ -1,4 +1,18 @@
+import operator
+from datetime import date, datetime, time
+
 from fastapi import HTTPException, status
+from sqlalchemy import and_, bindparam, or_
+from sqlalchemy.sql.elements import ColumnElement
+
+# Все фильтры списка в фиксированном порядке: из них собирается шаблон условия на модель
+FILTER_FIELDS = ('id_min', 'id_max', 'weight_min', 'weight_max', 'length_min', 'length_max', 'is_active',
+                 'created_after', 'created_before', 'deleted_after', 'deleted_before')
+# Фильтры по индексированным колонкам не прячутся под IS NULL: в общем (generic) плане подготовленного
+# выражения (:p IS NULL OR col >= :p) индекс не используется, и после пяти выполнений запрос уходит в seq scan
+INDEXED_FILTERS = ('id_min', 'id_max', 'is_active')
+
+_templates: dict[tuple[type, tuple[str, ...]], ColumnElement] = {}
 
 
 def build_filters(model, **kwargs) -> list:
@@ -22,6 +36,105 @@ def build_filters(model, **kwargs) -> list:
 
     return list_filters
 
+def _filter_target(model, field: str):
+    """Колонка и сравнение для фильтра, по тем же правилам имён, что и build_filters"""
+    if field.endswith("_min"):
+        return getattr(model, field[:-4]), operator.ge
+    if field.endswith("_max"):
+        return getattr(model, field[:-4]), operator.le
+    if field.endswith("_after"):
+        return getattr(model, field[:-7] + '_at'), operator.ge
+    if field.endswith("_before"):
+        return getattr(model, field[:-8] + '_at'), operator.le
+    return getattr(model, field), operator.eq
+
+
+def _indexed_shape(filters: dict) -> tuple[str, ...]:
+    return tuple(field for field in INDEXED_FILTERS if filters.get(field) is not None)
+
+
+def filter_template(model, **filters) -> ColumnElement:
+    """
+    Условие вида (:p IS NULL OR col >= :p) по каждому неиндексированному фильтру и обычное col >= :p
+    по каждому заданному индексированному. Текстов запроса не больше 2 ** len(INDEXED_FILTERS):
+    запрос компилируется SQLAlchemy один раз на форму, а подготовленное выражение asyncpg
+    переиспользуется. Значения передаются в execute через filter_params с теми же фильтрами
+    """
+    shape = _indexed_shape(filters)
+    template = _templates.get((model, shape))
+    if template is None:
+        conditions = []
+        for field in FILTER_FIELDS:
+            if field in INDEXED_FILTERS and field not in shape:
+                continue
+            column, compare = _filter_target(model, field)
+            param = bindparam(f'filter_{field}', type_=column.type, required=False)
+            if field in INDEXED_FILTERS:
+                conditions.append(compare(column, param))
+            else:
+                conditions.append(or_(param.is_(None), compare(column, param)))
+        template = _templates[(model, shape)] = and_(*conditions)
+    return template
+
+
+def filter_params(**filters) -> dict:
+    shape = _indexed_shape(filters)
+    params = {}
+    for field in FILTER_FIELDS:
+        if field in INDEXED_FILTERS and field not in shape:
+            continue
+        value = filters.get(field)
+        # Колонки дат - timestamp, дата сравнивается как её начало, как и в build_filters
+        if isinstance(value, date) and not isinstance(value, datetime):
+            value = datetime.combine(value, time.min)
+        params[f'filter_{field}'] = value
+    return params
+
+
+def match_filters(row: dict, filters: dict) -> bool:
+    """
+    Те же условия, что и build_filters, но для уже полученной строки, например из уведомления бд.
+    Даты в строке могут прийти строками iso, как после json
+    """
+    for field, value in filters.items():
+
+        if value is None:
+            continue
+
+        if field.endswith("_min"):
+            column, op = field[:-4], 'ge'
+        elif field.endswith("_max"):
+            column, op = field[:-4], 'le'
+        elif field.endswith("_after"):
+            column, op = field[:-7] + '_at', 'ge'
+        elif field.endswith("_before"):
+            column, op = field[:-8] + '_at', 'le'
+        elif field == "is_active":
+            column, op = field, 'eq'
+        else:
+            continue
+
+        current = row.get(column)
+        # Как в sql: сравнение с NULL не проходит ни один фильтр
+        if current is None:
+            return False
+
+        if isinstance(value, date):
+            if isinstance(current, str):
+                current = datetime.fromisoformat(current)
+            if not isinstance(value, datetime):
+                value = datetime.combine(value, datetime.min.time())
+
+        if op == 'ge' and not current >= value:
+            return False
+        if op == 'le' and not current <= value:
+            return False
+        if op == 'eq' and current != value:
+            return False
+
+    return True
+
+
 def serialize_filters(filters: dict) -> dict:
     for key in filters:
         if key.endswith('_min'):
@@ -0,0 +1,4 @@
+from contextvars import ContextVar
+
+# request_id текущего запроса, чтобы его видели слои без доступа к Request (движок бд, логгер)
+request_id_ctx: ContextVar[str | None] = ContextVar('request_id', default=None)
@@ -0,0 +1,64 @@
+import math
+
+
+class LogSketch:
+    """
+    Квантильный скетч с логарифмическими корзинами (как DDSketch): корзина k покрывает
+    (gamma^(k-1), gamma^k], поэтому любой квантиль отдаётся с относительной ошибкой не больше alpha.
+    Скетчи с одним alpha складываются без потери точности, так дневные собираются в любой период.
+    Значения <= 0 считаются отдельно и отдаются как 0
+    """
+
+    def __init__(self, alpha: float = 0.01, buckets: dict[int, int] | None = None, zero_count: int = 0):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: dict[int, int] = dict(buckets or {})
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.buckets.values())
+
+    def key(self, value: float) -> int | None:
+        return math.ceil(math.log(value) / self.log_gamma) if value > 0 else None
+
+    def add_bucket(self, key: int | None, count: int = 1):
+        if key is None:
+            self.zero_count += count
+        else:
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def add(self, value: float, count: int = 1):
+        self.add_bucket(self.key(value), count)
+
+    def merge(self, other: 'LogSketch') -> 'LogSketch':
+        if other.alpha != self.alpha:
+            raise ValueError('Складывать можно только скетчи с одинаковым alpha')
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # Середина корзины в относительном смысле
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self) -> dict:
+        return {'alpha': self.alpha, 'zero_count': self.zero_count,
+                'buckets': {str(key): count for key, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LogSketch':
+        return cls(data['alpha'], {int(key): count for key, count in data['buckets'].items()}, data['zero_count'])
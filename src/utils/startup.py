@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable
+
+logger = logging.getLogger('Старт')
+
+# Время импорта приложения, проверок и всего старта воркера, отдаётся в /api/internal/startup
+startup_stats: dict = {
+    'import_s': None,
+    'startup_s': None,
+    'checks': {},
+    'degraded': [],
+}
+
+
+async def _timed(name: str, check: Awaitable, timeout: float, stats: dict | None) -> BaseException | None:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(check, timeout)
+        error = None
+    except asyncio.TimeoutError:
+        error = TimeoutError(f'{name}: нет ответа за {timeout} с')
+    except Exception as e:
+        error = e
+    elapsed = round((time.perf_counter() - started) * 1000, 1)
+    if stats is not None:
+        stats[name] = {'ok': error is None, 'ms': elapsed}
+    logger.debug('Проверка %s: %s за %s мс', name, 'ok' if error is None else error, elapsed)
+    return error
+
+
+async def run_checks(checks: dict[str, Awaitable], timeout: float,
+                     stats: dict | None = None) -> dict[str, BaseException | None]:
+    """
+    Все проверки параллельно, каждая не дольше timeout, ошибки возвращаются, а не бросаются.
+    В stats, если передан, пишется время каждой проверки
+    """
+    errors = await asyncio.gather(*(_timed(name, check, timeout, stats) for name, check in checks.items()))
+    return dict(zip(checks, errors))
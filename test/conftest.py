@@ -1,32 +1,65 @@
+import os
 from datetime import date, datetime
 from typing import AsyncGenerator
 
 import pytest
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy import insert
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy import insert, make_url, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncConnection
 
+from bench.datagen import DatasetSpec, fill_subjects_with_session
 from src.config import settings
-from src.db.connection import get_async_session
+from src.db.connection import (LazySession, get_async_session, get_async_read_session, get_lazy_session,
+                               get_lazy_read_session)
+from src.db.query_log import slow_query_log
 from src.models import Base, SubjectsORM
 from src.main import app
 
+
+def get_test_database_url() -> str:
+    # Под pytest-xdist у каждого воркера своя бд, чтобы параллельные тесты не мешали друг другу
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    if not worker:
+        return settings.DATABASE_URL_TEST
+    return make_url(settings.DATABASE_URL_TEST).set(database=f'{settings.DB_NAME_TEST}_{worker}').render_as_string(
+        hide_password=False)
+
+
+async def create_worker_database(url: str):
+    database = make_url(url).database
+    if database == settings.DB_NAME_TEST:
+        return
+
+    admin_engine = create_async_engine(settings.DATABASE_URL_TEST, isolation_level='AUTOCOMMIT')
+    try:
+        async with admin_engine.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)'))
+            await conn.execute(text(f'CREATE DATABASE "{database}"'))
+    finally:
+        await admin_engine.dispose()
+
+
 test_engine = create_async_engine(
-    settings.DATABASE_URL_TEST,
+    get_test_database_url(),
     pool_size=5,
     max_overflow=10,
     pool_pre_ping=True,
     echo=False
 )
 
+slow_query_log.attach(test_engine.sync_engine)
+
 TestingAsyncSessionLocal = async_sessionmaker(
-    test_engine, class_=AsyncSession, expire_on_commit=False
+    class_=AsyncSession, expire_on_commit=False, join_transaction_mode='create_savepoint'
 )
 
 
-@pytest.fixture(scope="function", autouse=True)
+@pytest.fixture(scope="session", autouse=True)
 async def setup_database():
+    # Схема создаётся один раз на сессию, а каждый тест откатывается вместе со своей транзакцией
+    await create_worker_database(test_engine.url.render_as_string(hide_password=False))
     async with test_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
     try:
         yield
@@ -37,19 +70,39 @@ async def setup_database():
 
 
 @pytest.fixture(scope="function")
-async def db_session() -> AsyncGenerator[AsyncSession, None]:
-    async with TestingAsyncSessionLocal() as session:
-        await session.begin_nested()
+async def db_connection() -> AsyncGenerator[AsyncConnection, None]:
+    async with test_engine.connect() as conn:
+        transaction = await conn.begin()
         try:
-            yield session
+            yield conn
         finally:
-            await session.rollback()
-            await session.close()
+            await transaction.rollback()
+
+
+@pytest.fixture(scope="function")
+async def db_session(db_connection) -> AsyncGenerator[AsyncSession, None]:
+    async with TestingAsyncSessionLocal(bind=db_connection) as session:
+        yield session
 
 
 @pytest.fixture(scope="function")
-async def async_client():
+async def async_client(db_connection):
+    async def override_get_async_session() -> AsyncGenerator[AsyncSession, None]:
+        # commit в коде приложения закрывает только savepoint, внешняя транзакция теста остаётся
+        async with TestingAsyncSessionLocal(bind=db_connection) as session:
+            yield session
+
+    async def override_get_lazy_session() -> AsyncGenerator[LazySession, None]:
+        session = LazySession(lambda: TestingAsyncSessionLocal(bind=db_connection))
+        try:
+            yield session
+        finally:
+            await session.close()
+
     app.dependency_overrides[get_async_session] = override_get_async_session
+    app.dependency_overrides[get_async_read_session] = override_get_async_session
+    app.dependency_overrides[get_lazy_session] = override_get_lazy_session
+    app.dependency_overrides[get_lazy_read_session] = override_get_lazy_session
 
     async with AsyncClient(transport=ASGITransport(app), base_url='http://test') as ac:
         yield ac
@@ -93,11 +146,9 @@ async def test_subjects_for_get(db_session):
         await session.commit()
 
 
-async def override_get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with TestingAsyncSessionLocal() as session:
-        await session.begin_nested()  # Изолируем транзакции тестов
-        try:
-            yield session
-        finally:
-            await session.rollback()
-            await session.close()
+@pytest.fixture
+async def generated_subjects(db_session) -> DatasetSpec:
+    spec = DatasetSpec(rows=2000, days=30, deleted_fraction=0.25, end=datetime(2026, 12, 31), batch_size=500)
+    await fill_subjects_with_session(db_session, spec)
+    await db_session.commit()
+    return spec
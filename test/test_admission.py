@@ -0,0 +1,161 @@
+import asyncio
+
+from fastapi import HTTPException, Request, status
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from src.api.routers.v1 import subjects as subjects_router
+from src.config import settings
+from src.db.ingest import IngestQueue
+from src.db.subjectsManager import subjects_manager
+from src.models import SubjectsORM
+from src.schemes import subjects
+from src.service.admission import AdmissionLimiter, Overloaded, admission_limiters, admit
+from test.conftest import TestingAsyncSessionLocal
+
+
+class TestAdmission:
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_limiter_sheds():
+        limiter = AdmissionLimiter('test', limit=2, queue_size=1, max_wait_s=0.05)
+        await limiter.acquire()
+        await limiter.acquire()
+
+        # Третий ждёт в очереди, четвёртому места в очереди уже нет
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+
+        limiter.release()
+        await waiting
+        assert limiter.in_flight == 2
+
+        # Никто не освободил место за max_wait_s
+        with pytest.raises(Overloaded):
+            await limiter.acquire()
+
+        stats = limiter.stats()
+        assert stats['admitted'] == 3
+        assert stats['shed_queue_full'] == 1
+        assert stats['shed_timeout'] == 1
+        assert stats['queued'] == 0
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_endpoint_503(async_client, test_subjects_for_get, monkeypatch):
+        limiter = AdmissionLimiter('statistics', limit=1, queue_size=0, max_wait_s=0.05)
+        monkeypatch.setitem(admission_limiters, 'statistics', limiter)
+        await limiter.acquire()
+
+        response = await async_client.get("/api/subjects/statistics")
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"]
+
+        # Другие группы не затронуты
+        response = await async_client.get("/api/subjects")
+        assert response.status_code == status.HTTP_200_OK
+
+        limiter.release()
+        response = await async_client.get("/api/subjects/statistics", params={"percentiles": False})
+        assert response.status_code == status.HTTP_200_OK
+        assert limiter.in_flight == 0
+
+        response = await async_client.get("/api/internal/admission")
+        assert {item["name"] for item in response.json()} >= {"get", "list", "statistics"}
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_pool_timeout_503(async_client, monkeypatch):
+        async def pool_exhausted(session, **kwargs):
+            raise PoolTimeoutError('QueuePool limit reached, connection timed out')
+
+        monkeypatch.setattr(subjects_manager, 'get_subjects_statistics', pool_exhausted)
+        response = await async_client.get("/api/subjects/statistics", params={"percentiles": False})
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"]
+
+    @staticmethod
+    def test_default_limits_fit_pool(monkeypatch):
+        monkeypatch.setattr(settings, 'ADMISSION_LIMITS', None)
+        monkeypatch.setattr(settings, 'DB_POOL_SIZE', None)
+        for workers in (1, 4, 12):
+            monkeypatch.setattr(settings, 'WEB_WORKERS', workers)
+            capacity = settings.DB_POOL_SIZE_PER_WORKER + settings.DB_MAX_OVERFLOW_PER_WORKER
+            limits = settings.ADMISSION_LIMITS_PER_WORKER
+            # Буфер записи держит одно соединение на пачку, его группа в пул не входит
+            assert limits.pop('ingest') == 2 * settings.INGEST_BATCH_SIZE
+            assert sum(limits.values()) <= capacity
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_buffered_creates_over_write_limit(async_client, db_connection, monkeypatch):
+        queue = IngestQueue(lambda: TestingAsyncSessionLocal(bind=db_connection), SubjectsORM,
+                            subjects.ReadSubjects, batch_size=50, flush_ms=50)
+        monkeypatch.setattr(subjects_router, 'ingest_queue', queue)
+        monkeypatch.setattr(settings, 'INGEST_BUFFERED', True)
+        monkeypatch.setitem(admission_limiters, 'write', AdmissionLimiter('write', limit=2, queue_size=0,
+                                                                         max_wait_s=0.05))
+        monkeypatch.setitem(admission_limiters, 'ingest', AdmissionLimiter('ingest', limit=100, queue_size=0,
+                                                                          max_wait_s=0.05))
+
+        queue.start()
+        try:
+            responses = await asyncio.gather(*(
+                async_client.post("/api/subjects", json={"length": i + 1, "weight": 100 + i}) for i in range(20)
+            ))
+        finally:
+            await queue.stop()
+
+        assert [response.status_code for response in responses] == [status.HTTP_201_CREATED] * 20
+        # Все создания ждали одну пачку, а не отказ по лимиту write
+        assert queue.stats()['max_batch'] > admission_limiters['write'].limit
+        assert admission_limiters['write'].admitted == 0
+        assert admission_limiters['ingest'].admitted == 20
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_statement_timeout_504(async_client, monkeypatch):
+        async def slow_statistics(session, **kwargs):
+            await session.execute(text('SELECT pg_sleep(1)'))
+
+        monkeypatch.setitem(settings.DB_STATEMENT_TIMEOUTS_MS, 'statistics', 50)
+        monkeypatch.setattr(subjects_manager, 'get_subjects_statistics', slow_statistics)
+        timed_out = admission_limiters['statistics'].timed_out
+
+        response = await async_client.get("/api/subjects/statistics", params={"percentiles": False})
+        assert response.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+        assert admission_limiters['statistics'].timed_out == timed_out + 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_cancel_on_disconnect():
+        async def receive():
+            await asyncio.sleep(0.05)
+            return {'type': 'http.disconnect'}
+
+        request = Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': []}, receive)
+        dependency = admit('get')(request)
+        client_gone = admission_limiters['get'].client_gone
+
+        await anext(dependency)
+        with pytest.raises(asyncio.CancelledError) as cancelled:
+            await asyncio.sleep(5)
+        # Так FastAPI возвращает исключение эндпоинта в зависимость
+        with pytest.raises(HTTPException) as exc:
+            await dependency.athrow(cancelled.value)
+        assert exc.value.status_code == 499
+        assert admission_limiters['get'].client_gone == client_gone + 1
+        assert admission_limiters['get'].in_flight == 0
+
+        # Запись доводится до конца и после отключения клиента
+        request = Request({'type': 'http', 'method': 'POST', 'path': '/', 'headers': []}, receive)
+        dependency = admit('write', cancellable=False)(request)
+        await anext(dependency)
+        await asyncio.sleep(0.1)
+        with pytest.raises(StopAsyncIteration):
+            await anext(dependency)
@@ -0,0 +1,98 @@
+from fastapi import status
+import pytest
+
+from src.service.redis_conn import redis_client
+from src.utils.compression import choose_encoding
+
+
+class TestCompression:
+
+    @staticmethod
+    @pytest.mark.parametrize(
+        "header, expected",
+        [
+            (None, None),
+            ("identity", None),
+            ("gzip", "gzip"),
+            ("gzip;q=0, deflate", None),
+            ("deflate, gzip;q=0.5", "gzip"),
+            ("*", choose_encoding("zstd, br, gzip")),
+        ]
+    )
+    def test_choose_encoding(header, expected):
+        assert choose_encoding(header) == expected
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_list_compressed(async_client, generated_subjects):
+        response = await async_client.get("/api/subjects", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert len(response.json()) == generated_subjects.rows
+
+        response = await async_client.get("/api/subjects", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert len(response.json()) == generated_subjects.rows
+
+        # Маленькие ответы не сжимаются
+        response = await async_client.get("/health/live", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_cache_hit_precompressed(async_client, generated_subjects, monkeypatch):
+        fakeredis = pytest.importorskip("fakeredis")
+        monkeypatch.setattr(redis_client, "redis", fakeredis.FakeAsyncRedis())
+
+        params = {"is_active": True}
+        miss = await async_client.get("/api/subjects", params=params, headers={"Accept-Encoding": "gzip"})
+        assert miss.headers["X-Cache"] == "MISS"
+
+        keys = [key.decode() async for key in redis_client.redis.scan_iter("subject:*")]
+        assert any(key.endswith("|gzip") for key in keys)
+
+        hit = await async_client.get("/api/subjects", params=params, headers={"Accept-Encoding": "gzip"})
+        assert hit.headers["X-Cache"] == "HIT"
+        assert hit.headers["Content-Encoding"] == "gzip"
+        assert hit.json() == miss.json()
+
+        plain = await async_client.get("/api/subjects", params=params, headers={"Accept-Encoding": "identity"})
+        assert plain.headers["X-Cache"] == "HIT"
+        assert "Content-Encoding" not in plain.headers
+        assert plain.json() == hit.json()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_etag_not_modified(async_client, test_subjects_for_get, monkeypatch):
+        fakeredis = pytest.importorskip("fakeredis")
+        monkeypatch.setattr(redis_client, "redis", fakeredis.FakeAsyncRedis())
+
+        first = await async_client.get("/api/subjects")
+        etag = first.headers["ETag"]
+        assert "must-revalidate" in first.headers["Cache-Control"]
+
+        again = await async_client.get("/api/subjects", headers={"If-None-Match": etag})
+        assert again.status_code == status.HTTP_304_NOT_MODIFIED
+        assert again.content == b""
+        assert again.headers["ETag"] == etag
+
+        other = await async_client.get("/api/subjects", params={"is_active": True}, headers={"If-None-Match": etag})
+        assert other.status_code == status.HTTP_200_OK
+
+        stat = await async_client.get("/api/subjects/statistics", params={"percentiles": False},
+                                      headers={"Accept-Encoding": "gzip"})
+        assert stat.headers["ETag"].startswith("W/")
+        # Маленький ответ не сжат, и ETag описывает то, что отдано, а не то, что принимает клиент
+        assert "Content-Encoding" not in stat.headers
+        assert stat.headers["ETag"].endswith('-identity"')
+        again = await async_client.get("/api/subjects/statistics", params={"percentiles": False},
+                                       headers={"If-None-Match": stat.headers["ETag"]})
+        assert again.status_code == status.HTTP_304_NOT_MODIFIED
+
+        # Запись меняет версию данных, старый ETag больше не совпадает
+        created = await async_client.post("/api/subjects", json={"length": 1, "weight": 1})
+        assert created.status_code == status.HTTP_201_CREATED
+        after = await async_client.get("/api/subjects", headers={"If-None-Match": etag})
+        assert after.status_code == status.HTTP_200_OK
+        assert after.headers["ETag"] != etag
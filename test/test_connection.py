@@ -0,0 +1,103 @@
+import time
+
+from fastapi import Request, status
+import pytest
+from sqlalchemy import text
+
+from src.api.routers.v1.subjects import REPLICA_CATCH_UP_S, get_read_version
+from src.db.connection import READ_PRIMARY_COOKIE, LazySession, must_read_primary
+from src.db.replicas import ReplicaRouter
+from src.service.redisManager import DATA_WRITTEN_AT_KEY, redis_manager
+from src.service.redis_conn import redis_client
+from test.conftest import TestingAsyncSessionLocal, test_engine
+
+
+class TestConnection:
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_pick_without_replicas():
+        router = ReplicaRouter(primary=test_engine, replicas=[], max_lag=5, check_interval=1)
+        assert router.pick() is test_engine
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_pick_fresh_replica():
+        # Основная бд тоже проходит проверку отставания, у неё оно нулевое
+        primary = object()
+        router = ReplicaRouter(primary=primary, replicas=[test_engine], max_lag=5, check_interval=60)
+        # Пока реплика не проверена, читаем с основной, проверка уходит в фон
+        assert router.pick() is primary
+        await router.replicas[0]._refresh_task
+        assert router.pick() is test_engine
+        assert router.status()[0]['lag_s'] == 0
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_lagging_replica_falls_back_to_primary():
+        primary = object()
+        router = ReplicaRouter(primary=primary, replicas=[test_engine], max_lag=5, check_interval=60)
+        router.replicas[0].lag = 10
+        router.replicas[0].checked_at = float('inf')
+        assert router.pick() is primary
+        router.replicas[0].lag = None
+        assert router.pick() is primary
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_write_sets_read_primary_cookie(async_client, test_subject):
+        response = await async_client.post("/api/subjects", json={"length": 1, "weight": 1})
+        assert response.status_code == status.HTTP_201_CREATED
+        assert READ_PRIMARY_COOKIE in response.cookies
+
+        response = await async_client.delete(f"/api/subjects/{test_subject}")
+        assert response.status_code == status.HTTP_200_OK
+        assert READ_PRIMARY_COOKIE in response.cookies
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_cache_after_write(async_client, test_subjects_for_get, monkeypatch):
+        fakeredis = pytest.importorskip("fakeredis")
+        monkeypatch.setattr(redis_client, "redis", fakeredis.FakeAsyncRedis())
+
+        assert (await async_client.get("/api/subjects")).headers["X-Cache"] == "MISS"
+        assert (await async_client.get("/api/subjects")).headers["X-Cache"] == "HIT"
+
+        # Ответ, собранный до записи, не отдаётся, даже если его не стёрли
+        await redis_manager.bump_data_version('test')
+        assert (await async_client.get("/api/subjects")).headers["X-Cache"] == "MISS"
+        assert (await async_client.get("/api/subjects")).headers["X-Cache"] == "HIT"
+
+        # Писавший клиент читает мимо общего кеша
+        async_client.cookies.set(READ_PRIMARY_COOKIE, str(time.time() + 60))
+        assert (await async_client.get("/api/subjects")).headers["X-Cache"] == "MISS"
+        async_client.cookies.clear()
+
+        # Сразу после записи чтения идут с основной бд, потом снова с реплик
+        request = Request({'type': 'http', 'headers': []})
+        await get_read_version(request, 'test')
+        assert must_read_primary(request)
+
+        await redis_client.redis.set(DATA_WRITTEN_AT_KEY, time.time() - REPLICA_CATCH_UP_S - 1)
+        request = Request({'type': 'http', 'headers': []})
+        await get_read_version(request, 'test')
+        assert not must_read_primary(request)
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_lazy_session():
+        created = []
+
+        def factory():
+            created.append(TestingAsyncSessionLocal(bind=test_engine))
+            return created[-1]
+
+        session = LazySession(factory)
+        assert not session.started
+        await session.close()
+        assert created == []
+
+        assert (await session.execute(text('SELECT 1'))).scalar() == 1
+        assert session.started
+        assert len(created) == 1
+        await session.close()
@@ -0,0 +1,54 @@
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.events import EventBroker, format_sse, notify
+from src.utils.filters_db import match_filters
+from test.conftest import get_test_database_url, test_engine
+
+ROW = {'id': 7, 'length': 20.0, 'weight': 50.0, 'is_active': True,
+       'create_at': '2026-12-07T10:00:00', 'delete_at': None}
+
+
+class TestEvents:
+
+    @staticmethod
+    def test_match_filters():
+        assert match_filters(ROW, {})
+        assert match_filters(ROW, {'weight_min': 50, 'weight_max': 60, 'is_active': True, 'id_min': None})
+        assert match_filters(ROW, {'created_after': date(2026, 12, 7), 'created_before': date(2026, 12, 8)})
+        assert not match_filters(ROW, {'weight_min': 51})
+        assert not match_filters(ROW, {'is_active': False})
+        # created_before сравнивается с началом дня, как в запросе к бд
+        assert not match_filters(ROW, {'created_before': date(2026, 12, 7)})
+        assert not match_filters(ROW, {'deleted_after': date(2026, 1, 1)})
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_broker():
+        dsn = get_test_database_url().replace('postgresql+asyncpg://', 'postgresql://')
+        broker = EventBroker(dsn, 'subjects_events_test')
+        heavy = await broker.subscribe({'weight_min': 40})
+        light = await broker.subscribe({'weight_max': 10})
+        try:
+            async with AsyncSession(test_engine) as session:
+                await notify(session, broker.channel, 'create', [ROW, {**ROW, 'id': 8, 'weight': 5.0}])
+                await session.commit()
+
+            message = await asyncio.wait_for(heavy.queue.get(), 5)
+            assert message['event'] == 'create'
+            assert message['data']['id'] == 7
+            assert format_sse(message).startswith(f'id: {message["id"]}\nevent: create\ndata: {{'.encode())
+
+            message = await asyncio.wait_for(light.queue.get(), 5)
+            assert message['data']['id'] == 8
+            assert heavy.queue.empty()
+            assert broker.stats()['received'] == 2
+
+            broker.unsubscribe(light)
+            assert broker.stats()['subscribers'] == 1
+        finally:
+            await broker.close()
+        assert not broker.listening
@@ -0,0 +1,42 @@
+from fastapi import status
+import pytest
+
+from src.service.health import health_checker
+from test.conftest import test_engine
+
+
+class TestHealth:
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_live(async_client):
+        response = await async_client.get("/health/live")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["status"] == "ok"
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_ready(async_client, monkeypatch):
+        monkeypatch.setattr(health_checker, 'engine', test_engine)
+        monkeypatch.setattr(health_checker, '_result', None)
+
+        response = await async_client.get("/health/ready")
+        result = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        # В тестах редис не подключён, сервис готов, но без кеша
+        assert result["status"] == "degraded"
+        assert result["checks"]["database"] == "ok"
+
+        response = await async_client.get("/health/ready")
+        assert response.json()["checked_at"] == result["checked_at"]
+
+        monkeypatch.setattr(health_checker, '_result', None)
+        monkeypatch.setattr(health_checker, '_check_database', lambda: _fail())
+        response = await async_client.get("/health/ready")
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.json()["status"] == "fail"
+        monkeypatch.setattr(health_checker, '_result', None)
+
+
+async def _fail():
+    raise ConnectionError('database down')
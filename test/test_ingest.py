@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError, field_validator
+from sqlalchemy import func, select
+
+from src.db.ingest import IngestQueue
+from src.models import SubjectsORM
+from src.schemes import subjects
+from test.conftest import TestingAsyncSessionLocal
+
+
+class TestIngest:
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_batches(db_connection):
+        queue = IngestQueue(lambda: TestingAsyncSessionLocal(bind=db_connection), SubjectsORM,
+                            subjects.ReadSubjects, batch_size=4, flush_ms=50)
+        queue.start()
+        try:
+            results = await asyncio.gather(*(
+                queue.submit(subjects.CreateSubjects(length=i + 1, weight=100 + i)) for i in range(10)
+            ))
+        finally:
+            await queue.stop()
+
+        assert [result.weight for result in results] == [100 + i for i in range(10)]
+        assert len({result.id for result in results}) == 10
+        assert all(result.is_active for result in results)
+
+        stats = queue.stats()
+        assert stats['items'] == 10
+        assert stats['batches'] == 3
+        assert stats['max_batch'] == 4
+        assert not stats['running']
+
+        count = await db_connection.scalar(select(func.count(SubjectsORM.id)))
+        assert count == 10
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_batch_error(db_connection):
+        queue = IngestQueue(lambda: TestingAsyncSessionLocal(bind=db_connection), SubjectsORM,
+                            subjects.ReadSubjects, batch_size=10, flush_ms=50)
+
+        with pytest.raises(RuntimeError):
+            await queue.submit(subjects.CreateSubjects(length=1, weight=1))
+
+        queue.start()
+        try:
+            bad = subjects.CreateSubjects.model_construct(length=None, weight=1)
+            results = await asyncio.gather(
+                queue.submit(subjects.CreateSubjects(length=1, weight=1)),
+                queue.submit(bad),
+                return_exceptions=True,
+            )
+        finally:
+            await queue.stop()
+
+        assert all(isinstance(result, Exception) for result in results)
+        assert queue.stats()['failed_batches'] == 1
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_worker_survives_errors(db_connection, monkeypatch):
+        class BrokenRead(subjects.ReadSubjects):
+            @field_validator('weight')
+            @classmethod
+            def broken(cls, value):
+                raise ValueError('broken')
+
+        queue = IngestQueue(lambda: TestingAsyncSessionLocal(bind=db_connection), SubjectsORM,
+                            BrokenRead, batch_size=10, flush_ms=10)
+        queue.start()
+        try:
+            # Ошибка сборки ответа после commit приходит запросу, а не убивает задачу
+            with pytest.raises(ValidationError):
+                await asyncio.wait_for(queue.submit(subjects.CreateSubjects(length=1, weight=1)), 5)
+            assert queue.running
+
+            async def crash(batch):
+                raise RuntimeError('crash')
+
+            monkeypatch.setattr(queue, '_flush', crash)
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(queue.submit(subjects.CreateSubjects(length=1, weight=1)), 5)
+            assert queue.running
+        finally:
+            await queue.stop()
@@ -0,0 +1,110 @@
+from fastapi import status
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+
+from src.config import settings
+from src.db.pool_stats import PoolStats
+from src.db.statement_stats import StatementStats
+from src.db.query_log import slow_query_log
+from src.models import SubjectsORM
+from src.utils.filters_db import FILTER_FIELDS, filter_params, filter_template
+from test.conftest import test_engine
+
+
+class TestInternal:
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_slow_queries(async_client, test_subjects_for_get, monkeypatch):
+        monkeypatch.setattr(slow_query_log, 'threshold_ms', 0)
+        monkeypatch.setattr(slow_query_log, 'explain_sample_rate', 1)
+        slow_query_log.clear()
+
+        response = await async_client.get("/api/subjects", params={"weight_min": 12})
+        assert response.status_code == status.HTTP_200_OK
+
+        response = await async_client.get("/api/internal/slow-queries")
+        assert response.status_code == status.HTTP_200_OK
+        entries = response.json()
+        select_entries = [entry for entry in entries if entry['statement'].lstrip().startswith('SELECT')]
+        assert select_entries
+        assert select_entries[0]['plan'] is not None
+        assert 'Seq Scan' in select_entries[0]['plan'] or 'Index' in select_entries[0]['plan']
+        # Шаблон фильтров один на все наборы: все параметры передаются, незаданные - NULL
+        assert select_entries[0]['parameters'].count('int') == 1
+        assert set(select_entries[0]['parameters']) == {'int', 'NoneType'}
+
+        response = await async_client.delete("/api/internal/slow-queries")
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        slow_query_log.clear()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_explain_rolls_back_writes(db_session, monkeypatch):
+        monkeypatch.setattr(slow_query_log, 'threshold_ms', 0)
+        monkeypatch.setattr(slow_query_log, 'explain_sample_rate', 1)
+        slow_query_log.clear()
+
+        # EXPLAIN ANALYZE повторяет вставку из CTE, повтор должен откатиться
+        await db_session.execute(text(
+            'WITH inserted AS (INSERT INTO subjects (weight, length, is_active) VALUES (1, 1, true) RETURNING id) '
+            'SELECT id FROM inserted'
+        ))
+        assert any(entry['plan'] for entry in slow_query_log.get_entries())
+        count = await db_session.execute(select(func.count()).select_from(SubjectsORM))
+        assert count.scalar_one() == 1
+        slow_query_log.clear()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_pool_stats(async_client, test_subjects_for_get):
+        stats = PoolStats(test_engine.sync_engine)
+        try:
+            response = await async_client.get("/api/subjects")
+            assert response.status_code == status.HTTP_200_OK
+            async with test_engine.connect():
+                pass
+
+            snapshot = stats.snapshot()
+            assert snapshot['checkouts'] >= 1
+            assert snapshot['peak_checked_out'] >= 1
+            assert snapshot['hold_time_ms']['p50'] is not None
+
+            response = await async_client.get("/api/internal/pool")
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json()[0]['pool_size'] == settings.DB_POOL_SIZE_PER_WORKER
+        finally:
+            stats.detach()
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_statement_stats(async_client, test_subjects_for_get):
+        stats = StatementStats(test_engine.sync_engine)
+        try:
+            for params in ({"weight_min": 12}, {"is_active": True}, {"length_max": 50, "created_after": "2020-01-01"},
+                           {"is_active": False, "weight_max": 20}):
+                response = await async_client.get("/api/subjects", params=params)
+                assert response.status_code == status.HTTP_200_OK
+
+            snapshot = stats.snapshot()
+            # Неиндексированные фильтры - параметрами в одном тексте, индексированные меняют форму запроса
+            assert snapshot['distinct_compiled_statements'] == 2
+            assert snapshot['compiled_cache']['hit'] >= 2
+            assert snapshot['prepared_statements']['hit'] >= 2
+
+            response = await async_client.get("/api/internal/statements")
+            assert response.status_code == status.HTTP_200_OK
+            assert 'hit_rate' in response.json()[0]['compiled_cache']
+        finally:
+            stats.detach()
+
+    @staticmethod
+    def test_filter_template_keeps_index_predicates():
+        sql = str(filter_template(SubjectsORM, id_min=1, id_max=10, weight_min=5).compile(
+            dialect=postgresql.dialect()))
+        assert 'subjects.id >= %(filter_id_min)s AND subjects.id <= %(filter_id_max)s' in sql
+        assert 'is_active' not in sql
+        assert '%(filter_weight_min)s IS NULL' in sql
+        assert set(filter_params(id_min=1, id_max=10)) == {f'filter_{field}' for field in FILTER_FIELDS
+                                                            if field != 'is_active'}
@@ -0,0 +1,49 @@
+import json
+import logging
+import sys
+from queue import SimpleQueue
+
+from src.logger import DeferredQueueHandler, JsonFormatter
+
+
+class TestLogger:
+
+    @staticmethod
+    def test_traceback_formatted_by_listener():
+        queue = SimpleQueue()
+        handler = DeferredQueueHandler(queue)
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            record = logging.getLogger('test').makeRecord('test', logging.ERROR, __file__, 1, 'ошибка %s', (1,),
+                                                           sys.exc_info())
+        handler.emit(record)
+
+        queued = queue.get_nowait()
+        # До потока слушателя ничего не отформатировано
+        assert queued.exc_info is not None
+        assert queued.args == (1,)
+
+        data = json.loads(JsonFormatter().format(queued))
+        assert data['message'] == 'ошибка 1'
+        assert 'ZeroDivisionError' in data['exc_info']
+
+    @staticmethod
+    def test_objects_formatted_by_caller():
+        class Entity:
+            state = 'живой'
+
+            def __repr__(self):
+                return f'Entity({self.state})'
+
+        queue = SimpleQueue()
+        handler = DeferredQueueHandler(queue)
+        entity = Entity()
+        handler.emit(logging.getLogger('test').makeRecord('test', logging.INFO, __file__, 1, 'создан %r, id=%s',
+                                                          (entity, 1), None))
+        # Состояние объекта меняется раньше, чем запись дойдёт до потока слушателя
+        entity.state = 'истёк'
+
+        queued = queue.get_nowait()
+        assert queued.args is None
+        assert queued.getMessage() == 'создан Entity(живой), id=1'
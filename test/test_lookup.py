@@ -0,0 +1,50 @@
+import asyncio
+
+from fastapi import status
+import pytest
+from sqlalchemy import select
+
+from src.db.lookup import GetCoalescer
+from src.db.subjectsManager import subjects_manager
+from src.models import SubjectsORM
+from test.conftest import TestingAsyncSessionLocal
+
+
+class TestLookup:
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_lookup_endpoint(async_client, test_subjects_for_get):
+        response = await async_client.get("/api/subjects")
+        ids = [item["id"] for item in response.json()]
+        missing = max(ids) + 1000
+
+        requested = [ids[2], missing, ids[0], ids[2]]
+        response = await async_client.post("/api/subjects/lookup", json={"ids": requested})
+        result = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert [item["id"] for item in result["items"]] == [ids[2], ids[0], ids[2]]
+        assert result["missing"] == [missing]
+
+        for bad in ([], [2 ** 63], [ids[0], 2147483648], [0]):
+            response = await async_client.post("/api/subjects/lookup", json={"ids": bad})
+            assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY, bad
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_coalescer(db_connection, test_subjects_for_get):
+        ids = list(await db_connection.scalars(select(SubjectsORM.id).order_by(SubjectsORM.id)))
+        coalescer = GetCoalescer(lambda primary: TestingAsyncSessionLocal(bind=db_connection), subjects_manager,
+                                 window_ms=100, batch_size=3)
+
+        requested = [ids[0], ids[1], ids[0], ids[-1] + 1, ids[2], ids[3]]
+        results = await asyncio.gather(*(coalescer.load(entity_id) for entity_id in requested))
+
+        assert [result.id if result else None for result in results] == [
+            ids[0], ids[1], ids[0], None, ids[2], ids[3]]
+        stats = coalescer.stats()
+        assert stats['requests'] == 6
+        # Первые три разных id закрывают пачку сразу, остальные уходят по окну
+        assert stats['batches'] == 2
+        assert stats['ids'] == 5
+        assert stats['max_batch'] == 3
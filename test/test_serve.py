@@ -0,0 +1,47 @@
+from src import config
+from src.config import settings
+from src.serve import build_options
+
+
+class TestServe:
+
+    @staticmethod
+    def test_workers_auto(monkeypatch):
+        monkeypatch.setattr(settings, 'WEB_WORKERS', 0)
+        monkeypatch.setattr(settings, 'DB_POOL_SIZE', None)
+        options = build_options()
+        assert options['workers'] == settings.WEB_WORKERS_COUNT >= 1
+        assert options['worker_class'] == 'src.serve.ServerWorker'
+
+    @staticmethod
+    def test_pool_per_worker(monkeypatch):
+        monkeypatch.setattr(settings, 'DB_POOL_SIZE', None)
+        monkeypatch.setattr(settings, 'WEB_WORKERS', 4)
+        per_four = settings.DB_POOL_SIZE_PER_WORKER
+        monkeypatch.setattr(settings, 'WEB_WORKERS', 1)
+        assert settings.DB_POOL_SIZE_PER_WORKER > per_four
+        # Все воркеры вместе не выходят за бюджет соединений
+        assert 4 * (per_four + settings.DB_MAX_OVERFLOW) <= settings.DB_MAX_CONNECTIONS
+
+    @staticmethod
+    def test_many_cpus_fit_budget(monkeypatch):
+        monkeypatch.setattr(settings, 'DB_POOL_SIZE', None)
+        monkeypatch.setattr(settings, 'WEB_WORKERS', 0)
+        monkeypatch.setattr(config, 'available_cpus', lambda: 32)
+        workers = settings.WEB_WORKERS_COUNT
+        assert 1 <= workers < 32
+        # Пул, overflow и LISTEN каждого воркера
+        per_worker = settings.DB_POOL_SIZE_PER_WORKER + settings.DB_MAX_OVERFLOW_PER_WORKER + 1
+        assert settings.DB_POOL_SIZE_PER_WORKER >= 4
+        assert workers * per_worker <= settings.DB_MAX_CONNECTIONS
+
+        monkeypatch.setattr(settings, 'WEB_WORKERS', 32)
+        per_worker = settings.DB_POOL_SIZE_PER_WORKER + settings.DB_MAX_OVERFLOW_PER_WORKER + 1
+        assert 32 * per_worker <= settings.DB_MAX_CONNECTIONS
+
+    @staticmethod
+    def test_overrides():
+        options = build_options(workers=3, bind='127.0.0.1:9000', preload=False)
+        assert options['workers'] == 3
+        assert options['bind'] == '127.0.0.1:9000'
+        assert options['preload_app'] is False
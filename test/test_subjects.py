@@ -1,7 +1,13 @@
 import logging
+from datetime import timedelta
 
 from fastapi import status
 import pytest
+from sqlalchemy import text
+
+from bench.datagen import generate_records
+from src.config import settings
+from src.service.redisManager import redis_manager
 
 
 class TestSubjects:
@@ -127,3 +133,215 @@ class TestSubjects:
         assert result.get("min_weight") == 11
         assert result.get("total_weight") == 60
         assert result.get("total_count") == 5
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_stat_generated(async_client, generated_subjects):
+        records = [record for batch in generate_records(generated_subjects) for record in batch]
+        deleted = [record for record in records if record[5] is not None]
+
+        response = await async_client.get("/api/subjects/statistics",
+                                          params={"start_date": "2026-11-01", "end_date": "2026-12-31"})
+        result = response.json()
+        assert response.status_code == status.HTTP_200_OK
+
+        assert result.get("added_count") == generated_subjects.rows
+        assert result.get("deleted_count") == len(deleted)
+        assert result.get("total_count") == generated_subjects.rows
+        assert result.get("max_weight") == max(record[1] for record in records)
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_inventory(async_client, test_subjects_for_get):
+        response = await async_client.get("/api/subjects/inventory", params={"days": 90})
+        result = response.json()
+        assert response.status_code == status.HTTP_200_OK
+
+        assert result.get("source") == "db"
+        assert result.get("active_count") == 2
+        assert result.get("total_weight") == 24
+        assert result["days"]["2026-12-01"] == {"added": 2, "deleted": 0}
+        assert result["days"]["2026-12-07"] == {"added": 1, "deleted": 0}
+        assert sum(counts["deleted"] for counts in result["days"].values()) == 0
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_stat_percentiles(async_client, generated_subjects):
+        params = {"start_date": "2026-12-01", "end_date": "2026-12-31"}
+        response = await async_client.get("/api/subjects/statistics", params=params)
+        assert "percentiles" not in response.json()
+
+        params["percentiles"] = True
+        response = await async_client.get("/api/subjects/statistics", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        sketch = response.json()["percentiles"]
+        assert sketch["population"]["time_in_storage_s"] == "deleted_in_period"
+
+        response = await async_client.get("/api/subjects/statistics", params={**params, "exact": True})
+        assert response.status_code == status.HTTP_200_OK
+        exact = response.json()["percentiles"]
+
+        assert sketch["mode"] == "sketch"
+        assert exact["mode"] == "exact"
+        for metric in ("weight", "length", "time_in_storage_s"):
+            assert sketch[metric]["count"] == exact[metric]["count"] > 0
+            for p in ("p50", "p90", "p99"):
+                assert sketch[metric][p] == pytest.approx(exact[metric][p], rel=0.03)
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_stat_percentiles_cache_settled_days(async_client, db_session, monkeypatch):
+        monkeypatch.setitem(settings.DB_STATEMENT_TIMEOUTS_MS, 'write', 1)
+        monkeypatch.setattr(settings, 'DB_REPLICA_MAX_LAG_S', 2 * 24 * 3600)
+        today = (await db_session.scalar(text('SELECT localtimestamp'))).date()
+        cached = {}
+
+        async def set_many(prefix, payloads, request_id, ttl_s=None):
+            cached.update(payloads)
+
+        monkeypatch.setattr(redis_manager, 'set_many', set_many)
+        response = await async_client.get("/api/subjects/statistics", params={
+            "start_date": (today - timedelta(days=3)).isoformat(), "end_date": today.isoformat(),
+            "percentiles": True})
+        assert response.status_code == status.HTTP_200_OK
+        # Из четырёх дней только первый закрылся раньше запаса по часам бд
+        assert list(cached) == [f"{settings.STATS_SKETCH_ALPHA}:{today - timedelta(days=3)}"]
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_histogram(async_client, generated_subjects):
+        records = [record for batch in generate_records(generated_subjects) for record in batch]
+        weights = [record[1] for record in records]
+
+        response = await async_client.get("/api/subjects/histogram", params={"buckets": 10})
+        result = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["X-Cache"] == "MISS"
+        assert len(result["buckets"]) == 10
+        assert result["total_count"] == len(weights)
+        assert result["buckets"][0]["lower"] == pytest.approx(min(weights))
+        assert result["buckets"][-1]["upper"] == pytest.approx(max(weights))
+        assert result["overflow"]["count"] == result["underflow"]["count"] == 0
+
+        params = {"scale": "edges", "edges": "10,50,100", "field": "weight", "is_active": True}
+        response = await async_client.get("/api/subjects/histogram", params=params)
+        result = response.json()
+        active = [record[1] for record in records if record[2]]
+        assert [bucket["count"] for bucket in result["buckets"]] == [
+            sum(1 for w in active if 10 <= w < 50), sum(1 for w in active if 50 <= w < 100)]
+        assert result["underflow"]["count"] == sum(1 for w in active if w < 10)
+        assert result["overflow"]["count"] == sum(1 for w in active if w >= 100)
+        assert result["overflow"]["sum"] == pytest.approx(sum(w for w in active if w >= 100), abs=0.01)
+
+        response = await async_client.get("/api/subjects/histogram",
+                                          params={"scale": "log", "buckets": 4, "field": "length"})
+        result = response.json()
+        assert sum(bucket["count"] for bucket in result["buckets"]) == len(records)
+        widths = [bucket["upper"] / bucket["lower"] for bucket in result["buckets"]]
+        assert widths == pytest.approx([widths[0]] * 4)
+
+        response = await async_client.get("/api/subjects/histogram", params={"scale": "edges", "edges": "5,1"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_histogram_bounds(async_client, test_subjects_for_get):
+        for params in ({"scale": "edges", "edges": "1,nan,10"}, {"scale": "edges", "edges": "1,10,inf"},
+                       {"range_min": "nan"}, {"range_max": "inf"}, {"range_min": "-inf", "range_max": 10}):
+            response = await async_client.get("/api/subjects/histogram", params=params)
+            assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY, params
+
+        # Все данные (веса 11..13) по другую сторону единственной заданной границы - за диапазоном
+        response = await async_client.get("/api/subjects/histogram", params={"buckets": 4, "range_min": 1000})
+        result = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert result["underflow"] == {"count": 5, "sum": 60.0}
+        assert result["overflow"]["count"] == 0
+        assert [(bucket["lower"], bucket["upper"], bucket["count"]) for bucket in result["buckets"]] == [
+            (1000, 1000, 0)]
+
+        response = await async_client.get("/api/subjects/histogram", params={"buckets": 4, "range_max": 5})
+        result = response.json()
+        assert result["overflow"] == {"count": 5, "sum": 60.0}
+        assert result["underflow"]["count"] == 0
+        assert sum(bucket["count"] for bucket in result["buckets"]) == 0
+
+        # Граница внутри данных: недостающая берётся из данных как раньше
+        response = await async_client.get("/api/subjects/histogram", params={"buckets": 2, "range_min": 12})
+        result = response.json()
+        assert result["underflow"]["count"] == 1
+        assert [bucket["count"] for bucket in result["buckets"]] == [3, 1]
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_timeseries(async_client, generated_subjects):
+        records = [record for batch in generate_records(generated_subjects) for record in batch]
+
+        response = await async_client.get("/api/subjects/timeseries",
+                                          params={"bucket": "week", "start_date": "2026-11-01",
+                                                  "end_date": "2026-12-31T23:59:59"})
+        result = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert result["start"] == "2026-10-26T00:00:00"
+        points = result["points"]
+        assert len(points) == 10
+        assert sum(point["added"] for point in points) == generated_subjects.rows
+        assert sum(point["deleted"] for point in points) == sum(1 for record in records if record[5] is not None)
+
+        last = points[-1]
+        active = [record for record in records if record[5] is None or record[5].isoformat() >= result["end"]]
+        assert last["active_count"] == len(active)
+        assert last["total_weight"] == pytest.approx(sum(record[1] for record in active), abs=0.1)
+        for previous, point in zip(points, points[1:]):
+            assert point["active_count"] == previous["active_count"] + point["added"] - point["deleted"]
+
+        response = await async_client.get("/api/subjects/timeseries",
+                                          params={"bucket": "hour", "start_date": "2026-01-01",
+                                                  "end_date": "2026-12-31"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_timeseries_caches_settled_buckets(async_client, db_session, monkeypatch):
+        monkeypatch.setitem(settings.DB_STATEMENT_TIMEOUTS_MS, 'write', 1)
+        monkeypatch.setattr(settings, 'DB_REPLICA_MAX_LAG_S', 2 * 3600)
+        db_now = await db_session.scalar(text('SELECT localtimestamp'))
+        params = {"bucket": "hour", "start_date": (db_now - timedelta(hours=4)).isoformat(),
+                  "end_date": db_now.isoformat()}
+
+        cached = {}
+
+        async def set_many(prefix, payloads, request_id, ttl_s=None):
+            cached.update(payloads)
+
+        monkeypatch.setattr(redis_manager, 'set_many', set_many)
+        response = await async_client.get("/api/subjects/timeseries", params=params)
+        assert len(response.json()["points"]) == 5
+        # Корзины, закрытые меньше чем запас назад, ещё могут получить строки и не кешируются
+        assert len(cached) == 2
+
+    @staticmethod
+    @pytest.mark.asyncio
+    async def test_count(async_client, generated_subjects, monkeypatch):
+        records = [record for batch in generate_records(generated_subjects) for record in batch]
+        params = {"is_active": True, "weight_min": 20}
+        expected = sum(1 for record in records if record[2] and record[1] >= 20)
+
+        response = await async_client.get("/api/subjects/count", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"count": expected, "exact": True}
+
+        response = await async_client.get("/api/subjects", params={**params, "total_count": True})
+        assert response.headers["X-Total-Count"] == str(expected)
+        assert len(response.json()) == expected
+
+        # Оценка меньше порога - считается точно
+        monkeypatch.setattr(settings, "COUNT_ESTIMATE_MIN_ROWS", 10 ** 9)
+        response = await async_client.get("/api/subjects/count", params={"estimate": True})
+        assert response.json() == {"count": generated_subjects.rows, "exact": True}
+
+        monkeypatch.setattr(settings, "COUNT_ESTIMATE_MIN_ROWS", 1)
+        response = await async_client.get("/api/subjects/count", params={"estimate": True, **params})
+        result = response.json()
+        assert result["exact"] is False
+        assert result["count"] > 0